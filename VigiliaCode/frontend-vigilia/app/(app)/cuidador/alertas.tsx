@@ -832,7 +832,7 @@ function CaidasAdultoMayorCard({ data, onToggle, isExpanded, onCaidaPress }: {
             const fecha = new Date(caida.timestamp_alerta);
             const formattedDate = fecha.toLocaleDateString('es-ES', { day: '2-digit', month: 'short' });
             const formattedTime = fecha.toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit' });
-            const hasSnapshot = caida.detalles_adicionales?.snapshot_url ? true : false;
+            const hasSnapshot = caida.detalles_adicionales?.snapshot_url || caida.detalles_adicionales?.snapshot_variantes ? true : false;
             const confirmada = caida.confirmado_por_cuidador;
             const noLeido = !caida.vista;
 
@@ -1053,7 +1053,7 @@ export default function AlertasScreen() {
   const convertirEventosACaidas = (eventos: EventoCaida[]): Alerta[] => {
     return eventos.map(evento => {
       // Verificar si tiene snapshot en detalles_adicionales
-      const hasSnapshot = evento.detalles_adicionales?.snapshot_url ? true : false;
+      const hasSnapshot = evento.detalles_adicionales?.snapshot_url || evento.detalles_adicionales?.snapshot_variantes ? true : false;
 
       return {
         id: `caida-${evento.id}`,
@@ -1352,7 +1352,9 @@ export default function AlertasScreen() {
       const token = await user.getIdToken();
 
       // Descargar la imagen como blob usando axios con Authorization header
+      // Variante mediana generada en el edge: suficiente para la pantalla del celular
       const response = await axios.get(`${API_URL}/alertas/${alertaId}/snapshot`, {
+        params: { variante: 'medium' },
         headers: { Authorization: `Bearer ${token}` },
         responseType: 'blob'
       });
@@ -1570,7 +1572,7 @@ export default function AlertasScreen() {
                       // Marcar como visto en backend
                       await marcarComoVisto(caida.id, undefined);
 
-                      const hasSnapshot = caida.detalles_adicionales?.snapshot_url ? true : false;
+                      const hasSnapshot = caida.detalles_adicionales?.snapshot_url || caida.detalles_adicionales?.snapshot_variantes ? true : false;
                       if (hasSnapshot) {
                         handleViewSnapshot(caida.id);
                       } else {
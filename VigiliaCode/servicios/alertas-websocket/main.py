@@ -7,8 +7,12 @@ from sqlalchemy import create_engine, text, engine as sqlalchemy_engine
 import firebase_admin
 from firebase_admin import credentials, auth
 from firebase_admin.exceptions import FirebaseError
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
 
 # --- Configuración de Firebase ---
 try:
@@ -165,6 +169,217 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+# --- Verificación de tokens de Firebase con cache ---
+# Copia idéntica en api-backend/main.py y alertas-websocket/main.py: cada servicio se despliega
+# desde su propio directorio (`gcloud run deploy --source .`), así que no hay módulo compartido.
+# Cambiar ambas a la vez y verificar con `python servicios/check_auth_copies.py`.
+class TTLCache:
+    """
+    Cache LRU con vencimiento por entrada, segura entre threads.
+    Es local al proceso: cada instancia tiene la suya, así que un cambio hecho en otra
+    instancia se ve a más tardar al vencer el TTL.
+    """
+
+    def __init__(self, ttl_sec: float, max_entries: int):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expira_monotonic, valor)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl_sec: float | None = None):
+        ttl = self.ttl_sec if ttl_sec is None else ttl_sec
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# Copia idéntica en api-backend/main.py y alertas-websocket/main.py: cada servicio se despliega
+# desde su propio directorio (`gcloud run deploy --source .`), así que no hay módulo compartido.
+# Cambiar ambas a la vez y verificar con `python servicios/check_auth_copies.py`.
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "4096"))  # Tokens verificados en memoria
+TOKEN_CACHE_MAX_TTL_SEC = float(os.environ.get("TOKEN_CACHE_MAX_TTL_SEC", "3600"))  # Tope de vigencia en cache
+TOKEN_EXP_MARGIN_SEC = float(os.environ.get("TOKEN_EXP_MARGIN_SEC", "10"))          # Dejar de servir claims antes de `exp`
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_CERTS_REFRESH_RATIO = 0.8   # Refrescar certificados al 80% de su max-age
+FIREBASE_CERTS_RETRY_SEC = 30        # Reintento si la descarga falla
+AUTH_LATENCY_SAMPLES = 2048          # Últimas latencias para p50/p99
+
+class FirebaseTokenVerifier:
+    """
+    Verifica tokens ID de Firebase y cachea los claims por digest SHA-256 del token
+    (el token en claro no queda en memoria) hasta poco antes de su `exp`.
+
+    Un thread de fondo descarga las claves públicas de Google al arrancar y las vuelve a pedir
+    antes de que venza su max-age, dejando caliente el cache HTTP que usa firebase_admin:
+    ninguna petición espera la descarga de certificados. Si la versión instalada de
+    firebase_admin no expone ese transporte, el prefetch se desactiva y verify_id_token
+    descarga las claves por su cuenta como siempre.
+    No se consulta revocación (igual que verify_id_token sin check_revoked).
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(TOKEN_CACHE_MAX_TTL_SEC, TOKEN_CACHE_MAX_ENTRIES)
+        self.latencias_ms = {"hit": deque(maxlen=AUTH_LATENCY_SAMPLES), "miss": deque(maxlen=AUTH_LATENCY_SAMPLES)}
+        self.errores = 0
+        self.certs_refrescados = 0
+        self.certs_ultimo_refresco = None
+        self.certs_proximo_refresco = None
+        self.certs_prefetch = True
+        self._thread = None
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _cache_hit(self, key: str, t0: float) -> dict | None:
+        claims = self.cache.get(key)
+        if claims is not None and claims.get("exp", 0) - TOKEN_EXP_MARGIN_SEC > time.time():
+            self.latencias_ms["hit"].append((time.perf_counter() - t0) * 1000)
+            return claims
+        return None
+
+    def _verify_miss(self, token: str, key: str, t0: float) -> dict:
+        try:
+            claims = auth.verify_id_token(token)
+        except Exception:
+            self.errores += 1
+            raise
+        ttl = claims.get("exp", 0) - TOKEN_EXP_MARGIN_SEC - time.time()
+        if ttl > 0:
+            self.cache.set(key, claims, min(ttl, TOKEN_CACHE_MAX_TTL_SEC))
+        self.latencias_ms["miss"].append((time.perf_counter() - t0) * 1000)
+        return claims
+
+    def verify(self, token: str) -> dict:
+        """Claims del token; lanza las mismas excepciones que auth.verify_id_token"""
+        t0 = time.perf_counter()
+        key = self.token_key(token)
+        claims = self._cache_hit(key, t0)
+        return claims if claims is not None else self._verify_miss(token, key, t0)
+
+    async def verify_async(self, token: str) -> dict:
+        """
+        Como verify, para endpoints async: el hit se resuelve en el event loop y el miss
+        (firma RSA y, si hiciera falta, descarga de claves) corre en un thread.
+        """
+        t0 = time.perf_counter()
+        key = self.token_key(token)
+        claims = self._cache_hit(key, t0)
+        if claims is not None:
+            return claims
+        return await asyncio.to_thread(self._verify_miss, token, key, t0)
+
+    def _cert_request(self):
+        """
+        Transporte con cache HTTP (cachecontrol) con el que verify_id_token descarga las claves.
+        No es API pública de firebase_admin (probado con 6.5 y 7.x, rango fijado en
+        requirements.txt): retorna None si no está disponible.
+        """
+        try:
+            request = auth._get_client(firebase_admin.get_app())._token_verifier.request
+        except (AttributeError, ValueError):
+            return None
+        return request if callable(request) else None
+
+    def refresh_certs(self) -> float:
+        """Descarga las claves saltando el cache (queda cacheada la respuesta nueva); retorna su max-age"""
+        request = self._cert_request()
+        if request is None:
+            raise LookupError("firebase_admin no expone el transporte de certificados")
+        response = request(FIREBASE_CERTS_URL, method="GET", headers={"Cache-Control": "no-cache"})
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status} al descargar certificados")
+        max_age = 3600.0
+        for directive in response.headers.get("cache-control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name.lower() == "max-age" and value.isdigit():
+                max_age = float(value)
+        self.certs_refrescados += 1
+        self.certs_ultimo_refresco = datetime.now(timezone.utc)
+        return max_age
+
+    def _certs_loop(self):
+        while True:
+            try:
+                max_age = self.refresh_certs()
+                delay = max(FIREBASE_CERTS_RETRY_SEC, max_age * FIREBASE_CERTS_REFRESH_RATIO)
+                print(f"🔑 Certificados de Firebase actualizados (max-age {max_age:.0f}s, próximo refresco en {delay:.0f}s)")
+            except LookupError as e:
+                self.certs_prefetch = False
+                self.certs_proximo_refresco = None
+                print(f"🟡 Prefetch de certificados desactivado ({e}); verify_id_token los descarga bajo demanda")
+                return
+            except Exception as e:
+                delay = FIREBASE_CERTS_RETRY_SEC
+                print(f"⚠️ No se pudieron prefetchear certificados de Firebase: {e}")
+            self.certs_proximo_refresco = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            time.sleep(delay)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._certs_loop, name="firebase-certs", daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        def percentiles(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {"n": 0, "p50_ms": None, "p99_ms": None}
+            return {
+                "n": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2], 3),
+                "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+            }
+        total = self.cache.hits + self.cache.misses
+        return {
+            "cache_entradas": len(self.cache),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "hit_ratio": round(self.cache.hits / total, 4) if total else None,
+            "errores": self.errores,
+            "latencia_hit": percentiles(list(self.latencias_ms["hit"])),
+            "latencia_miss": percentiles(list(self.latencias_ms["miss"])),
+            "certs_prefetch": self.certs_prefetch,
+            "certs_refrescados": self.certs_refrescados,
+            "certs_ultimo_refresco": self.certs_ultimo_refresco.isoformat() if self.certs_ultimo_refresco else None,
+            "certs_proximo_refresco": self.certs_proximo_refresco.isoformat() if self.certs_proximo_refresco else None,
+        }
+
+token_verifier = FirebaseTokenVerifier()
+
+@app.on_event("startup")
+def start_token_verifier():
+    token_verifier.start()
+
 # --- Función de autenticación ---
 async def verify_firebase_token(authorization: str = Header(None)) -> dict:
     """Verifica el token de Firebase y retorna la información del usuario"""
@@ -177,7 +392,7 @@ async def verify_firebase_token(authorization: str = Header(None)) -> dict:
     token = authorization.split("Bearer ")[1]
 
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await token_verifier.verify_async(token)
         firebase_uid = decoded_token['uid']
 
         # Obtener información del usuario desde la BD
@@ -233,7 +448,7 @@ async def websocket_alertas(websocket: WebSocket, token: str = None):
         return
 
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await token_verifier.verify_async(token)
         firebase_uid = decoded_token['uid']
 
         # Obtener información del usuario
@@ -396,6 +611,7 @@ async def get_stats():
     return {
         "connected_users_count": len(manager.get_connected_users()),
         "connected_firebase_uids": manager.get_connected_users(),
+        "auth": token_verifier.stats(),
         "timestamp": datetime.now().isoformat()
     }
 
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark del costo de autenticación por petición: auth.verify_id_token directo (antes)
+vs FirebaseTokenVerifier con cache de claims y certificados precargados (después)
+
+Simula el patrón real: el mismo token ID de un cuidador presentado en muchas peticiones
+durante su hora de vigencia. Reporta p50/p99/max en milisegundos; el max del modo directo
+incluye la descarga de certificados de la primera verificación.
+
+Uso (con las credenciales del proyecto, igual que el servicio):
+    export GOOGLE_APPLICATION_CREDENTIALS=/ruta/gcp-key.json
+    python bench_auth.py --token "$ID_TOKEN" [--requests 2000]
+
+El token se obtiene desde la app (sesión iniciada) con auth.currentUser.getIdToken().
+"""
+
+import argparse
+import os
+import time
+
+import main
+from firebase_admin import auth
+
+
+def percentiles(samples_ms):
+    ordered = sorted(samples_ms)
+    return (ordered[len(ordered) // 2],
+            ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            ordered[-1])
+
+
+def run(verify, token, requests):
+    samples = []
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        verify(token)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description="Benchmark de verificación de tokens de Firebase")
+    parser.add_argument("--token", default=os.environ.get("VIGILIA_ID_TOKEN"), help="Token ID de Firebase vigente")
+    parser.add_argument("--requests", type=int, default=2000, help="Peticiones simuladas por modo")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("falta --token (o VIGILIA_ID_TOKEN)")
+
+    # Antes: cada petición verifica firma y claims; la primera además descarga los certificados
+    before = run(auth.verify_id_token, args.token, args.requests)
+
+    # Después: certificados precargados por el thread de fondo y claims cacheados por digest
+    verifier = main.token_verifier
+    verifier.start()
+    deadline = time.time() + 30
+    while verifier.certs_refrescados == 0 and time.time() < deadline:
+        time.sleep(0.1)
+    after = run(verifier.verify, args.token, args.requests)
+
+    print(f"Peticiones por modo: {args.requests}")
+    for name, samples in (("antes (verify_id_token)", before), ("después (cache)", after)):
+        p50, p99, worst = percentiles(samples)
+        print(f"{name:<24} p50 {p50:8.3f} ms | p99 {p99:8.3f} ms | max {worst:8.3f} ms")
+    stats = verifier.stats()
+    print(f"Hit ratio: {stats['hit_ratio']} | certificados refrescados: {stats['certs_refrescados']}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: GETs concurrentes mientras hay una notificación de caída en curso
+
+Mide si las lecturas de la app se quedan esperando detrás de POST /eventos-caida/notificar.
+Con el stack síncrono (psycopg2 + requests dentro de endpoints async def) cada consulta o
+llamada HTTP de la caída bloqueaba el event loop y los GETs de esa instancia se encolaban;
+con asyncpg + httpx.AsyncClient la latencia de los GETs durante la caída debe parecerse a la
+de referencia.
+
+Fases:
+  1. Referencia: --requests GETs a /dispositivos/adulto-mayor/{id} con --concurrency en paralelo
+  2. Contención: las mismas peticiones lanzadas junto con --falls notificaciones de caída;
+     se reportan aparte los GETs que empezaron mientras alguna caída seguía en vuelo
+
+Uso (contra una instancia de prueba; cada caída crea una alerta real y notifica a los cuidadores):
+    export VIGILIA_ID_TOKEN=...        # token ID de un cuidador del adulto mayor
+    export INTERNAL_API_KEY=...
+    python loadtest_async.py --url http://localhost:8080 --adulto-mayor-id 1 --dispositivo-id 1 \\
+        [--requests 500] [--concurrency 50] [--falls 3]
+
+Si el dispositivo está en cooldown la caída responde sin notificar; usar uno de prueba o
+POST /dispositivos/reset-cooldown entre corridas.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return None, None, None
+    ordered = sorted(samples_ms)
+    return (ordered[len(ordered) // 2],
+            ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            ordered[-1])
+
+
+def linea(nombre, samples_ms):
+    p50, p99, worst = percentiles(samples_ms)
+    if p50 is None:
+        return f"{nombre:<28} sin muestras"
+    return f"{nombre:<28} n {len(samples_ms):5d} | p50 {p50:8.1f} ms | p99 {p99:8.1f} ms | max {worst:8.1f} ms"
+
+
+async def get_dispositivo(client, args, semaforo, resultados):
+    async with semaforo:
+        t0 = time.perf_counter()
+        response = await client.get(
+            f"/dispositivos/adulto-mayor/{args.adulto_mayor_id}",
+            headers={"Authorization": f"Bearer {args.token}"}
+        )
+        t1 = time.perf_counter()
+    resultados.append((t0, t1, response.status_code))
+
+
+async def notificar_caida(client, args, vuelos):
+    t0 = time.perf_counter()
+    response = await client.post(
+        "/eventos-caida/notificar",
+        headers={"X-Internal-Token": args.internal_key},
+        json={
+            "dispositivo_id": args.dispositivo_id,
+            "timestamp_caida": datetime.now(timezone.utc).isoformat(),
+            "url_video_almacenado": "loadtest://sin-video"
+        }
+    )
+    t1 = time.perf_counter()
+    vuelos.append((t0, t1, response.status_code))
+
+
+async def fase(client, args, falls: int):
+    semaforo = asyncio.Semaphore(args.concurrency)
+    resultados, vuelos = [], []
+    tareas = [notificar_caida(client, args, vuelos) for _ in range(falls)]
+    tareas += [get_dispositivo(client, args, semaforo, resultados) for _ in range(args.requests)]
+    await asyncio.gather(*tareas)
+    return resultados, vuelos
+
+
+async def main_loadtest():
+    parser = argparse.ArgumentParser(description="GETs concurrentes durante notificaciones de caída")
+    parser.add_argument("--url", default=os.environ.get("VIGILIA_API_URL", "http://localhost:8080"))
+    parser.add_argument("--token", default=os.environ.get("VIGILIA_ID_TOKEN"), help="Token ID de Firebase de un cuidador")
+    parser.add_argument("--internal-key", default=os.environ.get("INTERNAL_API_KEY"))
+    parser.add_argument("--adulto-mayor-id", type=int, required=True)
+    parser.add_argument("--dispositivo-id", type=int, required=True)
+    parser.add_argument("--requests", type=int, default=500, help="GETs por fase")
+    parser.add_argument("--concurrency", type=int, default=50, help="GETs simultáneos")
+    parser.add_argument("--falls", type=int, default=3, help="Caídas lanzadas en la fase de contención")
+    args = parser.parse_args()
+    if not args.token:
+        parser.error("falta --token (o VIGILIA_ID_TOKEN)")
+    if not args.internal_key:
+        parser.error("falta --internal-key (o INTERNAL_API_KEY)")
+
+    limits = httpx.Limits(max_connections=args.concurrency + args.falls)
+    async with httpx.AsyncClient(base_url=args.url.rstrip("/"), timeout=60, limits=limits) as client:
+        # Calentar conexiones, cache de tokens y pool de BD
+        await fase(client, argparse.Namespace(**{**vars(args), "requests": min(args.concurrency, args.requests)}), 0)
+
+        referencia, _ = await fase(client, args, 0)
+        contencion, vuelos = await fase(client, args, args.falls)
+
+    inicio_vuelo = min(t0 for t0, _, _ in vuelos) if vuelos else 0
+    fin_vuelo = max(t1 for _, t1, _ in vuelos) if vuelos else 0
+    durante = [(t1 - t0) * 1000 for t0, t1, _ in contencion if inicio_vuelo <= t0 <= fin_vuelo]
+    errores = sum(1 for _, _, code in referencia + contencion if code >= 400)
+
+    print(f"GETs por fase: {args.requests} (concurrencia {args.concurrency}) | caídas: {args.falls}")
+    print(linea("referencia", [(t1 - t0) * 1000 for t0, t1, _ in referencia]))
+    print(linea("con caídas (todos)", [(t1 - t0) * 1000 for t0, t1, _ in contencion]))
+    print(linea("con caída en vuelo", durante))
+    print(linea("POST caída", [(t1 - t0) * 1000 for t0, t1, _ in vuelos]))
+    print(f"Estados de caída: {[code for _, _, code in vuelos]} | GETs con error: {errores}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main_loadtest())
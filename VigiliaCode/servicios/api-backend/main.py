@@ -1,17 +1,24 @@
 import os
-import requests
+import httpx
+import asyncio
+import contextlib
 from fastapi import FastAPI, HTTPException, Depends, status, Header
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel, EmailStr, constr, validator
-from sqlalchemy import create_engine, text, engine as sqlalchemy_engine
+from sqlalchemy import text, engine as sqlalchemy_engine
+from sqlalchemy.ext.asyncio import create_async_engine
 import json
 import firebase_admin
 from firebase_admin import credentials, auth
 from firebase_admin.exceptions import FirebaseError
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from fastapi.middleware.cors import CORSMiddleware
 from google.cloud import storage
 import pytz
+import threading
+import time
+import hashlib
+from collections import OrderedDict, deque
 
 # --- Configuración de Firebase ---
 try:
@@ -42,7 +49,7 @@ print(f"[DEBUG] DB_SOCKET_DIR value: '{db_socket_dir}'")
 print(f"[DEBUG] Full connection path: '{db_socket_dir}/{cloud_sql_connection_name}'")
 
 db_url = sqlalchemy_engine.URL.create(
-    drivername="postgresql+psycopg2",
+    drivername="postgresql+asyncpg",
     username=DB_USER,
     password=DB_PASS,
     database=DB_NAME,
@@ -51,15 +58,95 @@ db_url = sqlalchemy_engine.URL.create(
     }
 )
 
-engine = create_engine(
+# Engine asíncrono (asyncpg): las consultas no bloquean el event loop mientras esperan a Cloud SQL
+engine = create_async_engine(
     db_url,
     pool_size=5,
     max_overflow=2,
     pool_timeout=30,
     pool_recycle=1800
 )
+
+def utc_naive(dt: datetime | None) -> datetime | None:
+    """
+    datetime para parámetros TIMESTAMP: asyncpg no convierte datetimes con zona horaria
+    (psycopg2 sí), así que se pasan en UTC sin tzinfo.
+    """
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
 # --- FIN DE CONFIGURACIÓN DE BASE DE DATOS ---
 
+# --- Cliente HTTP compartido ---
+# Un solo httpx.AsyncClient por instancia para Expo, api-email, webhook-wsp y alertas-websocket
+# (conexiones keep-alive reutilizadas; ninguna llamada externa bloquea el event loop)
+HTTP_TIMEOUT_SEC = float(os.environ.get("HTTP_TIMEOUT_SEC", "10"))
+HTTP_MAX_CONEXIONES = int(os.environ.get("HTTP_MAX_CONEXIONES", "50"))
+http_client = httpx.AsyncClient(
+    timeout=HTTP_TIMEOUT_SEC,
+    limits=httpx.Limits(max_connections=HTTP_MAX_CONEXIONES, max_keepalive_connections=20)
+)
+# --- FIN CLIENTE HTTP ---
+
+# --- Cache en memoria (por instancia de Cloud Run) ---
+USER_CACHE_TTL_SEC = float(os.environ.get("USER_CACHE_TTL_SEC", "60"))          # Vigencia del perfil cacheado
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "2048"))  # Tope LRU de usuarios cacheados
+
+# Copia idéntica en api-backend/main.py y alertas-websocket/main.py: cada servicio se despliega
+# desde su propio directorio (`gcloud run deploy --source .`), así que no hay módulo compartido.
+# Cambiar ambas a la vez y verificar con `python servicios/check_auth_copies.py`.
+class TTLCache:
+    """
+    Cache LRU con vencimiento por entrada, segura entre threads.
+    Es local al proceso: cada instancia tiene la suya, así que un cambio hecho en otra
+    instancia se ve a más tardar al vencer el TTL.
+    """
+
+    def __init__(self, ttl_sec: float, max_entries: int):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expira_monotonic, valor)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl_sec: float | None = None):
+        ttl = self.ttl_sec if ttl_sec is None else ttl_sec
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+user_cache = TTLCache(USER_CACHE_TTL_SEC, USER_CACHE_MAX_ENTRIES)  # firebase_uid -> CurrentUserInfo
+# --- FIN DE CACHE EN MEMORIA ---
+
 app = FastAPI(title="VigilIA API")
 print("✅✅✅ API V2 (CON CORRECCIÓN DIAS_SEMANA) INICIADA ✅✅✅")
 
@@ -234,8 +321,13 @@ class CaidaDetectada(BaseModel):
     timestamp_caida: datetime
     url_video_almacenado: str
     snapshot_url: str | None = None  # URL del snapshot de la caída
+    snapshot_variantes: dict[str, str] | None = None  # {"thumb": gs://..., "medium": gs://...} generadas en el edge
+    idempotency_key: constr(max_length=64) | None = None  # UUID de la fila del outbox del edge (fijo entre reintentos)
 # --- FIN: NUEVO MODELO ---
 
+# Variantes reducidas del snapshot que sube el edge junto al original
+SNAPSHOT_VARIANTES = ("thumb", "medium")
+
 class SolicitudCuidadoCreate(BaseModel):
     email_destinatario: EmailStr
     mensaje: str | None = None
@@ -336,10 +428,174 @@ async def verify_internal_token(x_internal_token: str = Header(None)):
     return True
 # --- FIN: NUEVA DEPENDENCIA DE SEGURIDAD INTERNA ---
 
+# --- Verificación de tokens de Firebase con cache ---
+# Copia idéntica en api-backend/main.py y alertas-websocket/main.py: cada servicio se despliega
+# desde su propio directorio (`gcloud run deploy --source .`), así que no hay módulo compartido.
+# Cambiar ambas a la vez y verificar con `python servicios/check_auth_copies.py`.
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "4096"))  # Tokens verificados en memoria
+TOKEN_CACHE_MAX_TTL_SEC = float(os.environ.get("TOKEN_CACHE_MAX_TTL_SEC", "3600"))  # Tope de vigencia en cache
+TOKEN_EXP_MARGIN_SEC = float(os.environ.get("TOKEN_EXP_MARGIN_SEC", "10"))          # Dejar de servir claims antes de `exp`
+FIREBASE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+FIREBASE_CERTS_REFRESH_RATIO = 0.8   # Refrescar certificados al 80% de su max-age
+FIREBASE_CERTS_RETRY_SEC = 30        # Reintento si la descarga falla
+AUTH_LATENCY_SAMPLES = 2048          # Últimas latencias para p50/p99
+
+class FirebaseTokenVerifier:
+    """
+    Verifica tokens ID de Firebase y cachea los claims por digest SHA-256 del token
+    (el token en claro no queda en memoria) hasta poco antes de su `exp`.
+
+    Un thread de fondo descarga las claves públicas de Google al arrancar y las vuelve a pedir
+    antes de que venza su max-age, dejando caliente el cache HTTP que usa firebase_admin:
+    ninguna petición espera la descarga de certificados. Si la versión instalada de
+    firebase_admin no expone ese transporte, el prefetch se desactiva y verify_id_token
+    descarga las claves por su cuenta como siempre.
+    No se consulta revocación (igual que verify_id_token sin check_revoked).
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(TOKEN_CACHE_MAX_TTL_SEC, TOKEN_CACHE_MAX_ENTRIES)
+        self.latencias_ms = {"hit": deque(maxlen=AUTH_LATENCY_SAMPLES), "miss": deque(maxlen=AUTH_LATENCY_SAMPLES)}
+        self.errores = 0
+        self.certs_refrescados = 0
+        self.certs_ultimo_refresco = None
+        self.certs_proximo_refresco = None
+        self.certs_prefetch = True
+        self._thread = None
+
+    @staticmethod
+    def token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _cache_hit(self, key: str, t0: float) -> dict | None:
+        claims = self.cache.get(key)
+        if claims is not None and claims.get("exp", 0) - TOKEN_EXP_MARGIN_SEC > time.time():
+            self.latencias_ms["hit"].append((time.perf_counter() - t0) * 1000)
+            return claims
+        return None
+
+    def _verify_miss(self, token: str, key: str, t0: float) -> dict:
+        try:
+            claims = auth.verify_id_token(token)
+        except Exception:
+            self.errores += 1
+            raise
+        ttl = claims.get("exp", 0) - TOKEN_EXP_MARGIN_SEC - time.time()
+        if ttl > 0:
+            self.cache.set(key, claims, min(ttl, TOKEN_CACHE_MAX_TTL_SEC))
+        self.latencias_ms["miss"].append((time.perf_counter() - t0) * 1000)
+        return claims
+
+    def verify(self, token: str) -> dict:
+        """Claims del token; lanza las mismas excepciones que auth.verify_id_token"""
+        t0 = time.perf_counter()
+        key = self.token_key(token)
+        claims = self._cache_hit(key, t0)
+        return claims if claims is not None else self._verify_miss(token, key, t0)
+
+    async def verify_async(self, token: str) -> dict:
+        """
+        Como verify, para endpoints async: el hit se resuelve en el event loop y el miss
+        (firma RSA y, si hiciera falta, descarga de claves) corre en un thread.
+        """
+        t0 = time.perf_counter()
+        key = self.token_key(token)
+        claims = self._cache_hit(key, t0)
+        if claims is not None:
+            return claims
+        return await asyncio.to_thread(self._verify_miss, token, key, t0)
+
+    def _cert_request(self):
+        """
+        Transporte con cache HTTP (cachecontrol) con el que verify_id_token descarga las claves.
+        No es API pública de firebase_admin (probado con 6.5 y 7.x, rango fijado en
+        requirements.txt): retorna None si no está disponible.
+        """
+        try:
+            request = auth._get_client(firebase_admin.get_app())._token_verifier.request
+        except (AttributeError, ValueError):
+            return None
+        return request if callable(request) else None
+
+    def refresh_certs(self) -> float:
+        """Descarga las claves saltando el cache (queda cacheada la respuesta nueva); retorna su max-age"""
+        request = self._cert_request()
+        if request is None:
+            raise LookupError("firebase_admin no expone el transporte de certificados")
+        response = request(FIREBASE_CERTS_URL, method="GET", headers={"Cache-Control": "no-cache"})
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status} al descargar certificados")
+        max_age = 3600.0
+        for directive in response.headers.get("cache-control", "").split(","):
+            name, _, value = directive.strip().partition("=")
+            if name.lower() == "max-age" and value.isdigit():
+                max_age = float(value)
+        self.certs_refrescados += 1
+        self.certs_ultimo_refresco = datetime.now(timezone.utc)
+        return max_age
+
+    def _certs_loop(self):
+        while True:
+            try:
+                max_age = self.refresh_certs()
+                delay = max(FIREBASE_CERTS_RETRY_SEC, max_age * FIREBASE_CERTS_REFRESH_RATIO)
+                print(f"🔑 Certificados de Firebase actualizados (max-age {max_age:.0f}s, próximo refresco en {delay:.0f}s)")
+            except LookupError as e:
+                self.certs_prefetch = False
+                self.certs_proximo_refresco = None
+                print(f"🟡 Prefetch de certificados desactivado ({e}); verify_id_token los descarga bajo demanda")
+                return
+            except Exception as e:
+                delay = FIREBASE_CERTS_RETRY_SEC
+                print(f"⚠️ No se pudieron prefetchear certificados de Firebase: {e}")
+            self.certs_proximo_refresco = datetime.now(timezone.utc) + timedelta(seconds=delay)
+            time.sleep(delay)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._certs_loop, name="firebase-certs", daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        def percentiles(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {"n": 0, "p50_ms": None, "p99_ms": None}
+            return {
+                "n": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2], 3),
+                "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+            }
+        total = self.cache.hits + self.cache.misses
+        return {
+            "cache_entradas": len(self.cache),
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "hit_ratio": round(self.cache.hits / total, 4) if total else None,
+            "errores": self.errores,
+            "latencia_hit": percentiles(list(self.latencias_ms["hit"])),
+            "latencia_miss": percentiles(list(self.latencias_ms["miss"])),
+            "certs_prefetch": self.certs_prefetch,
+            "certs_refrescados": self.certs_refrescados,
+            "certs_ultimo_refresco": self.certs_ultimo_refresco.isoformat() if self.certs_ultimo_refresco else None,
+            "certs_proximo_refresco": self.certs_proximo_refresco.isoformat() if self.certs_proximo_refresco else None,
+        }
+
+token_verifier = FirebaseTokenVerifier()
+
+@app.on_event("startup")
+def start_token_verifier():
+    token_verifier.start()
+
+@app.get("/internal/auth-stats")
+async def auth_stats(is_internal: bool = Depends(verify_internal_token)):
+    """Hit ratio del cache de tokens, latencias de verificación y estado de los certificados"""
+    return token_verifier.stats()
+
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
     """Verifica el token ID de Firebase y devuelve el payload."""
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await token_verifier.verify_async(token)
         return decoded_token
     except ValueError as e:
         print(f"Error de verificación de token (Value Error): {e}")
@@ -386,7 +642,7 @@ async def get_current_user_optional(authorization: str = Header(None)) -> dict |
     token = parts[1]
 
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = await token_verifier.verify_async(token)
         return decoded_token
     except Exception as e:
         print(f"Error al verificar token opcional: {e}")
@@ -396,7 +652,25 @@ async def get_current_user_optional(authorization: str = Header(None)) -> dict |
 
 # --- Helper Functions ---
 
-def enviar_push_notification(push_tokens: list[str], titulo: str, mensaje: str, data: dict | None = None):
+EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+
+def construir_mensajes_push(tokens: list[str], titulo: str, mensaje: str, data: dict | None = None) -> list[dict]:
+    """Mensajes de Expo Push (uno por token) para /push/send"""
+    return [
+        {
+            "to": token,
+            "sound": "default",
+            "title": titulo,
+            "body": mensaje,
+            "data": data or {},
+            "priority": "high",
+            "channelId": "default"
+        }
+        for token in tokens
+    ]
+
+
+async def enviar_push_notification(push_tokens: list[str], titulo: str, mensaje: str, data: dict | None = None):
     """
     Envía notificaciones push usando la API de Expo Push Notifications.
 
@@ -430,23 +704,12 @@ def enviar_push_notification(push_tokens: list[str], titulo: str, mensaje: str,
         return {"success": False, "message": "No hay tokens válidos"}
 
     # Preparar mensajes para Expo
-    messages = []
-    for token in tokens_validos:
-        message = {
-            "to": token,
-            "sound": "default",
-            "title": titulo,
-            "body": mensaje,
-            "data": data or {},
-            "priority": "high",
-            "channelId": "default"
-        }
-        messages.append(message)
+    messages = construir_mensajes_push(tokens_validos, titulo, mensaje, data)
 
     try:
         # Enviar a la API de Expo Push Notifications
-        response = requests.post(
-            'https://exp.host/--/api/v2/push/send',
+        response = await http_client.post(
+            EXPO_PUSH_URL,
             json=messages,
             headers={
                 'Accept': 'application/json',
@@ -463,7 +726,7 @@ def enviar_push_notification(push_tokens: list[str], titulo: str, mensaje: str,
 
         return {"success": True, "result": result, "sent_count": len(messages)}
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"❌ Error al enviar notificaciones push: {str(e)}")
         return {"success": False, "error": str(e)}
     except Exception as e:
@@ -471,40 +734,14 @@ def enviar_push_notification(push_tokens: list[str], titulo: str, mensaje: str,
         return {"success": False, "error": str(e)}
 
 
-def enviar_email_notificacion(
+def construir_payload_email(
     tipo_notificacion: str,
     destinatarios: list[dict],
     adulto_mayor_nombre: str,
     timestamp: datetime,
     **kwargs
 ):
-    """
-    Envía notificaciones por email usando el servicio api-email.
-
-    Args:
-        tipo_notificacion: 'caida', 'ayuda', o 'recordatorio'
-        destinatarios: Lista de diccionarios con {email, nombre}
-        adulto_mayor_nombre: Nombre del adulto mayor
-        timestamp: Timestamp de la alerta/recordatorio
-        **kwargs: Parámetros adicionales según el tipo de notificación
-            - Para caida: url_video, dispositivo_id
-            - Para ayuda: mensaje_adicional
-            - Para recordatorio: titulo_recordatorio, descripcion, tipo_recordatorio, fecha_hora_programada
-
-    Returns:
-        Diccionario con el resultado del envío
-    """
-    if not destinatarios:
-        print("⚠️  No hay destinatarios de email")
-        return {"success": False, "message": "No hay destinatarios"}
-
-    email_service_url = os.environ.get("EMAIL_SERVICE_URL", "").strip()
-    internal_api_key = os.environ.get("INTERNAL_API_KEY", "").strip()
-
-    if not email_service_url:
-        print("⚠️  EMAIL_SERVICE_URL no configurado")
-        return {"success": False, "message": "Servicio de email no configurado"}
-
+    """Endpoint de api-email y payload para un tipo de notificación; (None, None) si el tipo no existe"""
     # Preparar el endpoint según el tipo de notificación
     endpoint_map = {
         "caida": "/send/alerta-caida",
@@ -514,8 +751,7 @@ def enviar_email_notificacion(
 
     endpoint = endpoint_map.get(tipo_notificacion)
     if not endpoint:
-        print(f"⚠️  Tipo de notificación no válido: {tipo_notificacion}")
-        return {"success": False, "message": "Tipo de notificación inválido"}
+        return None, None
 
     # Preparar el payload según el tipo
     payload = {
@@ -539,8 +775,50 @@ def enviar_email_notificacion(
         payload["tipo_recordatorio"] = kwargs.get("tipo_recordatorio", "otro")
         payload["fecha_hora_programada"] = kwargs.get("fecha_hora_programada", timestamp).isoformat()
 
+    return endpoint, payload
+
+
+async def enviar_email_notificacion(
+    tipo_notificacion: str,
+    destinatarios: list[dict],
+    adulto_mayor_nombre: str,
+    timestamp: datetime,
+    **kwargs
+):
+    """
+    Envía notificaciones por email usando el servicio api-email.
+
+    Args:
+        tipo_notificacion: 'caida', 'ayuda', o 'recordatorio'
+        destinatarios: Lista de diccionarios con {email, nombre}
+        adulto_mayor_nombre: Nombre del adulto mayor
+        timestamp: Timestamp de la alerta/recordatorio
+        **kwargs: Parámetros adicionales según el tipo de notificación
+            - Para caida: url_video, dispositivo_id
+            - Para ayuda: mensaje_adicional
+            - Para recordatorio: titulo_recordatorio, descripcion, tipo_recordatorio, fecha_hora_programada
+
+    Returns:
+        Diccionario con el resultado del envío
+    """
+    if not destinatarios:
+        print("⚠️  No hay destinatarios de email")
+        return {"success": False, "message": "No hay destinatarios"}
+
+    email_service_url = os.environ.get("EMAIL_SERVICE_URL", "").strip()
+    internal_api_key = os.environ.get("INTERNAL_API_KEY", "").strip()
+
+    if not email_service_url:
+        print("⚠️  EMAIL_SERVICE_URL no configurado")
+        return {"success": False, "message": "Servicio de email no configurado"}
+
+    endpoint, payload = construir_payload_email(tipo_notificacion, destinatarios, adulto_mayor_nombre, timestamp, **kwargs)
+    if not endpoint:
+        print(f"⚠️  Tipo de notificación no válido: {tipo_notificacion}")
+        return {"success": False, "message": "Tipo de notificación inválido"}
+
     try:
-        response = requests.post(
+        response = await http_client.post(
             f"{email_service_url}{endpoint}",
             json=payload,
             headers={
@@ -560,18 +838,526 @@ def enviar_email_notificacion(
             print(f"   Response: {response.text}")
             return {"success": False, "error": f"Status code {response.status_code}"}
 
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         print(f"⚠️  Timeout al contactar servicio de email")
         return {"success": False, "error": "Timeout"}
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"❌ Error al enviar emails: {str(e)}")
         return {"success": False, "error": str(e)}
     except Exception as e:
         print(f"❌ Error inesperado al enviar emails: {str(e)}")
         return {"success": False, "error": str(e)}
 
+
+def descargar_blob_gcs(bucket_name: str, blob_path: str):
+    """
+    Descarga un objeto de Cloud Storage (llamada síncrona, usar con asyncio.to_thread).
+
+    Returns:
+        Tupla (bytes, content_type) o None si el objeto no existe
+    """
+    storage_client = storage.Client()
+    blob = storage_client.bucket(bucket_name).blob(blob_path)
+    if not blob.exists():
+        return None
+    image_bytes = blob.download_as_bytes()
+    return image_bytes, blob.content_type or "image/jpeg"
+
 # --- FIN Helper Functions ---
 
+# --- Outbox de notificaciones de alertas ---
+# La alerta y su fila en notificaciones_outbox se escriben en la misma transacción; el endpoint
+# responde al hacer commit y NotificationDispatcher reparte push, WebSocket, WhatsApp y email
+# en segundo plano: todos los canales y destinatarios en paralelo (httpx asíncrono), con un
+# deadline por alerta, reintentos y un reporte de entrega guardado en alertas.reporte_notificaciones.
+NOTIF_POLL_SEC = float(os.environ.get("NOTIF_POLL_SEC", "2"))                # Sondeo de filas pendientes (s)
+NOTIF_BATCH_SIZE = int(os.environ.get("NOTIF_BATCH_SIZE", "10"))             # Filas reclamadas por ronda
+NOTIF_MAX_INTENTOS = int(os.environ.get("NOTIF_MAX_INTENTOS", "5"))          # Después: estado 'fallido'
+NOTIF_BACKOFF_BASE_SEC = float(os.environ.get("NOTIF_BACKOFF_BASE_SEC", "5"))  # 5, 10, 20, 40 s...
+NOTIF_LOCK_SEC = int(os.environ.get("NOTIF_LOCK_SEC", "120"))                # Fila 'procesando' sin cerrar -> se reclama
+NOTIF_DEADLINE_SEC = float(os.environ.get("NOTIF_DEADLINE_SEC", "12"))       # Tope por alerta para todos los envíos de un intento
+NOTIF_MAX_DB_CONEXIONES = int(os.environ.get("NOTIF_MAX_DB_CONEXIONES", "2"))  # Conexiones del pool (5 + 2) que puede ocupar el despachador
+NOTIF_INLINE_DEADLINE_SEC = float(os.environ.get("NOTIF_INLINE_DEADLINE_SEC", "5"))  # Primer intento dentro de la petición (edge espera 10 s)
+WEBSOCKET_SERVICE_URL = os.environ.get("WEBSOCKET_SERVICE_URL", "https://alertas-websocket-687053793381.southamerica-west1.run.app").strip()
+WHATSAPP_SERVICE_URL = os.environ.get("WHATSAPP_SERVICE_URL", "https://whatsapp-webhook-687053793381.southamerica-west1.run.app").strip()
+
+
+async def notificar_websocket(client: httpx.AsyncClient, endpoint: str, payload: dict):
+    """POST interno al servicio alertas-websocket. Retorna {"success": bool, ...}"""
+    if not WEBSOCKET_SERVICE_URL:
+        return {"success": False, "error": "WEBSOCKET_SERVICE_URL no configurado"}
+    response = await client.post(
+        f"{WEBSOCKET_SERVICE_URL}{endpoint}",
+        json=payload,
+        headers={"X-Internal-Key": os.environ.get("INTERNAL_API_KEY", "").strip()}
+    )
+    if response.status_code == 200:
+        notificados = response.json().get('notified_count', 0)
+        print(f"🌐 Notificación WebSocket enviada: {notificados} cuidadores conectados")
+        return {"success": True, "notificados": notificados}
+    print(f"⚠️  WebSocket service respondió con código {response.status_code}")
+    return {"success": False, "error": f"Status code {response.status_code}"}
+
+
+async def enviar_whatsapp_notificacion(client: httpx.AsyncClient, phone: str, notification_type: str,
+                                       titulo: str, mensaje: str, nombre_adulto_mayor: str):
+    """Envía un template de WhatsApp a un número vía webhook-wsp. Retorna {"success": bool, ...}"""
+    payload = {
+        "phone_number": phone,
+        "notification_type": notification_type,  # fall_alert (template alertacaidatest) | help_alert
+        "title": titulo,
+        "body": mensaje,
+        "parameters": {
+            "nombre_adulto_mayor": nombre_adulto_mayor  # Parámetro requerido por el template
+        }
+    }
+    response = await client.post(
+        f"{WHATSAPP_SERVICE_URL}/send-notification",
+        json=payload,
+        headers={"X-API-Key": os.environ.get("WEBHOOK_API_KEY", "").strip()}
+    )
+    if response.status_code == 200:
+        print(f"✅ WhatsApp enviado a {phone}")
+        return {"success": True}
+    print(f"⚠️  WhatsApp falló para {phone}: {response.status_code}")
+    return {"success": False, "error": f"Status code {response.status_code}"}
+
+
+async def enviar_push_alerta(client: httpx.AsyncClient, push_tokens: list[str], titulo: str, mensaje: str, data: dict | None):
+    """
+    Un POST a Expo con todos los tokens. El resultado incluye el ticket de cada token
+    (ok / error de Expo, p. ej. DeviceNotRegistered) para el reporte de entrega.
+    """
+    tokens_validos = [token for token in push_tokens if token and token.startswith('ExponentPushToken')]
+    if not tokens_validos:
+        # Solo tokens de desarrollo (DEV-TOKEN-*): notificaciones locales, nada que enviar
+        return {"success": True, "destinatarios": [{"destino": enmascarar(t), "estado": "dev"} for t in push_tokens]}
+    response = await client.post(
+        EXPO_PUSH_URL,
+        json=construir_mensajes_push(tokens_validos, titulo, mensaje, data),
+        headers={'Accept': 'application/json', 'Content-Type': 'application/json'}
+    )
+    if response.status_code != 200:
+        print(f"⚠️  Error al enviar push: {response.status_code}")
+        return {"success": False, "error": f"Status code {response.status_code}"}
+    tickets = response.json().get("data", [])
+    destinatarios = []
+    for token, ticket in zip(tokens_validos, tickets):
+        destinatarios.append({
+            "destino": enmascarar(token),
+            "estado": ticket.get("status", "desconocido"),
+            "error": (ticket.get("details") or {}).get("error") or ticket.get("message")
+        })
+    print(f"📱 Notificaciones push enviadas a {len(tokens_validos)} cuidadores")
+    return {"success": True, "destinatarios": destinatarios}
+
+
+async def enviar_email_alerta(client: httpx.AsyncClient, destinatarios: list[dict], email: dict, nombre_adulto_mayor: str):
+    """POST a api-email para los destinatarios dados (uno por canal email:<direccion>)"""
+    email_service_url = os.environ.get("EMAIL_SERVICE_URL", "").strip()
+    if not email_service_url:
+        return {"success": False, "error": "EMAIL_SERVICE_URL no configurado"}
+    # Convertir timestamp de UTC a timezone de Chile
+    chile_tz = pytz.timezone('America/Santiago')
+    timestamp_utc = datetime.fromisoformat(email["timestamp"])
+    if timestamp_utc.tzinfo is None:
+        timestamp_chile = pytz.utc.localize(timestamp_utc).astimezone(chile_tz)
+    else:
+        timestamp_chile = timestamp_utc.astimezone(chile_tz)
+    endpoint, payload = construir_payload_email(
+        email["tipo"], destinatarios, nombre_adulto_mayor, timestamp_chile,
+        mensaje_adicional=email.get("mensaje_adicional"),
+        url_video=email.get("url_video"),
+        dispositivo_id=email.get("dispositivo_id")
+    )
+    response = await client.post(
+        f"{email_service_url}{endpoint}",
+        json=payload,
+        headers={"X-Internal-Key": os.environ.get("INTERNAL_API_KEY", "").strip(), "Content-Type": "application/json"}
+    )
+    if response.status_code != 200:
+        print(f"⚠️  Error al enviar emails: Status {response.status_code}")
+        return {"success": False, "error": f"Status code {response.status_code}"}
+    enviados = response.json().get("resultado", {}).get("enviados_exitosamente", 0)
+    print(f"✅ Emails enviados: {enviados}/{len(destinatarios)} destinatarios")
+    if enviados < len(destinatarios):
+        return {"success": False, "error": f"{enviados}/{len(destinatarios)} emails enviados"}
+    return {"success": True}
+
+
+def enmascarar(valor: str, visibles: int = 6) -> str:
+    """Token recortado para el reporte (no guardar tokens push completos junto a la alerta)"""
+    return valor if len(valor) <= visibles else f"…{valor[-visibles:]}"
+
+
+async def encolar_notificaciones_alerta(db_conn, alerta_id: int, tipo_alerta: str, payload: dict):
+    """
+    Inserta la fila de outbox de una alerta. Debe llamarse dentro de la transacción del
+    INSERT en alertas: si la alerta no se confirma, tampoco se notifica.
+    """
+    await db_conn.execute(text("""
+        INSERT INTO notificaciones_outbox (alerta_id, tipo_alerta, payload)
+        VALUES (:alerta_id, :tipo_alerta, :payload)
+    """), {"alerta_id": alerta_id, "tipo_alerta": tipo_alerta, "payload": json.dumps(payload)})
+
+
+async def resolver_destinatarios(db_conn, payload: dict) -> dict:
+    """
+    Canales a notificar para una alerta, con su destino ya resuelto. Se calcula una sola vez
+    (primer intento) y queda en `canales`, así los reintentos solo repiten lo que falló.
+    Claves: push (un lote a Expo), websocket, whatsapp:<numero> y email:<direccion>
+    (un envío por cuidador, todos en paralelo).
+    """
+    adulto_mayor_id = payload["adulto_mayor_id"]
+    canales = {}
+
+    # Push: u.push_token; notificar_app NULL o TRUE = habilitado (default)
+    push_rows = (await db_conn.execute(text("""
+        SELECT u.push_token
+        FROM usuarios u
+        INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
+        LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
+        WHERE cam.adulto_mayor_id = :adulto_mayor_id
+          AND u.rol = 'cuidador'
+          AND u.push_token IS NOT NULL
+          AND (ca.notificar_app IS NULL OR ca.notificar_app = TRUE)
+    """), {"adulto_mayor_id": adulto_mayor_id})).fetchall()
+    push_tokens = [row[0] for row in push_rows if row[0]]
+    if push_tokens:
+        canales["push"] = {"estado": "pendiente", "intentos": 0, "destino": push_tokens}
+
+    if payload.get("websocket") and WEBSOCKET_SERVICE_URL:
+        canales["websocket"] = {"estado": "pendiente", "intentos": 0, "destino": "/internal/notify-alert"}
+
+    whatsapp_rows = (await db_conn.execute(text("""
+        SELECT DISTINCT ca.numero_whatsapp
+        FROM usuarios u
+        INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
+        LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
+        WHERE cam.adulto_mayor_id = :adulto_mayor_id
+          AND ca.notificar_whatsapp = TRUE
+          AND ca.numero_whatsapp IS NOT NULL
+          AND u.rol = 'cuidador'
+    """), {"adulto_mayor_id": adulto_mayor_id})).fetchall()
+    for row in whatsapp_rows:
+        canales[f"whatsapp:{row[0]}"] = {"estado": "pendiente", "intentos": 0, "destino": row[0]}
+
+    if payload.get("email"):
+        email_rows = (await db_conn.execute(text("""
+            SELECT u.nombre, u.email, ca.email_secundario
+            FROM usuarios u
+            INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
+            LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
+            WHERE cam.adulto_mayor_id = :adulto_mayor_id
+              AND u.rol = 'cuidador'
+              AND (ca.notificar_email IS NULL OR ca.notificar_email = TRUE)
+        """), {"adulto_mayor_id": adulto_mayor_id})).fetchall()
+        for row in email_rows:
+            # Usar email secundario si está configurado, sino el principal
+            email_destino = row[2] or row[1]
+            if email_destino:
+                canales[f"email:{email_destino}"] = {
+                    "estado": "pendiente", "intentos": 0, "destino": [{"email": email_destino, "name": row[0]}]
+                }
+
+    return canales
+
+
+async def enviar_canal(client: httpx.AsyncClient, clave: str, canal: dict, payload: dict) -> dict:
+    """Un envío (canal o destinatario) de una alerta. Retorna {"success": bool, ...}"""
+    if clave == "push":
+        return await enviar_push_alerta(client, canal["destino"], payload["titulo"], payload["mensaje"], payload.get("push_data"))
+    if clave == "websocket":
+        return await notificar_websocket(client, canal["destino"], payload["websocket"])
+    if clave.startswith("whatsapp:"):
+        return await enviar_whatsapp_notificacion(
+            client, canal["destino"], payload["whatsapp_tipo"], payload["titulo"], payload["mensaje"],
+            payload["nombre_adulto_mayor"]
+        )
+    if clave.startswith("email"):
+        return await enviar_email_alerta(client, canal["destino"], payload["email"], payload["nombre_adulto_mayor"])
+    return {"success": False, "error": f"Canal desconocido: {clave}"}
+
+
+def construir_reporte_entrega(fila: dict, estado: str) -> dict:
+    """
+    Reporte de entrega de una alerta: resultado y latencias por canal/destinatario.
+    ms_desde_alerta = desde el commit de la alerta hasta la respuesta del proveedor (tiempo al cuidador).
+    """
+    canales = fila["canales"]
+    entregas = [c["ms_desde_alerta"] for c in canales.values()
+                if c.get("estado") == "enviado" and c.get("ms_desde_alerta") is not None]
+    enviados = sum(1 for c in canales.values() if c.get("estado") == "enviado")
+    if estado == "fallido" and enviados:
+        estado = "parcial"
+    reporte_canales = {
+        clave: {
+            campo: canal.get(campo)
+            for campo in ("estado", "intentos", "latencia_ms", "ms_desde_alerta", "error", "destinatarios", "fecha")
+            if canal.get(campo) is not None
+        }
+        for clave, canal in canales.items()
+    }
+    return {
+        "estado": estado,
+        "intentos": fila["intentos"],
+        "deadline_sec": NOTIF_DEADLINE_SEC,
+        "envios": len(canales),
+        "enviados": enviados,
+        "primera_entrega_ms": min(entregas) if entregas else None,
+        "ultima_entrega_ms": max(entregas) if entregas else None,
+        "canales": reporte_canales,
+        "actualizado": datetime.now(timezone.utc).isoformat()
+    }
+
+
+async def crear_tabla_notificaciones_outbox(db_conn):
+    """DDL idempotente de notificaciones_outbox y columnas asociadas de alertas (setup interno y arranque)"""
+    await db_conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS notificaciones_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            alerta_id INTEGER NOT NULL REFERENCES alertas(id) ON DELETE CASCADE,
+            tipo_alerta VARCHAR(20) NOT NULL,
+            payload JSONB NOT NULL,
+            canales JSONB NOT NULL DEFAULT '{}'::jsonb,
+            estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+            intentos INTEGER NOT NULL DEFAULT 0,
+            proximo_intento TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            bloqueado_hasta TIMESTAMPTZ,
+            fecha_creacion TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            fecha_actualizacion TIMESTAMPTZ,
+            CONSTRAINT check_estado_outbox CHECK (estado IN ('pendiente', 'procesando', 'enviado', 'fallido'))
+        );
+    """))
+    await db_conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_outbox_pendientes
+        ON notificaciones_outbox(proximo_intento) WHERE estado IN ('pendiente', 'procesando');
+    """))
+    await db_conn.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_notificaciones_outbox_alerta ON notificaciones_outbox(alerta_id);
+    """))
+    await db_conn.execute(text("ALTER TABLE alertas ADD COLUMN IF NOT EXISTS reporte_notificaciones JSONB;"))
+    # Idempotencia de /eventos-caida/notificar (reintentos del outbox del edge); NULL no colisiona
+    await db_conn.execute(text("ALTER TABLE alertas ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);"))
+    await db_conn.execute(text("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_alertas_idempotency_key ON alertas(idempotency_key);
+    """))
+
+
+class NotificationDispatcher:
+    """
+    Worker de notificaciones_outbox. Corre como tarea en el event loop de la API (engine asyncpg y
+    http_client compartidos). Reclama filas con FOR UPDATE SKIP LOCKED (varias instancias
+    de Cloud Run pueden despachar sin pisarse) y despacha todas las filas reclamadas a la vez; dentro
+    de cada una, todos los canales y destinatarios van en paralelo con un deadline de
+    NOTIF_DEADLINE_SEC para el intento completo. Lo que no respondió a tiempo
+    queda como 'timeout'. Una fila con envíos fallidos vuelve a 'pendiente' con backoff exponencial
+    hasta NOTIF_MAX_INTENTOS; el reporte de entrega se actualiza en la alerta en cada intento.
+    Las filas de una ronda comparten a lo más NOTIF_MAX_DB_CONEXIONES conexiones del pool (una por
+    consulta, nunca retenida durante los envíos), así una ráfaga de alertas no deja sin conexiones
+    a los endpoints.
+    El primer intento de cada alerta corre dentro de la petición que la creó (dispatch_alerta): en
+    Cloud Run sin CPU fuera de las peticiones el loop de fondo solo avanza mientras hay tráfico, así
+    que queda para los reintentos.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._db_slots = asyncio.Semaphore(max(1, NOTIF_MAX_DB_CONEXIONES))
+        self._task = None
+
+    @contextlib.asynccontextmanager
+    async def _db_conn(self):
+        async with self._db_slots:
+            async with engine.connect() as db_conn:
+                yield db_conn
+
+    def kick(self):
+        """Despertar el loop (p. ej. si el envío inmediato de una alerta no alcanzó a reclamarla)"""
+        self._wakeup.set()
+
+    async def claim(self, limite: int, alerta_id: int | None = None):
+        filtro = "AND alerta_id = :alerta_id" if alerta_id is not None else ""
+        params = {"lock_sec": NOTIF_LOCK_SEC, "limite": limite}
+        if alerta_id is not None:
+            params["alerta_id"] = alerta_id
+        async with self._db_conn() as db_conn:
+            filas = (await db_conn.execute(text("""
+                UPDATE notificaciones_outbox o
+                SET estado = 'procesando',
+                    intentos = o.intentos + 1,
+                    bloqueado_hasta = NOW() + make_interval(secs => :lock_sec),
+                    fecha_actualizacion = NOW()
+                FROM (
+                    SELECT id FROM notificaciones_outbox
+                    WHERE ((estado = 'pendiente' AND proximo_intento <= NOW())
+                        OR (estado = 'procesando' AND bloqueado_hasta < NOW()))
+                      {filtro}
+                    ORDER BY proximo_intento
+                    LIMIT :limite
+                    FOR UPDATE SKIP LOCKED
+                ) pendientes
+                WHERE o.id = pendientes.id
+                RETURNING o.id, o.alerta_id, o.payload, o.canales, o.intentos, o.fecha_creacion
+            """.format(filtro=filtro)), params)).fetchall()
+            await db_conn.commit()
+        return [dict(fila._mapping) for fila in filas]
+
+    async def resolve(self, fila: dict):
+        if not fila["canales"] or "destinatarios" in fila["canales"]:
+            async with self._db_conn() as db_conn:
+                fila["canales"] = await resolver_destinatarios(db_conn, fila["payload"])
+
+    async def finish(self, fila: dict):
+        canales = fila["canales"]
+        fallidos = [clave for clave, canal in canales.items() if canal["estado"] != "enviado"]
+        if not fallidos:
+            estado, delay = "enviado", 0
+        elif fila["intentos"] >= NOTIF_MAX_INTENTOS:
+            estado, delay = "fallido", 0
+        else:
+            estado, delay = "pendiente", NOTIF_BACKOFF_BASE_SEC * (2 ** (fila["intentos"] - 1))
+        reporte = construir_reporte_entrega(fila, estado if estado != "pendiente" else "reintentando")
+        async with self._db_conn() as db_conn:
+            await db_conn.execute(text("""
+                UPDATE notificaciones_outbox
+                SET estado = :estado,
+                    canales = :canales,
+                    proximo_intento = NOW() + make_interval(secs => :delay),
+                    bloqueado_hasta = NULL,
+                    fecha_actualizacion = NOW()
+                WHERE id = :id
+            """), {"estado": estado, "canales": json.dumps(canales), "delay": delay, "id": fila["id"]})
+            await db_conn.execute(text("""
+                UPDATE alertas SET reporte_notificaciones = :reporte WHERE id = :alerta_id
+            """), {"reporte": json.dumps(reporte), "alerta_id": fila["alerta_id"]})
+            await db_conn.commit()
+        if estado == "enviado":
+            print(f"📬 Alerta {fila['alerta_id']}: {len(canales)} envíos completados (intento {fila['intentos']}, "
+                  f"primera entrega {reporte['primera_entrega_ms']} ms, última {reporte['ultima_entrega_ms']} ms)")
+        elif estado == "fallido":
+            print(f"❌ Alerta {fila['alerta_id']}: sin éxito tras {fila['intentos']} intentos en {', '.join(fallidos)}")
+        else:
+            print(f"🔁 Alerta {fila['alerta_id']}: reintento en {delay:.0f}s para {', '.join(fallidos)}")
+
+    async def send(self, client: httpx.AsyncClient, fila: dict, clave: str):
+        """Un envío con su latencia; nunca lanza (el error queda en el resultado)"""
+        t0 = time.perf_counter()
+        try:
+            resultado = await enviar_canal(client, clave, fila["canales"][clave], fila["payload"])
+        except Exception as e:
+            print(f"⚠️  Error en envío {clave} de la alerta {fila['alerta_id']}: {str(e)}")
+            resultado = {"success": False, "error": str(e) or type(e).__name__}
+        resultado["latencia_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        resultado["fecha"] = datetime.now(timezone.utc)
+        return resultado
+
+    async def dispatch(self, client: httpx.AsyncClient, fila: dict, deadline: float = NOTIF_DEADLINE_SEC):
+        try:
+            await self.resolve(fila)
+        except Exception as e:
+            # Sin destinatarios resueltos la fila vuelve a 'pendiente' con backoff
+            print(f"⚠️  Error al resolver destinatarios de la alerta {fila['alerta_id']}: {str(e)}")
+            fila["canales"] = {"destinatarios": {"estado": "error", "intentos": fila["intentos"], "error": str(e)}}
+            await self.finish(fila)
+            return
+
+        pendientes = [clave for clave, canal in fila["canales"].items() if canal["estado"] != "enviado"]
+        tareas = {clave: asyncio.create_task(self.send(client, fila, clave)) for clave in pendientes}
+        if tareas:
+            await asyncio.wait(tareas.values(), timeout=deadline)
+        ahora = datetime.now(timezone.utc)
+        for clave, tarea in tareas.items():
+            canal = fila["canales"][clave]
+            if tarea.done():
+                resultado = tarea.result()
+            else:
+                tarea.cancel()
+                resultado = {"success": False, "error": "timeout", "latencia_ms": deadline * 1000, "fecha": ahora}
+            canal["intentos"] = canal.get("intentos", 0) + 1
+            canal["estado"] = "enviado" if resultado.get("success") else "error"
+            canal["error"] = None if resultado.get("success") else str(resultado.get("error") or resultado.get("message") or "sin detalle")
+            canal["latencia_ms"] = resultado["latencia_ms"]
+            canal["ms_desde_alerta"] = round((resultado["fecha"] - fila["fecha_creacion"]).total_seconds() * 1000) if resultado.get("success") else None
+            if resultado.get("destinatarios"):
+                canal["destinatarios"] = resultado["destinatarios"]
+            canal["fecha"] = resultado["fecha"].isoformat()
+        try:
+            await self.finish(fila)
+        except Exception as e:
+            print(f"⚠️  Error al guardar estado de notificaciones de la alerta {fila['alerta_id']}: {str(e)}")
+
+    async def dispatch_alerta(self, client: httpx.AsyncClient, alerta_id: int):
+        """
+        Primer intento de envío de una alerta recién confirmada, llamado por el endpoint después del
+        commit y acotado por NOTIF_INLINE_DEADLINE_SEC. Lo que no alcanza a salir vuelve a
+        'pendiente' para el loop de fondo. Nunca lanza: la alerta ya quedó registrada.
+        """
+        try:
+            for fila in await self.claim(1, alerta_id=alerta_id):
+                await self.dispatch(client, fila, deadline=NOTIF_INLINE_DEADLINE_SEC)
+        except Exception as e:
+            print(f"⚠️  Envío inmediato de la alerta {alerta_id} falló, queda para el despachador: {str(e)}")
+            self.kick()
+
+    async def drain_async(self, client: httpx.AsyncClient, limite: int = NOTIF_BATCH_SIZE) -> int:
+        """Reclama y despacha una ronda de filas; retorna cuántas procesó"""
+        filas = await self.claim(limite)
+        if filas:
+            await asyncio.gather(*(self.dispatch(client, fila) for fila in filas))
+        return len(filas)
+
+    async def _loop(self):
+        while True:
+            try:
+                procesadas = await self.drain_async(http_client)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Error en despachador de notificaciones: {str(e)}")
+                procesadas = 0
+            if procesadas == 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=NOTIF_POLL_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def start(self):
+        if self._task is None:
+            # Sin la tabla los INSERT de alertas fallarían: asegurarla antes de aceptar tráfico
+            try:
+                async with engine.connect() as db_conn:
+                    await crear_tabla_notificaciones_outbox(db_conn)
+                    await db_conn.commit()
+            except Exception as e:
+                print(f"⚠️  No se pudo verificar la tabla notificaciones_outbox: {str(e)}")
+            self._task = asyncio.create_task(self._loop(), name="notif-dispatcher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+notification_dispatcher = NotificationDispatcher()
+
+@app.on_event("startup")
+async def start_notification_dispatcher():
+    await notification_dispatcher.start()
+
+@app.on_event("shutdown")
+async def cerrar_recursos_async():
+    """Detener el despachador y liberar el pool de conexiones y el cliente HTTP compartidos"""
+    await notification_dispatcher.stop()
+    await http_client.aclose()
+    await engine.dispose()
+
+# --- FIN Outbox de notificaciones ---
+
 # --- Endpoints de la API ---
 
 @app.get("/")
@@ -579,7 +1365,7 @@ def read_root():
     return {"status": "VigilIA API está en línea"}
 
 @app.post("/register", response_model=UserInfo, status_code=status.HTTP_201_CREATED)
-def register_user(user: UserCreate):
+async def register_user(user: UserCreate):
     fb_user = None
     allowed_roles = ['cuidador', 'adulto_mayor']
     if user.rol not in allowed_roles:
@@ -587,7 +1373,8 @@ def register_user(user: UserCreate):
 
     try:
         print(f"Intentando crear usuario en Firebase para: {user.email} con rol: {user.rol}")
-        fb_user = auth.create_user(
+        fb_user = await asyncio.to_thread(
+            auth.create_user,
             email=user.email,
             password=user.password,
             display_name=user.nombre
@@ -595,9 +1382,9 @@ def register_user(user: UserCreate):
         print(f"✅ Usuario creado en Firebase con UID: {fb_user.uid}")
 
         print("Intentando conectar a la BD...")
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             print("✅ Conexión a la BD establecida.")
-            trans = db_conn.begin()
+            trans = await db_conn.begin()
             try:
                 print(f"Insertando usuario en tabla 'usuarios' con UID: {fb_user.uid} y Rol: {user.rol}")
                 query_user = text("""
@@ -605,13 +1392,13 @@ def register_user(user: UserCreate):
                     VALUES (:nombre, :email, :hash, :uid, :rol)
                     RETURNING id
                 """)
-                user_result = db_conn.execute(query_user, {
+                user_result = (await db_conn.execute(query_user, {
                     "nombre": user.nombre,
                     "email": user.email,
                     "hash": "firebase_managed",
                     "uid": fb_user.uid,
                     "rol": user.rol
-                }).fetchone()
+                })).fetchone()
 
                 if not user_result or user_result[0] is None:
                     raise Exception("No se pudo crear el usuario en la BD (INSERT usuarios no devolvió ID).")
@@ -622,12 +1409,12 @@ def register_user(user: UserCreate):
                 if user.rol == 'cuidador':
                     print(f"Insertando config por defecto para usuario_id: {new_user_id}")
                     query_config = text("INSERT INTO configuraciones_alerta (usuario_id) VALUES (:id)")
-                    db_conn.execute(query_config, {"id": new_user_id})
+                    await db_conn.execute(query_config, {"id": new_user_id})
                     print(f"✅ Configuración por defecto insertada.")
                 else:
                     print(f"ℹ️ No se inserta config por defecto para rol: {user.rol}")
 
-                trans.commit()
+                await trans.commit()
                 print(f"✅ Transacción de BD confirmada.")
 
                 # Enviar email de bienvenida
@@ -642,7 +1429,7 @@ def register_user(user: UserCreate):
                             "rol": user.rol
                         }
 
-                        response = requests.post(
+                        response = await http_client.post(
                             f"{email_service_url}/send/bienvenida",
                             json=payload,
                             headers={"X-Internal-Key": internal_api_key},
@@ -662,12 +1449,12 @@ def register_user(user: UserCreate):
             except Exception as e_db:
                 print(f"--- ERROR DURANTE TRANSACCIÓN DE BD ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 print("--- ROLLBACK DE BD REALIZADO ---")
 
                 try:
                     print(f"Iniciando rollback de Firebase para {fb_user.uid}...")
-                    auth.delete_user(fb_user.uid)
+                    await asyncio.to_thread(auth.delete_user, fb_user.uid)
                     print(f"✅ Usuario {fb_user.uid} eliminado de Firebase por rollback.")
                 except Exception as e_fb_delete:
                     print(f"--- ERROR CRÍTICO DURANTE ROLLBACK DE FIREBASE ---")
@@ -693,7 +1480,7 @@ def register_user(user: UserCreate):
         if fb_user and fb_user.uid:
             try:
                 print(f"Rollback de Firebase (general) para {fb_user.uid}...")
-                auth.delete_user(fb_user.uid)
+                await asyncio.to_thread(auth.delete_user, fb_user.uid)
                 print(f"✅ Usuario {fb_user.uid} eliminado de Firebase.")
             except Exception as e_fb_delete:
                 print(f"--- ERROR CRÍTICO DURANTE ROLLBACK (GENERAL) ---")
@@ -703,28 +1490,37 @@ def register_user(user: UserCreate):
              raise e
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado durante el registro: {str(e)}")
 
-@app.get("/usuarios/yo", response_model=CurrentUserInfo)
-def read_users_me(current_user: dict = Depends(get_current_user)):
+async def resolve_user_info(current_user: dict) -> CurrentUserInfo:
+    """
+    Perfil local (usuarios) del token verificado. Sale de user_cache si está vigente;
+    si no, una consulta a la BD que queda en cache USER_CACHE_TTL_SEC.
+    """
     user_uid = current_user.get("uid") 
     if not user_uid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido, UID no encontrado.")
-        
+
+    cached = user_cache.get(user_uid)
+    if cached is not None:
+        return cached
+
     print(f"Buscando perfil para firebase_uid: {user_uid}")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             query = text("""
                 SELECT id, firebase_uid, email, nombre, rol 
                 FROM usuarios 
                 WHERE firebase_uid = :uid
             """)
-            result = db_conn.execute(query, {"uid": user_uid}).fetchone()
+            result = (await db_conn.execute(query, {"uid": user_uid})).fetchone()
             
             if not result:
                 print(f"❌ Usuario con firebase_uid {user_uid} no encontrado en la BD local.")
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado en la base de datos local.")
             
             print(f"✅ Perfil encontrado para {user_uid}, rol: {result._mapping['rol']}")
-            return CurrentUserInfo(**result._mapping) 
+            user_info = CurrentUserInfo(**result._mapping)
+            user_cache.set(user_uid, user_info)
+            return user_info
             
     except HTTPException as http_exc:
          raise http_exc
@@ -733,30 +1529,38 @@ def read_users_me(current_user: dict = Depends(get_current_user)):
         print(f"ERROR: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al obtener datos del usuario: {str(e)}")
 
+async def get_current_user_info(current_user: dict = Depends(get_current_user)) -> CurrentUserInfo:
+    """Dependencia: entrega al endpoint el usuario local ya resuelto (sin abrir conexión si está en cache)"""
+    return await resolve_user_info(current_user)
+
+@app.get("/usuarios/yo", response_model=CurrentUserInfo)
+def read_users_me(user_info: CurrentUserInfo = Depends(get_current_user_info)):
+    return user_info
+
 @app.delete("/usuarios/yo", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user_account(current_user: dict = Depends(get_current_user)):
-    user_uid = current_user.get("uid")
-    user_info = read_users_me(current_user)
+async def delete_user_account(user_info: CurrentUserInfo = Depends(get_current_user_info)):
+    user_uid = user_info.firebase_uid
 
     print(f"Intentando eliminar datos locales para usuario_id: {user_info.id} (firebase_uid: {user_uid})")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 query = text("DELETE FROM usuarios WHERE id = :id AND firebase_uid = :uid")
-                result = db_conn.execute(query, {"id": user_info.id, "uid": user_uid})
+                result = await db_conn.execute(query, {"id": user_info.id, "uid": user_uid})
 
                 if result.rowcount == 0:
                     print(f"❌ No se encontró el usuario local {user_info.id} para eliminar.")
                     pass
 
-                trans.commit()
+                await trans.commit()
+                user_cache.invalidate(user_uid)
                 print(f"✅ Datos locales eliminados para usuario_id: {user_info.id}")
 
             except Exception as e_db:
                 print(f"--- ERROR AL ELIMINAR USUARIO (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD al eliminar usuario: {str(e_db)}")
         return None
     except HTTPException as http_exc:
@@ -767,16 +1571,11 @@ def delete_user_account(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado: {str(e)}")
 
 @app.put("/usuarios/yo", response_model=CurrentUserInfo)
-def update_user_profile(update_data: UserUpdate, current_user: dict = Depends(get_current_user)):
+async def update_user_profile(update_data: UserUpdate, user_info: CurrentUserInfo = Depends(get_current_user_info)):
     """
     Actualiza el perfil del usuario autenticado (nombre).
     """
-    user_uid = current_user.get("uid")
-    if not user_uid:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido, UID no encontrado.")
-
-    # Obtener información actual del usuario
-    user_info = read_users_me(current_user)
+    user_uid = user_info.firebase_uid
 
     # Validar que al menos un campo esté presente
     if update_data.nombre is None:
@@ -785,8 +1584,8 @@ def update_user_profile(update_data: UserUpdate, current_user: dict = Depends(ge
     print(f"Actualizando perfil para usuario_id: {user_info.id} (firebase_uid: {user_uid})")
 
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 # Actualizar nombre en la base de datos
                 query = text("""
@@ -794,29 +1593,30 @@ def update_user_profile(update_data: UserUpdate, current_user: dict = Depends(ge
                     SET nombre = :nombre
                     WHERE id = :id AND firebase_uid = :uid
                 """)
-                result = db_conn.execute(query, {
+                result = await db_conn.execute(query, {
                     "nombre": update_data.nombre.strip(),
                     "id": user_info.id,
                     "uid": user_uid
                 })
 
                 if result.rowcount == 0:
-                    trans.rollback()
+                    await trans.rollback()
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado.")
 
-                trans.commit()
+                await trans.commit()
+                user_cache.invalidate(user_uid)
                 print(f"✅ Perfil actualizado para usuario_id: {user_info.id}")
 
                 # Retornar el perfil actualizado
-                return read_users_me(current_user)
+                return user_info.model_copy(update={"nombre": update_data.nombre.strip()})
 
             except HTTPException as http_exc:
-                trans.rollback()
+                await trans.rollback()
                 raise http_exc
             except Exception as e_db:
                 print(f"--- ERROR AL ACTUALIZAR USUARIO (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD al actualizar usuario: {str(e_db)}")
 
     except HTTPException as http_exc:
@@ -827,22 +1627,17 @@ def update_user_profile(update_data: UserUpdate, current_user: dict = Depends(ge
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado: {str(e)}")
 
 @app.post("/usuarios/push-token", status_code=status.HTTP_200_OK)
-def register_push_token(token_data: PushTokenUpdate, current_user: dict = Depends(get_current_user)):
+async def register_push_token(token_data: PushTokenUpdate, user_info: CurrentUserInfo = Depends(get_current_user_info)):
     """
     Registra o actualiza el token de push notification del usuario autenticado.
     """
-    user_uid = current_user.get("uid")
-    if not user_uid:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido, UID no encontrado.")
-
-    # Obtener información actual del usuario
-    user_info = read_users_me(current_user)
+    user_uid = user_info.firebase_uid
 
     print(f"Registrando push token para usuario_id: {user_info.id} (firebase_uid: {user_uid})")
 
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 # Actualizar push_token en la base de datos
                 query = text("""
@@ -850,28 +1645,28 @@ def register_push_token(token_data: PushTokenUpdate, current_user: dict = Depend
                     SET push_token = :push_token
                     WHERE id = :id AND firebase_uid = :uid
                 """)
-                result = db_conn.execute(query, {
+                result = await db_conn.execute(query, {
                     "push_token": token_data.push_token,
                     "id": user_info.id,
                     "uid": user_uid
                 })
 
                 if result.rowcount == 0:
-                    trans.rollback()
+                    await trans.rollback()
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuario no encontrado.")
 
-                trans.commit()
+                await trans.commit()
                 print(f"✅ Push token registrado para usuario_id: {user_info.id}")
 
                 return {"message": "Push token registrado correctamente", "success": True}
 
             except HTTPException as http_exc:
-                trans.rollback()
+                await trans.rollback()
                 raise http_exc
             except Exception as e_db:
                 print(f"--- ERROR AL REGISTRAR PUSH TOKEN (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD al registrar push token: {str(e_db)}")
 
     except HTTPException as http_exc:
@@ -882,19 +1677,17 @@ def register_push_token(token_data: PushTokenUpdate, current_user: dict = Depend
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado: {str(e)}")
 
 @app.get("/configuracion/") 
-def get_alert_configuration(current_user: dict = Depends(get_current_user)):
-    user_info = read_users_me(current_user)
-
+async def get_alert_configuration(user_info: CurrentUserInfo = Depends(get_current_user_info)):
     print(f"Obteniendo configuración para usuario_id: {user_info.id} (firebase_uid: {user_info.firebase_uid})")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 query = text("""
                     SELECT * FROM configuraciones_alerta
                     WHERE usuario_id = :id
                 """)
-                result = db_conn.execute(query, {"id": user_info.id}).fetchone()
+                result = (await db_conn.execute(query, {"id": user_info.id})).fetchone()
 
                 if not result:
                     print(f"⚠️ Configuración no encontrada para usuario_id {user_info.id}. Creando configuración por defecto...")
@@ -903,16 +1696,16 @@ def get_alert_configuration(current_user: dict = Depends(get_current_user)):
                         VALUES (:id)
                         RETURNING *
                     """)
-                    result = db_conn.execute(query_create, {"id": user_info.id}).fetchone()
-                    trans.commit()
+                    result = (await db_conn.execute(query_create, {"id": user_info.id})).fetchone()
+                    await trans.commit()
                     print(f"✅ Configuración por defecto creada para usuario_id: {user_info.id}")
                 else:
-                    trans.commit()
+                    await trans.commit()
                     print(f"✅ Configuración encontrada para usuario_id: {user_info.id}")
 
                 return dict(result._mapping)
             except Exception as e:
-                trans.rollback()
+                await trans.rollback()
                 raise e
             
     except HTTPException as http_exc:
@@ -923,9 +1716,7 @@ def get_alert_configuration(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en la base de datos al obtener configuración: {str(e)}")
 
 @app.put("/configuracion/")
-def update_alert_configuration(config: AlertConfigUpdate, current_user: dict = Depends(get_current_user)):
-    user_info = read_users_me(current_user) 
-    
+async def update_alert_configuration(config: AlertConfigUpdate, user_info: CurrentUserInfo = Depends(get_current_user_info)):
     update_fields = config.model_dump(exclude_unset=True)
     if not update_fields:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay campos para actualizar")
@@ -941,10 +1732,10 @@ def update_alert_configuration(config: AlertConfigUpdate, current_user: dict = D
 
     print(f"Actualizando configuración para usuario_id: {user_info.id} con campos: {list(update_fields.keys())}")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
-            result = db_conn.execute(query, update_fields).fetchone()
-            trans.commit()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
+            result = (await db_conn.execute(query, update_fields)).fetchone()
+            await trans.commit()
             if not result:
                 print(f"❌ Configuración no encontrada para actualizar (usuario_id {user_info.id}).")
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Configuración no encontrada para el usuario.")
@@ -960,20 +1751,18 @@ def update_alert_configuration(config: AlertConfigUpdate, current_user: dict = D
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error al actualizar en la base de datos: {str(e)}")
 
 @app.get("/eventos-caida", response_model=list[EventoCaidaInfo])
-def get_eventos_caida(
+async def get_eventos_caida(
     skip: int = 0,
     limit: int = 50,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
-
     if user_info.rol not in ['cuidador', 'administrador', 'adulto_mayor']:
         print(f"Acceso denegado a /eventos-caida para usuario {user_info.firebase_uid} con rol {user_info.rol}")
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido para este rol.")
 
     print(f"Obteniendo eventos de caída para usuario_id: {user_info.id} (rol: {user_info.rol}, skip={skip}, limit={limit})")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             # Diferentes queries según el rol del usuario
             if user_info.rol == 'adulto_mayor':
                 # Para adultos mayores: solo sus propios eventos de caída
@@ -1000,11 +1789,11 @@ def get_eventos_caida(
                     LIMIT :limit OFFSET :offset
                 """)
 
-                results = db_conn.execute(query, {
+                results = (await db_conn.execute(query, {
                     "usuario_id": user_info.id,
                     "limit": limit,
                     "offset": skip
-                }).fetchall()
+                })).fetchall()
 
             else:
                 # Para cuidadores y administradores: eventos de sus adultos mayores a cargo
@@ -1032,11 +1821,11 @@ def get_eventos_caida(
                     LIMIT :limit OFFSET :offset
                 """)
 
-                results = db_conn.execute(query, {
+                results = (await db_conn.execute(query, {
                     "cuidador_id": user_info.id,
                     "limit": limit,
                     "offset": skip
-                }).fetchall()
+                })).fetchall()
 
             eventos = []
             for row in results:
@@ -1069,19 +1858,21 @@ async def notificar_evento_caida(
     """
     Endpoint interno para que el procesador YOLO registre una caída detectada.
     Está protegido por un token secreto (X-Internal-Token).
+    Idempotente por idempotency_key: un reintento del outbox del edge (p. ej. tras un timeout
+    de lectura) devuelve la alerta ya registrada sin crear otra ni volver a notificar.
     """
     print(f"🔔 ¡Alerta de Caída Recibida! Dispositivo: {evento.dispositivo_id}")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 # Primero, obtener el adulto_mayor_id asociado al dispositivo
                 query_adulto = text("""
                     SELECT adulto_mayor_id FROM dispositivos WHERE id = :dispositivo_id
                 """)
-                adulto_result = db_conn.execute(query_adulto, {
+                adulto_result = (await db_conn.execute(query_adulto, {
                     "dispositivo_id": evento.dispositivo_id
-                }).fetchone()
+                })).fetchone()
 
                 if not adulto_result or adulto_result[0] is None:
                     raise Exception(f"No se encontró adulto_mayor_id para dispositivo_id={evento.dispositivo_id}")
@@ -1092,248 +1883,103 @@ async def notificar_evento_caida(
                 query_adulto_info = text("""
                     SELECT nombre_completo FROM adultos_mayores WHERE id = :adulto_mayor_id
                 """)
-                adulto_info = db_conn.execute(query_adulto_info, {"adulto_mayor_id": adulto_mayor_id}).fetchone()
+                adulto_info = (await db_conn.execute(query_adulto_info, {"adulto_mayor_id": adulto_mayor_id})).fetchone()
                 nombre_adulto_mayor = adulto_info[0] if adulto_info else "Adulto Mayor"
 
-                # Obtener cuidadores ANTES del commit
-                query_cuidadores = text("""
-                    SELECT DISTINCT u.id, u.push_token
-                    FROM cuidadores_adultos_mayores cam
-                    JOIN usuarios u ON cam.usuario_id = u.id
-                    WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                    AND u.push_token IS NOT NULL
-                """)
-                cuidadores = db_conn.execute(query_cuidadores, {"adulto_mayor_id": adulto_mayor_id}).fetchall()
-
                 # Insertar en la tabla alertas con tipo_alerta='caida'
                 # Incluimos snapshot_url en detalles_adicionales (JSON)
                 detalles = {}
                 if evento.snapshot_url:
                     detalles["snapshot_url"] = evento.snapshot_url
+                variantes = {
+                    nombre: url for nombre, url in (evento.snapshot_variantes or {}).items()
+                    if nombre in SNAPSHOT_VARIANTES and url.startswith("gs://")
+                }
+                if variantes:
+                    detalles["snapshot_variantes"] = variantes
 
                 query = text("""
                     INSERT INTO alertas (
                         adulto_mayor_id, tipo_alerta, dispositivo_id,
                         timestamp_alerta, url_video_almacenado, confirmado_por_cuidador,
-                        detalles_adicionales
+                        detalles_adicionales, idempotency_key
                     )
                     VALUES (
                         :adulto_mayor_id, 'caida', :dispositivo_id,
                         :timestamp_alerta, :url_video_almacenado, NULL,
-                        :detalles_adicionales
+                        :detalles_adicionales, :idempotency_key
                     )
+                    ON CONFLICT (idempotency_key) DO NOTHING
                     RETURNING id
                 """)
-                result = db_conn.execute(query, {
+                result = (await db_conn.execute(query, {
                     "adulto_mayor_id": adulto_mayor_id,
                     "dispositivo_id": evento.dispositivo_id,
-                    "timestamp_alerta": evento.timestamp_caida,
+                    "timestamp_alerta": utc_naive(evento.timestamp_caida),
                     "url_video_almacenado": evento.url_video_almacenado,
-                    "detalles_adicionales": json.dumps(detalles) if detalles else None
-                }).fetchone()
+                    "detalles_adicionales": json.dumps(detalles) if detalles else None,
+                    "idempotency_key": evento.idempotency_key
+                })).fetchone()
+
+                if not result and evento.idempotency_key:
+                    # Reintento de una alerta ya registrada: mismas respuesta y alerta, sin otra fila en el outbox
+                    existente = (await db_conn.execute(text("""
+                        SELECT id FROM alertas WHERE idempotency_key = :idempotency_key
+                    """), {"idempotency_key": evento.idempotency_key})).fetchone()
+                    await trans.commit()
+                    if not existente:
+                        raise Exception("Conflicto de idempotency_key sin alerta existente.")
+                    print(f"ℹ️  Alerta de caída {existente[0]} ya registrada (idempotency_key {evento.idempotency_key}), reintento ignorado")
+                    return {"status": "evento ya registrado", "evento_id": existente[0]}
 
                 if not result:
                     raise Exception("INSERT no devolvió el ID de la alerta de caída.")
 
                 evento_id = result[0]
 
-                trans.commit()
-
-                print(f"✅ Alerta de caída registrada en BD con ID: {evento_id} (adulto_mayor_id: {adulto_mayor_id})")
-
-                # --- LÓGICA DE NOTIFICACIÓN PUSH, WEBSOCKET Y WHATSAPP ---
-                # 1. Obtener nombre del adulto mayor
-                query_nombre = text("""
-                    SELECT nombre_completo FROM adultos_mayores WHERE id = :adulto_mayor_id
-                """)
-                nombre_result = db_conn.execute(query_nombre, {"adulto_mayor_id": adulto_mayor_id}).fetchone()
-                nombre_adulto = nombre_result[0] if nombre_result else "un adulto mayor"
-
-                # 2. Obtener cuidadores y sus tokens push
-                query_cuidadores = text("""
-                    SELECT u.id, u.nombre, u.push_token, ca.notificar_app
-                    FROM usuarios u
-                    INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
-                    LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
-                    WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                      AND u.rol = 'cuidador'
-                """)
-                cuidadores = db_conn.execute(query_cuidadores, {"adulto_mayor_id": adulto_mayor_id}).fetchall()
-
-                # 3. Enviar notificaciones push
-                titulo = "🚨 Alerta de Caída Detectada"
-                mensaje = f"Posible caída detectada para {nombre_adulto}"
-
-                # Usar u.push_token (nueva columna) en lugar de ca.token_fcm_app (obsoleta)
-                # Si notificar_app es None o True, enviar notificación (default True)
-                push_tokens = [c[2] for c in cuidadores if c[2] and (c[3] is None or c[3])]
-                if push_tokens:
-                    try:
-                        expo_push_url = "https://exp.host/--/api/v2/push/send"
-                        push_messages = [
-                            {
-                                "to": token,
-                                "sound": "default",
-                                "title": titulo,
-                                "body": mensaje,
-                                "data": {"tipo": "caida", "alerta_id": evento_id}
-                            }
-                            for token in push_tokens
-                        ]
-                        push_response = requests.post(expo_push_url, json=push_messages, timeout=10)
-                        if push_response.status_code == 200:
-                            print(f"📱 Notificaciones push enviadas a {len(push_tokens)} cuidadores")
-                        else:
-                            print(f"⚠️  Error al enviar push: {push_response.status_code}")
-                    except Exception as push_error:
-                        print(f"⚠️  Error al enviar notificaciones push: {str(push_error)}")
-
-                # 4. Enviar notificación WebSocket
-                try:
-                    websocket_service_url = os.environ.get("WEBSOCKET_SERVICE_URL", "").strip() or None
-                    internal_api_key = os.environ.get("INTERNAL_API_KEY", "").strip()
+                # Notificaciones en la misma transacción; las envía NotificationDispatcher
+                websocket_payload = {
+                    "id": evento_id,
+                    "adulto_mayor_id": adulto_mayor_id,
+                    "tipo_alerta": "caida",
+                    "timestamp_alerta": evento.timestamp_caida.isoformat(),
+                    "nombre_adulto_mayor": nombre_adulto_mayor,
+                    "url_video_almacenado": evento.url_video_almacenado,
+                    "dispositivo_id": evento.dispositivo_id
+                }
+                if evento.snapshot_url:
+                    websocket_payload["snapshot_url"] = evento.snapshot_url
+                if variantes:
+                    websocket_payload["snapshot_variantes"] = variantes
+                await encolar_notificaciones_alerta(db_conn, evento_id, "caida", {
+                    "adulto_mayor_id": adulto_mayor_id,
+                    "nombre_adulto_mayor": nombre_adulto_mayor,
+                    "titulo": "🚨 Alerta de Caída Detectada",
+                    "mensaje": f"Posible caída detectada para {nombre_adulto_mayor}",
+                    "push_data": {"tipo": "caida", "alerta_id": evento_id},
+                    "websocket": websocket_payload,
+                    "whatsapp_tipo": "fall_alert",
+                    "email": {
+                        "tipo": "caida",
+                        "timestamp": evento.timestamp_caida.isoformat(),
+                        "url_video": evento.url_video_almacenado,
+                        "dispositivo_id": evento.dispositivo_id
+                    }
+                })
 
-                    if websocket_service_url:
-                        websocket_payload = {
-                            "id": evento_id,
-                            "adulto_mayor_id": adulto_mayor_id,
-                            "tipo_alerta": "caida",
-                            "timestamp_alerta": evento.timestamp_caida.isoformat(),
-                            "nombre_adulto_mayor": nombre_adulto,
-                            "url_video_almacenado": evento.url_video_almacenado,
-                            "dispositivo_id": evento.dispositivo_id
-                        }
-                        if evento.snapshot_url:
-                            websocket_payload["snapshot_url"] = evento.snapshot_url
-                        ws_response = requests.post(
-                            f"{websocket_service_url}/internal/notify-alert",
-                            json=websocket_payload,
-                            headers={"X-Internal-Key": internal_api_key},
-                            timeout=10
-                        )
-                        if ws_response.status_code == 200:
-                            data = ws_response.json()
-                            print(f"🌐 Notificación WebSocket enviada: {data.get('notified_count', 0)} cuidadores conectados")
-                        else:
-                            print(f"⚠️  WebSocket service error: {ws_response.status_code}")
-                except Exception as ws_error:
-                    print(f"⚠️  Error al enviar notificación WebSocket: {str(ws_error)}")
+                await trans.commit()
 
-                # 5. Enviar notificaciones WhatsApp
-                try:
-                    query_whatsapp = text("""
-                        SELECT u.id, u.nombre, ca.numero_whatsapp
-                        FROM usuarios u
-                        INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
-                        LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
-                        WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                          AND ca.notificar_whatsapp = TRUE
-                          AND ca.numero_whatsapp IS NOT NULL
-                          AND u.rol = 'cuidador'
-                    """)
-                    whatsapp_configs = db_conn.execute(query_whatsapp, {"adulto_mayor_id": adulto_mayor_id}).fetchall()
-
-                    if whatsapp_configs:
-                        whatsapp_service_url = os.environ.get("WHATSAPP_SERVICE_URL", "https://whatsapp-webhook-687053793381.southamerica-west1.run.app").strip()
-                        webhook_api_key = os.environ.get("WEBHOOK_API_KEY", "").strip()
-
-                        whatsapp_success = 0
-                        whatsapp_fail = 0
-                        for config in whatsapp_configs:
-                            phone = config[2]
-                            payload = {
-                                "phone_number": phone,
-                                "notification_type": "fall_alert",  # Actualizado para usar template alertacaidatest
-                                "title": titulo,
-                                "body": mensaje,
-                                "parameters": {
-                                    "nombre_adulto_mayor": nombre_adulto  # Parámetro requerido por el template
-                                }
-                            }
-                            try:
-                                wsp_response = requests.post(
-                                    f"{whatsapp_service_url}/send-notification",
-                                    json=payload,
-                                    headers={"X-API-Key": webhook_api_key},
-                                    timeout=10
-                                )
-                                if wsp_response.status_code == 200:
-                                    whatsapp_success += 1
-                                    print(f"✅ WhatsApp enviado a {phone}")
-                                else:
-                                    whatsapp_fail += 1
-                                    print(f"⚠️  WhatsApp falló para {phone}: {wsp_response.status_code}")
-                            except Exception as wsp_error:
-                                whatsapp_fail += 1
-                                print(f"⚠️  Error WhatsApp para {phone}: {str(wsp_error)}")
-
-                        if whatsapp_success > 0:
-                            print(f"📱 Notificaciones WhatsApp enviadas a {whatsapp_success}/{whatsapp_success + whatsapp_fail} cuidadores")
-                    else:
-                        print(f"ℹ️  No hay cuidadores con WhatsApp habilitado para adulto mayor {adulto_mayor_id}")
-                except Exception as whatsapp_error:
-                    print(f"⚠️  Error al enviar notificaciones WhatsApp: {str(whatsapp_error)}")
-
-                # 6. Enviar notificaciones por Email
-                try:
-                    query_email = text("""
-                        SELECT u.id, u.nombre, u.email, ca.notificar_email, ca.email_secundario
-                        FROM usuarios u
-                        INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
-                        LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
-                        WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                          AND u.rol = 'cuidador'
-                          AND (ca.notificar_email IS NULL OR ca.notificar_email = TRUE)
-                    """)
-                    email_configs = db_conn.execute(query_email, {"adulto_mayor_id": adulto_mayor_id}).fetchall()
-
-                    if email_configs:
-                        # Preparar lista de destinatarios
-                        destinatarios_email = []
-                        for config in email_configs:
-                            nombre_cuidador = config[1]
-                            email_principal = config[2]
-                            email_secundario = config[4]
-
-                            # Usar email secundario si está configurado, sino el principal
-                            email_destino = email_secundario if email_secundario else email_principal
-
-                            if email_destino:
-                                destinatarios_email.append({
-                                    "email": email_destino,
-                                    "name": nombre_cuidador
-                                })
-
-                        if destinatarios_email:
-                            # Convertir timestamp de UTC a timezone de Chile
-                            chile_tz = pytz.timezone('America/Santiago')
-                            if evento.timestamp_caida.tzinfo is None:
-                                timestamp_chile = pytz.utc.localize(evento.timestamp_caida).astimezone(chile_tz)
-                            else:
-                                timestamp_chile = evento.timestamp_caida.astimezone(chile_tz)
-
-                            enviar_email_notificacion(
-                                tipo_notificacion="caida",
-                                destinatarios=destinatarios_email,
-                                adulto_mayor_nombre=nombre_adulto,
-                                timestamp=timestamp_chile,
-                                url_video=evento.url_video_almacenado,
-                                dispositivo_id=evento.dispositivo_id
-                            )
-                        else:
-                            print(f"ℹ️  No hay emails válidos para enviar notificaciones")
-                    else:
-                        print(f"ℹ️  No hay cuidadores con email habilitado para adulto mayor {adulto_mayor_id}")
-                except Exception as email_error:
-                    print(f"⚠️  Error al enviar notificaciones por email: {str(email_error)}")
-
-                return {"status": "evento registrado", "evento_id": evento_id}
+                print(f"✅ Alerta de caída registrada en BD con ID: {evento_id} (adulto_mayor_id: {adulto_mayor_id}), notificaciones encoladas")
 
             except Exception as e_db:
                 print(f"--- ERROR AL REGISTRAR EVENTO DE CAÍDA (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e_db)}")
+
+        # Primer intento de envío con la conexión del endpoint ya devuelta al pool
+        await notification_dispatcher.dispatch_alerta(http_client, evento_id)
+        return {"status": "evento registrado", "evento_id": evento_id}
                 
     except Exception as e:
         print(f"--- ERROR INESPERADO AL NOTIFICAR EVENTO ---")
@@ -1373,6 +2019,40 @@ class CheckCooldownRequest(BaseModel):
     dispositivo_id: int
     adulto_mayor_id: int
 
+class CooldownEstadoRequest(BaseModel):
+    dispositivo_id: int
+    adulto_mayor_id: int
+    version: str | None = None  # Última versión conocida por el edge (None = primera consulta)
+
+# --- Telemetría / heartbeat de dispositivos edge ---
+TELEMETRIA_MAX_MUESTRAS = 500                                                   # Máximo de muestras por lote
+TELEMETRIA_RETENCION_DIAS = int(os.environ.get("TELEMETRIA_RETENCION_DIAS", "14"))
+DISPOSITIVO_INACTIVO_MINUTOS = int(os.environ.get("DISPOSITIVO_INACTIVO_MINUTOS", "15"))  # Sin heartbeat -> 'inactivo'
+_ultima_limpieza_telemetria = datetime.min  # Retención: como mucho una limpieza por hora por instancia
+
+class TelemetriaMuestra(BaseModel):
+    timestamp: datetime
+    fps_inferencia: float | None = None
+    fps_captura: float | None = None
+    latencia_p50_ms: float | None = None
+    latencia_p95_ms: float | None = None
+    latencia_max_ms: float | None = None
+    uptime_seg: int | None = None
+    cola_pendiente: int | None = None
+    temperatura_cpu: float | None = None
+    memoria_rss_mb: float | None = None
+
+class HeartbeatRequest(BaseModel):
+    dispositivo_id: int
+    version_software: constr(max_length=50) | None = None
+    muestras: list[TelemetriaMuestra] = []
+
+    @validator('muestras')
+    def limitar_muestras(cls, v):
+        if len(v) > TELEMETRIA_MAX_MUESTRAS:
+            raise ValueError(f'Máximo {TELEMETRIA_MAX_MUESTRAS} muestras por lote')
+        return v
+
 @app.post("/dispositivos/get-or-create", response_model=DeviceInfo)
 async def get_or_create_device(
     device_info: DeviceHardwareInfo,
@@ -1387,18 +2067,18 @@ async def get_or_create_device(
     print(f"Buscando o creando dispositivo con identificador_hw: {hw_id}")
 
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 # 1. Buscar si el dispositivo ya existe
                 query_find = text("SELECT id, adulto_mayor_id FROM dispositivos WHERE identificador_hw = :hw_id")
-                existing_device = db_conn.execute(query_find, {"hw_id": hw_id}).fetchone()
+                existing_device = (await db_conn.execute(query_find, {"hw_id": hw_id})).fetchone()
 
                 if existing_device:
                     device_id = existing_device[0]
                     adulto_mayor_id = existing_device[1]
                     print(f"✅ Dispositivo encontrado con ID numérico: {device_id}, Adulto Mayor ID: {adulto_mayor_id}")
-                    trans.commit()
+                    await trans.commit()
                     return DeviceInfo(id=device_id, adulto_mayor_id=adulto_mayor_id)
 
                 # 2. Si no existe, crearlo
@@ -1411,10 +2091,10 @@ async def get_or_create_device(
                     VALUES (:nombre, :hw_id)
                     RETURNING id
                 """)
-                new_device_result = db_conn.execute(query_create, {
+                new_device_result = (await db_conn.execute(query_create, {
                     "nombre": nombre_dispositivo,
                     "hw_id": hw_id
-                }).fetchone()
+                })).fetchone()
 
                 if not new_device_result:
                     raise Exception("No se pudo crear el dispositivo en la BD.")
@@ -1422,13 +2102,13 @@ async def get_or_create_device(
                 new_device_id = new_device_result[0]
                 print(f"✅ Nuevo dispositivo creado con ID numérico: {new_device_id}")
 
-                trans.commit()
+                await trans.commit()
                 return DeviceInfo(id=new_device_id, adulto_mayor_id=None)
 
             except Exception as e_db:
                 print(f"--- ERROR DURANTE BÚSQUEDA/CREACIÓN DE DISPOSITIVO ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD al gestionar dispositivo: {str(e_db)}")
 
     except Exception as e:
@@ -1441,22 +2121,20 @@ async def get_or_create_device(
 @app.post("/dispositivos/configurar", response_model=DeviceConfigResponse)
 async def configurar_dispositivo(
     config: DeviceConfigRequest,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
     """
     Endpoint para configurar un dispositivo NanoPi.
     Asocia un dispositivo (por su hardware_id) con un adulto mayor y guarda las credenciales de la cámara.
     """
-    # Obtener información completa del usuario desde la BD
-    user_info = read_users_me(current_user)
 
     print(f"📱 Configurando dispositivo: {config.identificador_hw}")
     print(f"   Adulto Mayor ID: {config.adulto_mayor_id}")
     print(f"   Usuario Cámara: {config.usuario_camara}")
 
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 # 1. Verificar que el adulto mayor existe y pertenece al cuidador
                 user_db_id = user_info.id
@@ -1465,10 +2143,10 @@ async def configurar_dispositivo(
                     JOIN cuidadores_adultos_mayores cam ON am.id = cam.adulto_mayor_id
                     WHERE am.id = :adulto_mayor_id AND cam.usuario_id = :cuidador_id
                 """)
-                adulto_existe = db_conn.execute(verify_query, {
+                adulto_existe = (await db_conn.execute(verify_query, {
                     "adulto_mayor_id": config.adulto_mayor_id,
                     "cuidador_id": user_db_id
-                }).fetchone()
+                })).fetchone()
 
                 if not adulto_existe:
                     raise HTTPException(
@@ -1478,7 +2156,7 @@ async def configurar_dispositivo(
 
                 # 2. Buscar si el dispositivo ya existe
                 find_device = text("SELECT id FROM dispositivos WHERE identificador_hw = :hw_id")
-                existing_device = db_conn.execute(find_device, {"hw_id": config.identificador_hw}).fetchone()
+                existing_device = (await db_conn.execute(find_device, {"hw_id": config.identificador_hw})).fetchone()
 
                 device_id = None
                 if existing_device:
@@ -1494,7 +2172,7 @@ async def configurar_dispositivo(
                             fecha_configuracion = CURRENT_TIMESTAMP
                         WHERE id = :device_id
                     """)
-                    db_conn.execute(update_query, {
+                    await db_conn.execute(update_query, {
                         "adulto_mayor_id": config.adulto_mayor_id,
                         "usuario_camara": config.usuario_camara,
                         "contrasena": config.contrasena_camara,  # TODO: Encriptar en producción
@@ -1512,20 +2190,20 @@ async def configurar_dispositivo(
                         VALUES (:nombre, :hw_id, :adulto_mayor_id, :usuario_camara, :contrasena, CURRENT_TIMESTAMP)
                         RETURNING id
                     """)
-                    result = db_conn.execute(create_query, {
+                    result = (await db_conn.execute(create_query, {
                         "nombre": nombre_dispositivo,
                         "hw_id": config.identificador_hw,
                         "adulto_mayor_id": config.adulto_mayor_id,
                         "usuario_camara": config.usuario_camara,
                         "contrasena": config.contrasena_camara  # TODO: Encriptar en producción
-                    }).fetchone()
+                    })).fetchone()
 
                     if not result:
                         raise Exception("No se pudo crear el dispositivo")
 
                     device_id = result[0]
 
-                trans.commit()
+                await trans.commit()
                 print(f"✅ Dispositivo configurado exitosamente. ID: {device_id}")
 
                 return DeviceConfigResponse(
@@ -1535,10 +2213,10 @@ async def configurar_dispositivo(
                 )
 
             except HTTPException:
-                trans.rollback()
+                await trans.rollback()
                 raise
             except Exception as e:
-                trans.rollback()
+                await trans.rollback()
                 print(f"❌ Error configurando dispositivo: {str(e)}")
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1557,19 +2235,17 @@ async def configurar_dispositivo(
 @app.get("/dispositivos/adulto-mayor/{adulto_mayor_id}", response_model=DeviceDetailsResponse | None)
 async def get_dispositivo_by_adulto_mayor(
     adulto_mayor_id: int,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
     """
     Obtiene el dispositivo NanoPi asociado a un adulto mayor.
     Retorna None si no hay dispositivo configurado.
     """
-    # Obtener información completa del usuario desde la BD
-    user_info = read_users_me(current_user)
 
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             # Verificar que el cuidador tiene acceso a este adulto mayor
-            check_caregiver_relationship(db_conn, user_info.id, adulto_mayor_id)
+            await check_caregiver_relationship(db_conn, user_info.id, adulto_mayor_id)
 
             # Buscar el dispositivo asociado
             query = text("""
@@ -1577,7 +2253,7 @@ async def get_dispositivo_by_adulto_mayor(
                 FROM dispositivos
                 WHERE adulto_mayor_id = :adulto_mayor_id
             """)
-            result = db_conn.execute(query, {"adulto_mayor_id": adulto_mayor_id}).fetchone()
+            result = (await db_conn.execute(query, {"adulto_mayor_id": adulto_mayor_id})).fetchone()
 
             if not result:
                 return None
@@ -1602,39 +2278,38 @@ async def get_dispositivo_by_adulto_mayor(
 
 
 # --- Helper function to check caregiver relationship ---
-def check_caregiver_relationship(db_conn, cuidador_id: int, adulto_mayor_id: int):
+async def check_caregiver_relationship(db_conn, cuidador_id: int, adulto_mayor_id: int):
     """Verifica si el cuidador está vinculado al adulto mayor."""
     query = text("""
         SELECT 1 FROM cuidadores_adultos_mayores
         WHERE usuario_id = :cuidador_id AND adulto_mayor_id = :adulto_mayor_id
     """)
-    result = db_conn.execute(query, {"cuidador_id": cuidador_id, "adulto_mayor_id": adulto_mayor_id}).fetchone()
+    result = (await db_conn.execute(query, {"cuidador_id": cuidador_id, "adulto_mayor_id": adulto_mayor_id})).fetchone()
     if not result:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permiso para gestionar recordatorios para esta persona.")
 
 @app.post("/recordatorios", response_model=RecordatorioInfo, status_code=status.HTTP_201_CREATED)
-def create_recordatorio(
+async def create_recordatorio(
     recordatorio_data: RecordatorioCreate, 
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     if user_info.rol not in ['cuidador', 'administrador', 'adulto_mayor']:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido.")
 
     print(f"Intentando crear recordatorio para adulto_mayor_id: {recordatorio_data.adulto_mayor_id} por usuario_id: {user_info.id} (rol: {user_info.rol})")
     
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 if user_info.rol == 'cuidador':
-                    check_caregiver_relationship(db_conn, user_info.id, recordatorio_data.adulto_mayor_id)
+                    await check_caregiver_relationship(db_conn, user_info.id, recordatorio_data.adulto_mayor_id)
                 elif user_info.rol == 'adulto_mayor':
                     query_check = text("SELECT id FROM adultos_mayores WHERE id = :adulto_mayor_id AND usuario_id = :usuario_id")
-                    result_check = db_conn.execute(query_check, {
+                    result_check = (await db_conn.execute(query_check, {
                         "adulto_mayor_id": recordatorio_data.adulto_mayor_id,
                         "usuario_id": user_info.id
-                    }).fetchone()
+                    })).fetchone()
                     if not result_check:
                         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No puedes crear recordatorios para otros usuarios.")
                 
@@ -1644,12 +2319,14 @@ def create_recordatorio(
                     RETURNING id, adulto_mayor_id, titulo, descripcion, fecha_hora_programada, frecuencia, estado, tipo_recordatorio, dias_semana, fecha_creacion
                 """)
                 
-                result = db_conn.execute(query, recordatorio_data.model_dump()).fetchone()
+                params = recordatorio_data.model_dump()
+                params["fecha_hora_programada"] = utc_naive(params["fecha_hora_programada"])
+                result = (await db_conn.execute(query, params)).fetchone()
                 
                 if not result:
                      raise Exception("INSERT no devolvió el recordatorio creado.")
                 
-                trans.commit()
+                await trans.commit()
 
                 recordatorio_creado = RecordatorioInfo(**result._mapping)
                 print(f"✅ Recordatorio creado con ID: {recordatorio_creado.id}")
@@ -1661,7 +2338,7 @@ def create_recordatorio(
 
                     # Obtener nombre del adulto mayor para el mensaje
                     query_nombre = text("SELECT nombre_completo FROM adultos_mayores WHERE id = :adulto_mayor_id")
-                    nombre_result = db_conn.execute(query_nombre, {"adulto_mayor_id": recordatorio_creado.adulto_mayor_id}).fetchone()
+                    nombre_result = (await db_conn.execute(query_nombre, {"adulto_mayor_id": recordatorio_creado.adulto_mayor_id})).fetchone()
                     nombre_adulto_mayor = nombre_result[0] if nombre_result else "Adulto Mayor"
 
                     recordatorio_dict = {
@@ -1675,7 +2352,7 @@ def create_recordatorio(
                         "nombre_adulto_mayor": nombre_adulto_mayor
                     }
 
-                    ws_response = requests.post(
+                    ws_response = await http_client.post(
                         f"{websocket_url}/internal/notify-recordatorio",
                         json=recordatorio_dict,
                         headers={"X-Internal-Key": internal_key},
@@ -1688,9 +2365,9 @@ def create_recordatorio(
                     else:
                         print(f"⚠️  WebSocket service respondió con código {ws_response.status_code}")
 
-                except requests.exceptions.Timeout:
+                except httpx.TimeoutException:
                     print(f"⚠️  Timeout al contactar servicio WebSocket (recordatorio creado exitosamente)")
-                except requests.exceptions.RequestException as ws_error:
+                except httpx.HTTPError as ws_error:
                     print(f"⚠️  Error al notificar via WebSocket (recordatorio creado exitosamente): {str(ws_error)}")
                 except Exception as ws_error:
                     print(f"⚠️  Error inesperado al notificar via WebSocket: {str(ws_error)}")
@@ -1700,7 +2377,7 @@ def create_recordatorio(
             except Exception as e_db:
                 print(f"--- ERROR AL CREAR RECORDATORIO (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 
                 if isinstance(e_db, HTTPException):
                     raise e_db
@@ -1716,17 +2393,15 @@ def create_recordatorio(
 
 
 @app.get("/recordatorios", response_model=list[RecordatorioInfo])
-def get_recordatorios(
+async def get_recordatorios(
     adulto_mayor_id: int | None = None,
     skip: int = 0,
     limit: int = 100,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
-
     print(f"Obteniendo recordatorios para usuario_id: {user_info.id}, rol: {user_info.rol}, filtro adulto_mayor_id: {adulto_mayor_id}")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             select_clause = """
                 SELECT r.id, r.adulto_mayor_id, r.titulo, r.descripcion, r.fecha_hora_programada, r.frecuencia, r.estado, r.tipo_recordatorio, r.dias_semana, r.fecha_creacion, am.nombre_completo as nombre_adulto_mayor,
                        CASE WHEN av.id IS NOT NULL THEN TRUE ELSE FALSE END as vista
@@ -1738,7 +2413,7 @@ def get_recordatorios(
 
             if user_info.rol in ['cuidador', 'administrador']:
                 if adulto_mayor_id is not None:
-                    check_caregiver_relationship(db_conn, user_info.id, adulto_mayor_id)
+                    await check_caregiver_relationship(db_conn, user_info.id, adulto_mayor_id)
                     where_clauses.append("r.adulto_mayor_id = :adulto_mayor_id")
                     params["adulto_mayor_id"] = adulto_mayor_id
                 else:
@@ -1751,7 +2426,7 @@ def get_recordatorios(
 
             elif user_info.rol == 'adulto_mayor':
                 query_am = text("SELECT id FROM adultos_mayores WHERE usuario_id = :usuario_id")
-                am_result = db_conn.execute(query_am, {"usuario_id": user_info.id}).fetchone()
+                am_result = (await db_conn.execute(query_am, {"usuario_id": user_info.id})).fetchone()
 
                 if not am_result:
                     print(f"❌ Usuario {user_info.id} es adulto_mayor pero no tiene registro en tabla adultos_mayores")
@@ -1777,7 +2452,7 @@ def get_recordatorios(
             """
             query = text(query_sql)
 
-            results = db_conn.execute(query, params).fetchall()
+            results = (await db_conn.execute(query, params)).fetchall()
             print(f"✅ Encontrados {len(results)} recordatorios.")
 
             # Debug: Log first result to verify 'vista' field
@@ -1796,12 +2471,11 @@ def get_recordatorios(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e)}")
 
 @app.put("/recordatorios/{recordatorio_id}", response_model=RecordatorioInfo)
-def update_recordatorio(
+async def update_recordatorio(
     recordatorio_id: int,
     recordatorio_data: RecordatorioUpdate,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     if user_info.rol not in ['cuidador', 'administrador', 'adulto_mayor']:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido.")
 
@@ -1809,6 +2483,9 @@ def update_recordatorio(
     if not update_fields:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No hay campos para actualizar")
 
+    if "fecha_hora_programada" in update_fields:
+        update_fields["fecha_hora_programada"] = utc_naive(update_fields["fecha_hora_programada"])
+
     set_clause = ", ".join([f"{key} = :{key}" for key in update_fields.keys()])
     params = {**update_fields, "recordatorio_id": recordatorio_id, "usuario_id": user_info.id}
 
@@ -1844,14 +2521,14 @@ def update_recordatorio(
 
     print(f"Intentando actualizar recordatorio id: {recordatorio_id} por usuario_id: {user_info.id} (rol: {user_info.rol})")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
-            result = db_conn.execute(query, params).fetchone()
-            trans.commit()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
+            result = (await db_conn.execute(query, params)).fetchone()
+            await trans.commit()
 
             if not result:
                 check_exists_query = text("SELECT adulto_mayor_id FROM recordatorios WHERE id = :id")
-                exists = db_conn.execute(check_exists_query, {"id": recordatorio_id}).fetchone()
+                exists = (await db_conn.execute(check_exists_query, {"id": recordatorio_id})).fetchone()
                 if exists:
                     print(f"❌ Intento de actualizar recordatorio {recordatorio_id} por cuidador {user_info.id} sin permiso.")
                     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permiso para modificar este recordatorio.")
@@ -1871,11 +2548,10 @@ def update_recordatorio(
 
 
 @app.delete("/recordatorios/{recordatorio_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_recordatorio(
+async def delete_recordatorio(
     recordatorio_id: int,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     if user_info.rol not in ['cuidador', 'administrador', 'adulto_mayor']:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido.")
 
@@ -1910,14 +2586,14 @@ def delete_recordatorio(
 
     print(f"Intentando eliminar recordatorio id: {recordatorio_id} por usuario_id: {user_info.id} (rol: {user_info.rol})")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
-            result = db_conn.execute(query, params).fetchone()
-            trans.commit()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
+            result = (await db_conn.execute(query, params)).fetchone()
+            await trans.commit()
 
             if not result:
                 check_exists_query = text("SELECT adulto_mayor_id FROM recordatorios WHERE id = :id")
-                exists = db_conn.execute(check_exists_query, {"id": recordatorio_id}).fetchone()
+                exists = (await db_conn.execute(check_exists_query, {"id": recordatorio_id})).fetchone()
                 if exists:
                     print(f"❌ Intento de eliminar recordatorio {recordatorio_id} por cuidador {user_info.id} sin permiso.")
                     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permiso para eliminar este recordatorio.")
@@ -1947,10 +2623,10 @@ async def procesar_recordatorios_pendientes(
     """
     print("🔔 Iniciando procesamiento de recordatorios pendientes...")
 
-    with engine.connect() as db_conn:
+    async with engine.connect() as db_conn:
         # DEBUG: Ver ventana de tiempo actual
         debug_query = text("SELECT NOW() as ahora, NOW() - INTERVAL '2 minutes' as hace_2min")
-        debug_result = db_conn.execute(debug_query).fetchone()
+        debug_result = (await db_conn.execute(debug_query)).fetchone()
         print(f"⏰ Ventana de tiempo: {debug_result.hace_2min} a {debug_result.ahora}")
 
         # DEBUG: Ver todos los recordatorios sin filtros de tiempo
@@ -1961,7 +2637,7 @@ async def procesar_recordatorios_pendientes(
             ORDER BY r.fecha_hora_programada DESC
             LIMIT 5
         """)
-        all_pending = db_conn.execute(debug_all).fetchall()
+        all_pending = (await db_conn.execute(debug_all)).fetchall()
         print(f"📝 Total recordatorios con estado='pendiente': {len(all_pending)}")
         for rec in all_pending:
             print(f"   - ID {rec.id}: {rec.titulo} @ {rec.fecha_hora_programada}")
@@ -1980,7 +2656,7 @@ async def procesar_recordatorios_pendientes(
             ORDER BY r.fecha_hora_programada ASC
         """)
 
-        recordatorios_pendientes = db_conn.execute(query).fetchall()
+        recordatorios_pendientes = (await db_conn.execute(query)).fetchall()
         print(f"📋 Encontrados {len(recordatorios_pendientes)} recordatorios pendientes en ventana de tiempo")
 
         if not recordatorios_pendientes:
@@ -2016,7 +2692,7 @@ async def procesar_recordatorios_pendientes(
                     WHERE cam.adulto_mayor_id = :adulto_mayor_id
                       AND u.rol = 'cuidador'
                 """)
-                cuidadores = db_conn.execute(query_cuidadores, {"adulto_mayor_id": adulto_mayor_id}).fetchall()
+                cuidadores = (await db_conn.execute(query_cuidadores, {"adulto_mayor_id": adulto_mayor_id})).fetchall()
 
                 if not cuidadores:
                     print(f"⚠️  No hay cuidadores para adulto mayor {adulto_mayor_id}")
@@ -2041,7 +2717,7 @@ async def procesar_recordatorios_pendientes(
                                 },
                                 token=cuidador.push_token
                             )
-                            messaging.send(message)
+                            await asyncio.to_thread(messaging.send, message)
                             push_count += 1
                             print(f"✅ Push enviado a {cuidador.nombre} ({cuidador.email})")
                         except Exception as push_error:
@@ -2061,7 +2737,7 @@ async def procesar_recordatorios_pendientes(
                       AND u.rol = 'cuidador'
                       AND (ca.notificar_email IS NULL OR ca.notificar_email = TRUE)
                 """)
-                cuidadores_email = db_conn.execute(query_email_cuidadores, {"adulto_mayor_id": adulto_mayor_id}).fetchall()
+                cuidadores_email = (await db_conn.execute(query_email_cuidadores, {"adulto_mayor_id": adulto_mayor_id})).fetchall()
 
                 # 3b. Obtener email del adulto mayor (a traves de su usuario asociado)
                 # Solo si tiene notificar_email habilitado en sus preferencias
@@ -2074,7 +2750,7 @@ async def procesar_recordatorios_pendientes(
                       AND u.email IS NOT NULL
                       AND (ca.notificar_email IS NULL OR ca.notificar_email = TRUE)
                 """)
-                adulto_mayor_user = db_conn.execute(query_email_am, {"adulto_mayor_id": adulto_mayor_id}).fetchone()
+                adulto_mayor_user = (await db_conn.execute(query_email_am, {"adulto_mayor_id": adulto_mayor_id})).fetchone()
 
                 # Preparar lista de destinatarios
                 destinatarios_email = []
@@ -2109,7 +2785,7 @@ async def procesar_recordatorios_pendientes(
                         fecha_hora_chile = fecha_hora_programada.astimezone(chile_tz)
 
                     # Usar el servicio de email (api-email)
-                    email_result = enviar_email_notificacion(
+                    email_result = await enviar_email_notificacion(
                         tipo_notificacion="recordatorio",
                         destinatarios=destinatarios_email,
                         adulto_mayor_nombre=nombre_adulto_mayor,
@@ -2156,7 +2832,7 @@ async def procesar_recordatorios_pendientes(
                         "nombre_adulto_mayor": nombre_adulto_mayor
                     }
 
-                    ws_response = requests.post(
+                    ws_response = await http_client.post(
                         f"{websocket_url}/internal/notify-recordatorio",
                         json=recordatorio_dict,
                         headers={"X-Internal-Key": internal_key},
@@ -2179,8 +2855,8 @@ async def procesar_recordatorios_pendientes(
                         SET estado = 'enviado'
                         WHERE id = :recordatorio_id
                     """)
-                    db_conn.execute(update_query, {"recordatorio_id": recordatorio_id})
-                    db_conn.commit()
+                    await db_conn.execute(update_query, {"recordatorio_id": recordatorio_id})
+                    await db_conn.commit()
                     print(f"✅ Recordatorio {recordatorio_id} marcado como enviado")
                 else:
                     # Calcular próxima fecha según frecuencia
@@ -2201,11 +2877,11 @@ async def procesar_recordatorios_pendientes(
                         SET fecha_hora_programada = :proxima_fecha
                         WHERE id = :recordatorio_id
                     """)
-                    db_conn.execute(update_query, {
+                    await db_conn.execute(update_query, {
                         "recordatorio_id": recordatorio_id,
                         "proxima_fecha": proxima_fecha
                     })
-                    db_conn.commit()
+                    await db_conn.commit()
                     print(f"✅ Recordatorio {recordatorio_id} reprogramado para {proxima_fecha}")
 
                 recordatorios_procesados += 1
@@ -2225,11 +2901,10 @@ async def procesar_recordatorios_pendientes(
 
 # --- ENDPOINTS DE SOLICITUDES DE CUIDADO ---
 @app.post("/solicitudes-cuidado", response_model=SolicitudCuidadoInfo, status_code=status.HTTP_201_CREATED)
-def crear_solicitud_cuidado(
+async def crear_solicitud_cuidado(
     solicitud_data: SolicitudCuidadoCreate,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     if user_info.rol != 'cuidador':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo los cuidadores pueden enviar solicitudes de cuidado.")
     if solicitud_data.email_destinatario.lower() == user_info.email.lower():
@@ -2237,11 +2912,11 @@ def crear_solicitud_cuidado(
 
     print(f"Cuidador {user_info.id} ({user_info.email}) enviando solicitud a {solicitud_data.email_destinatario}")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 query_check_user = text("SELECT id FROM usuarios WHERE email = :email")
-                destinatario = db_conn.execute(query_check_user, {"email": solicitud_data.email_destinatario}).fetchone()
+                destinatario = (await db_conn.execute(query_check_user, {"email": solicitud_data.email_destinatario})).fetchone()
                 destinatario_id = destinatario[0] if destinatario else None
 
                 if destinatario_id:
@@ -2251,12 +2926,12 @@ def crear_solicitud_cuidado(
                         AND usuario_destinatario_id = :destinatario_id
                         AND estado = 'pendiente'
                     """)
-                    existing = db_conn.execute(query_check_existing, {
+                    existing = (await db_conn.execute(query_check_existing, {
                         "cuidador_id": user_info.id,
                         "destinatario_id": destinatario_id
-                    }).fetchone()
+                    })).fetchone()
                     if existing:
-                        trans.rollback()
+                        await trans.rollback()
                         raise HTTPException(
                             status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Ya existe una solicitud pendiente para este usuario."
@@ -2268,18 +2943,18 @@ def crear_solicitud_cuidado(
                     VALUES (:cuidador_id, :email, :destinatario_id, :mensaje, 'pendiente')
                     RETURNING id, cuidador_id, email_destinatario, usuario_destinatario_id, estado, mensaje, fecha_solicitud, fecha_respuesta
                 """)
-                result = db_conn.execute(query, {
+                result = (await db_conn.execute(query, {
                     "cuidador_id": user_info.id,
                     "email": solicitud_data.email_destinatario,
                     "destinatario_id": destinatario_id,
                     "mensaje": solicitud_data.mensaje
-                }).fetchone()
+                })).fetchone()
 
                 if not result:
-                    trans.rollback()
+                    await trans.rollback()
                     raise Exception("INSERT no devolvió la solicitud creada.")
 
-                trans.commit()
+                await trans.commit()
                 print(f"✅ Solicitud creada con ID: {result._mapping['id']}")
                 response_data = dict(result._mapping)
                 response_data['nombre_cuidador'] = user_info.nombre
@@ -2287,12 +2962,12 @@ def crear_solicitud_cuidado(
                 return SolicitudCuidadoInfo(**response_data)
 
             except HTTPException as http_exc:
-                trans.rollback()
+                await trans.rollback()
                 raise http_exc
             except Exception as e_db:
                 print(f"--- ERROR AL CREAR SOLICITUD (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e_db)}")
     except HTTPException as http_exc:
         raise http_exc
@@ -2302,11 +2977,10 @@ def crear_solicitud_cuidado(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado: {str(e)}")
 
 @app.get("/solicitudes-cuidado/recibidas", response_model=list[SolicitudCuidadoInfo])
-def obtener_solicitudes_recibidas(current_user: dict = Depends(get_current_user)):
-    user_info = read_users_me(current_user)
+async def obtener_solicitudes_recibidas(user_info: CurrentUserInfo = Depends(get_current_user_info)):
     print(f"Obteniendo solicitudes recibidas para usuario {user_info.id}")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             query = text("""
                 SELECT
                     sc.id, sc.cuidador_id, sc.email_destinatario,
@@ -2319,7 +2993,7 @@ def obtener_solicitudes_recibidas(current_user: dict = Depends(get_current_user)
                 WHERE sc.usuario_destinatario_id = :user_id
                 ORDER BY sc.fecha_solicitud DESC
             """)
-            results = db_conn.execute(query, {"user_id": user_info.id}).fetchall()
+            results = (await db_conn.execute(query, {"user_id": user_info.id})).fetchall()
             print(f"✅ Encontradas {len(results)} solicitudes recibidas.")
             solicitudes = [SolicitudCuidadoInfo(**row._mapping) for row in results]
             return solicitudes
@@ -2329,13 +3003,12 @@ def obtener_solicitudes_recibidas(current_user: dict = Depends(get_current_user)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e)}")
 
 @app.get("/solicitudes-cuidado/enviadas", response_model=list[SolicitudCuidadoInfo])
-def obtener_solicitudes_enviadas(current_user: dict = Depends(get_current_user)):
-    user_info = read_users_me(current_user)
+async def obtener_solicitudes_enviadas(user_info: CurrentUserInfo = Depends(get_current_user_info)):
     if user_info.rol != 'cuidador':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo los cuidadores pueden ver solicitudes enviadas.")
     print(f"Obteniendo solicitudes enviadas por cuidador {user_info.id}")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             query = text("""
                 SELECT
                     sc.id, sc.cuidador_id, sc.email_destinatario,
@@ -2348,7 +3021,7 @@ def obtener_solicitudes_enviadas(current_user: dict = Depends(get_current_user))
                 WHERE sc.cuidador_id = :cuidador_id
                 ORDER BY sc.fecha_solicitud DESC
             """)
-            results = db_conn.execute(query, {"cuidador_id": user_info.id}).fetchall()
+            results = (await db_conn.execute(query, {"cuidador_id": user_info.id})).fetchall()
             print(f"✅ Encontradas {len(results)} solicitudes enviadas.")
             solicitudes = [SolicitudCuidadoInfo(**row._mapping) for row in results]
             return solicitudes
@@ -2358,22 +3031,21 @@ def obtener_solicitudes_enviadas(current_user: dict = Depends(get_current_user))
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e)}")
 
 @app.put("/solicitudes-cuidado/{solicitud_id}/aceptar", response_model=SolicitudCuidadoInfo)
-def aceptar_solicitud_cuidado(
+async def aceptar_solicitud_cuidado(
     solicitud_id: int,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     print(f"Usuario {user_info.id} intentando aceptar solicitud {solicitud_id}")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 query_check = text("""
                     SELECT cuidador_id, usuario_destinatario_id, estado
                     FROM solicitudes_cuidado
                     WHERE id = :id
                 """)
-                solicitud = db_conn.execute(query_check, {"id": solicitud_id}).fetchone()
+                solicitud = (await db_conn.execute(query_check, {"id": solicitud_id})).fetchone()
 
                 if not solicitud:
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Solicitud no encontrada.")
@@ -2389,11 +3061,11 @@ def aceptar_solicitud_cuidado(
                     SET rol = 'adulto_mayor'
                     WHERE id = :id
                 """)
-                db_conn.execute(query_update_rol, {"id": user_info.id})
+                await db_conn.execute(query_update_rol, {"id": user_info.id})
                 print(f"✅ Rol actualizado a 'adulto_mayor' para usuario {user_info.id}")
 
                 query_check_am = text("SELECT id FROM adultos_mayores WHERE usuario_id = :id")
-                am_exists = db_conn.execute(query_check_am, {"id": user_info.id}).fetchone()
+                am_exists = (await db_conn.execute(query_check_am, {"id": user_info.id})).fetchone()
 
                 if am_exists:
                     adulto_mayor_id = am_exists[0]
@@ -2404,10 +3076,10 @@ def aceptar_solicitud_cuidado(
                         VALUES (:usuario_id, :nombre)
                         RETURNING id
                     """)
-                    am_result = db_conn.execute(query_create_am, {
+                    am_result = (await db_conn.execute(query_create_am, {
                         "usuario_id": user_info.id,
                         "nombre": user_info.nombre
-                    }).fetchone()
+                    })).fetchone()
                     adulto_mayor_id = am_result[0]
                     print(f"✅ Registro de adulto mayor creado con ID: {adulto_mayor_id}")
 
@@ -2416,14 +3088,14 @@ def aceptar_solicitud_cuidado(
                     VALUES (:cuidador_id, :adulto_mayor_id)
                     ON CONFLICT (usuario_id, adulto_mayor_id) DO NOTHING
                 """)
-                db_conn.execute(query_create_relation, {
+                await db_conn.execute(query_create_relation, {
                     "cuidador_id": cuidador_id,
                     "adulto_mayor_id": adulto_mayor_id
                 })
                 print(f"✅ Relación creada: cuidador {cuidador_id} -> adulto mayor {adulto_mayor_id}")
 
                 query_cuidador = text("SELECT nombre, email FROM usuarios WHERE id = :id")
-                cuidador_info = db_conn.execute(query_cuidador, {"id": cuidador_id}).fetchone()
+                cuidador_info = (await db_conn.execute(query_cuidador, {"id": cuidador_id})).fetchone()
 
                 query_update_solicitud = text("""
                     UPDATE solicitudes_cuidado
@@ -2432,9 +3104,10 @@ def aceptar_solicitud_cuidado(
                     RETURNING id, cuidador_id, email_destinatario, usuario_destinatario_id,
                               estado, mensaje, fecha_solicitud, fecha_respuesta
                 """)
-                result = db_conn.execute(query_update_solicitud, {"id": solicitud_id}).fetchone()
+                result = (await db_conn.execute(query_update_solicitud, {"id": solicitud_id})).fetchone()
 
-                trans.commit()
+                await trans.commit()
+                user_cache.invalidate(user_info.firebase_uid)  # Nuevo rol visible en la próxima petición
                 print(f"✅ Solicitud {solicitud_id} aceptada exitosamente")
 
                 response_data = dict(result._mapping)
@@ -2443,12 +3116,12 @@ def aceptar_solicitud_cuidado(
                 return SolicitudCuidadoInfo(**response_data)
 
             except HTTPException as http_exc:
-                trans.rollback()
+                await trans.rollback()
                 raise http_exc
             except Exception as e_db:
                 print(f"--- ERROR AL ACEPTAR SOLICITUD (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e_db)}")
     except HTTPException as http_exc:
         raise http_exc
@@ -2458,22 +3131,21 @@ def aceptar_solicitud_cuidado(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error inesperado: {str(e)}")
 
 @app.put("/solicitudes-cuidado/{solicitud_id}/rechazar", response_model=SolicitudCuidadoInfo)
-def rechazar_solicitud_cuidado(
+async def rechazar_solicitud_cuidado(
     solicitud_id: int,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     print(f"Usuario {user_info.id} intentando rechazar solicitud {solicitud_id}")
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 query_check = text("""
                     SELECT cuidador_id, usuario_destinatario_id, estado
                     FROM solicitudes_cuidado
                     WHERE id = :id
                 """)
-                solicitud = db_conn.execute(query_check, {"id": solicitud_id}).fetchone()
+                solicitud = (await db_conn.execute(query_check, {"id": solicitud_id})).fetchone()
 
                 if not solicitud:
                     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Solicitud no encontrada.")
@@ -2485,7 +3157,7 @@ def rechazar_solicitud_cuidado(
                 cuidador_id = solicitud._mapping['cuidador_id']
 
                 query_cuidador = text("SELECT nombre, email FROM usuarios WHERE id = :id")
-                cuidador_info = db_conn.execute(query_cuidador, {"id": cuidador_id}).fetchone()
+                cuidador_info = (await db_conn.execute(query_cuidador, {"id": cuidador_id})).fetchone()
 
                 query_update = text("""
                     UPDATE solicitudes_cuidado
@@ -2494,9 +3166,9 @@ def rechazar_solicitud_cuidado(
                     RETURNING id, cuidador_id, email_destinatario, usuario_destinatario_id,
                               estado, mensaje, fecha_solicitud, fecha_respuesta
                 """)
-                result = db_conn.execute(query_update, {"id": solicitud_id}).fetchone()
+                result = (await db_conn.execute(query_update, {"id": solicitud_id})).fetchone()
 
-                trans.commit()
+                await trans.commit()
                 print(f"✅ Solicitud {solicitud_id} rechazada")
 
                 response_data = dict(result._mapping)
@@ -2505,12 +3177,12 @@ def rechazar_solicitud_cuidado(
                 return SolicitudCuidadoInfo(**response_data)
 
             except HTTPException as http_exc:
-                trans.rollback()
+                await trans.rollback()
                 raise http_exc
             except Exception as e_db:
                 print(f"--- ERROR AL RECHAZAR SOLICITUD (DB) ---")
                 print(f"ERROR: {str(e_db)}")
-                trans.rollback()
+                await trans.rollback()
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e_db)}")
     except HTTPException as http_exc:
         raise http_exc
@@ -2521,14 +3193,13 @@ def rechazar_solicitud_cuidado(
 
 # --- ENDPOINTS: /adultos-mayores ---
 @app.get("/adultos-mayores", response_model=list[AdultoMayorInfo])
-def obtener_adultos_mayores(current_user: dict = Depends(get_current_user)):
-    user_info = read_users_me(current_user)
+async def obtener_adultos_mayores(user_info: CurrentUserInfo = Depends(get_current_user_info)):
     if user_info.rol not in ['cuidador', 'administrador']:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido.")
 
     print(f"Obteniendo adultos mayores para cuidador {user_info.id}")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             query = text("""
                 SELECT am.*
                 FROM adultos_mayores am
@@ -2536,7 +3207,7 @@ def obtener_adultos_mayores(current_user: dict = Depends(get_current_user)):
                 WHERE cam.usuario_id = :cuidador_id
                 ORDER BY am.nombre_completo ASC
             """)
-            results = db_conn.execute(query, {"cuidador_id": user_info.id}).fetchall()
+            results = (await db_conn.execute(query, {"cuidador_id": user_info.id})).fetchall()
             print(f"✅ Encontrados {len(results)} adultos mayores.")
             adultos = [AdultoMayorInfo(**row._mapping) for row in results]
             return adultos
@@ -2546,16 +3217,15 @@ def obtener_adultos_mayores(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e)}")
 
 @app.get("/adultos-mayores/mi-perfil", response_model=AdultoMayorInfo)
-def obtener_mi_perfil_adulto_mayor(current_user: dict = Depends(get_current_user)):
-    user_info = read_users_me(current_user)
+async def obtener_mi_perfil_adulto_mayor(user_info: CurrentUserInfo = Depends(get_current_user_info)):
     if user_info.rol != 'adulto_mayor':
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Este endpoint es solo para adultos mayores.")
 
     print(f"Obteniendo perfil de adulto mayor para usuario_id: {user_info.id}")
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             query = text("SELECT * FROM adultos_mayores WHERE usuario_id = :usuario_id")
-            result = db_conn.execute(query, {"usuario_id": user_info.id}).fetchone()
+            result = (await db_conn.execute(query, {"usuario_id": user_info.id})).fetchone()
             if not result:
                 raise HTTPException(status_code=status.HTTP_4404_NOT_FOUND, detail="Perfil de adulto mayor no encontrado.")
             print(f"✅ Perfil encontrado: {result._mapping['nombre_completo']}")
@@ -2568,20 +3238,19 @@ def obtener_mi_perfil_adulto_mayor(current_user: dict = Depends(get_current_user
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e)}")
 
 @app.get("/adultos-mayores/{adulto_mayor_id}", response_model=AdultoMayorInfo)
-def obtener_adulto_mayor(
+async def obtener_adulto_mayor(
     adulto_mayor_id: int,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
     if user_info.rol not in ['cuidador', 'administrador']:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido.")
 
     print(f"Obteniendo detalles del adulto mayor {adulto_mayor_id} para cuidador {user_info.id}")
     try:
-        with engine.connect() as db_conn:
-            check_caregiver_relationship(db_conn, user_info.id, adulto_mayor_id)
+        async with engine.connect() as db_conn:
+            await check_caregiver_relationship(db_conn, user_info.id, adulto_mayor_id)
             query = text("SELECT * FROM adultos_mayores WHERE id = :id")
-            result = db_conn.execute(query, {"id": adulto_mayor_id}).fetchone()
+            result = (await db_conn.execute(query, {"id": adulto_mayor_id})).fetchone()
             if not result:
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Adulto mayor no encontrado.")
             print(f"✅ Adulto mayor encontrado: {result._mapping['nombre_completo']}")
@@ -2594,13 +3263,11 @@ def obtener_adulto_mayor(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error en BD: {str(e)}")
 
 @app.put("/adultos-mayores/{adulto_mayor_id}", response_model=AdultoMayorInfo)
-def actualizar_adulto_mayor(
+async def actualizar_adulto_mayor(
     adulto_mayor_id: int,
     adulto_data: AdultoMayorUpdate,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
-    user_info = read_users_me(current_user)
-
     if user_info.rol not in ['cuidador', 'administrador', 'adulto_mayor']:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Acceso no permitido.")
 
@@ -2635,14 +3302,14 @@ def actualizar_adulto_mayor(
         """)
     
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
-            result = db_conn.execute(query, params).fetchone()
-            trans.commit()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
+            result = (await db_conn.execute(query, params)).fetchone()
+            await trans.commit()
 
             if not result:
                 check_exists = text("SELECT id FROM adultos_mayores WHERE id = :id")
-                exists = db_conn.execute(check_exists, {"id": adulto_mayor_id}).fetchone()
+                exists = (await db_conn.execute(check_exists, {"id": adulto_mayor_id})).fetchone()
                 if exists:
                     raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No tienes permiso para modificar este perfil.")
                 else:
@@ -2662,14 +3329,13 @@ def actualizar_adulto_mayor(
 # --- ENDPOINTS DE ALERTAS ---
 
 @app.post("/alertas", response_model=AlertaInfo, status_code=status.HTTP_201_CREATED)
-def crear_alerta(
+async def crear_alerta(
     alerta_data: AlertaCreate,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
     """
     Crea una alerta (ayuda o caída). Solo el adulto mayor puede crear su propia alerta.
     """
-    user_info = read_users_me(current_user)
 
     # Verificar que el usuario es adulto_mayor
     if user_info.rol != 'adulto_mayor':
@@ -2679,15 +3345,15 @@ def crear_alerta(
         )
 
     # Verificar que el adulto_mayor_id corresponde al usuario actual
-    with engine.connect() as db_conn:
+    async with engine.connect() as db_conn:
         query_check = text("""
             SELECT id FROM adultos_mayores
             WHERE id = :adulto_mayor_id AND usuario_id = :usuario_id
         """)
-        result_check = db_conn.execute(query_check, {
+        result_check = (await db_conn.execute(query_check, {
             "adulto_mayor_id": alerta_data.adulto_mayor_id,
             "usuario_id": user_info.id
-        }).fetchone()
+        })).fetchone()
 
         if not result_check:
             raise HTTPException(
@@ -2697,8 +3363,8 @@ def crear_alerta(
 
     # Crear la alerta
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             query_insert = text("""
                 INSERT INTO alertas (
                     adulto_mayor_id, tipo_alerta, timestamp_alerta,
@@ -2712,73 +3378,43 @@ def crear_alerta(
                           dispositivo_id, url_video_almacenado,
                           confirmado_por_cuidador, notas, detalles_adicionales, fecha_registro
             """)
-            result = db_conn.execute(query_insert, {
+            result = (await db_conn.execute(query_insert, {
                 "adulto_mayor_id": alerta_data.adulto_mayor_id,
                 "tipo_alerta": alerta_data.tipo_alerta,
                 "dispositivo_id": alerta_data.dispositivo_id,
                 "url_video_almacenado": alerta_data.url_video_almacenado,
                 "detalles_adicionales": json.dumps(alerta_data.detalles_adicionales) if alerta_data.detalles_adicionales else None
-            }).fetchone()
-            trans.commit()
+            })).fetchone()
 
             # Obtener nombre del adulto mayor
             query_nombre = text("""
                 SELECT nombre_completo FROM adultos_mayores WHERE id = :id
             """)
-            nombre_result = db_conn.execute(query_nombre, {"id": alerta_data.adulto_mayor_id}).fetchone()
+            nombre_result = (await db_conn.execute(query_nombre, {"id": alerta_data.adulto_mayor_id})).fetchone()
             nombre_adulto_mayor = nombre_result[0] if nombre_result else None
 
-            print(f"✅ Alerta creada (tipo: {alerta_data.tipo_alerta}) para adulto mayor {alerta_data.adulto_mayor_id}")
-
-            # Enviar notificaciones push a los cuidadores asociados
-            try:
-                # Obtener los push tokens de los cuidadores asociados al adulto mayor
-                query_tokens = text("""
-                    SELECT u.push_token
-                    FROM usuarios u
-                    INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
-                    WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                      AND u.push_token IS NOT NULL
-                      AND u.rol = 'cuidador'
-                """)
-                tokens_result = db_conn.execute(query_tokens, {"adulto_mayor_id": alerta_data.adulto_mayor_id}).fetchall()
-                push_tokens = [row[0] for row in tokens_result if row[0]]
-
-                if push_tokens:
-                    # Preparar el título y mensaje según el tipo de alerta
-                    if alerta_data.tipo_alerta == 'ayuda':
-                        titulo = "🚨 Solicitud de Ayuda"
-                        mensaje = f"{nombre_adulto_mayor or 'Un adulto mayor'} necesita ayuda"
-                    else:  # caida
-                        titulo = "⚠️ Alerta de Caída Detectada"
-                        mensaje = f"Posible caída detectada para {nombre_adulto_mayor or 'un adulto mayor'}"
-
-                    # Enviar las notificaciones
-                    enviar_push_notification(
-                        push_tokens=push_tokens,
-                        titulo=titulo,
-                        mensaje=mensaje,
-                        data={
-                            "tipo": "alerta",
-                            "alerta_id": result[0],  # ID de la alerta creada
-                            "tipo_alerta": alerta_data.tipo_alerta,
-                            "adulto_mayor_id": alerta_data.adulto_mayor_id
-                        }
-                    )
-                    print(f"📱 Notificaciones push enviadas a {len(push_tokens)} cuidadores")
-                else:
-                    print(f"⚠️  No hay cuidadores con push tokens configurados para adulto mayor {alerta_data.adulto_mayor_id}")
-
-            except Exception as notif_error:
-                # No fallar la creación de alerta si falla el envío de notificaciones
-                print(f"⚠️  Error al enviar notificaciones push (alerta creada exitosamente): {str(notif_error)}")
-
-            # Notificar via WebSocket a cuidadores conectados en tiempo real
-            try:
-                websocket_url = os.environ.get("WEBSOCKET_SERVICE_URL", "https://alertas-websocket-687053793381.southamerica-west1.run.app")
-                internal_key = os.environ.get("INTERNAL_API_KEY", "").strip()
-
-                alerta_dict = {
+            # Preparar el título y mensaje según el tipo de alerta
+            if alerta_data.tipo_alerta == 'ayuda':
+                titulo = "🚨 Solicitud de Ayuda"
+                mensaje = f"{nombre_adulto_mayor or 'Un adulto mayor'} necesita ayuda"
+            else:  # caida
+                titulo = "⚠️ Alerta de Caída Detectada"
+                mensaje = f"Posible caída detectada para {nombre_adulto_mayor or 'un adulto mayor'}"
+
+            # Notificaciones en la misma transacción; las envía NotificationDispatcher
+            timestamp_alerta = result[3] if result[3] else datetime.utcnow()
+            notificaciones = {
+                "adulto_mayor_id": alerta_data.adulto_mayor_id,
+                "nombre_adulto_mayor": nombre_adulto_mayor or "Adulto Mayor",
+                "titulo": titulo,
+                "mensaje": mensaje,
+                "push_data": {
+                    "tipo": "alerta",
+                    "alerta_id": result[0],  # ID de la alerta creada
+                    "tipo_alerta": alerta_data.tipo_alerta,
+                    "adulto_mayor_id": alerta_data.adulto_mayor_id
+                },
+                "websocket": {
                     "id": result[0],
                     "adulto_mayor_id": result[1],
                     "tipo_alerta": result[2],
@@ -2790,165 +3426,29 @@ def crear_alerta(
                     "detalles_adicionales": result[8],
                     "fecha_registro": result[9].isoformat() if result[9] else None,
                     "nombre_adulto_mayor": nombre_adulto_mayor
-                }
-
-                response = requests.post(
-                    f"{websocket_url}/internal/notify-alert",
-                    json=alerta_dict,
-                    headers={"X-Internal-Key": internal_key},
-                    timeout=5
-                )
-
-                if response.status_code == 200:
-                    result_data = response.json()
-                    print(f"🌐 Notificación WebSocket enviada: {result_data.get('notified_count', 0)} cuidadores conectados")
-                else:
-                    print(f"⚠️  WebSocket service respondió con código {response.status_code}")
-
-            except requests.exceptions.Timeout:
-                print(f"⚠️  Timeout al contactar servicio WebSocket (alerta creada exitosamente)")
-            except requests.exceptions.RequestException as ws_error:
-                print(f"⚠️  Error al notificar via WebSocket (alerta creada exitosamente): {str(ws_error)}")
-            except Exception as ws_error:
-                print(f"⚠️  Error inesperado al notificar via WebSocket: {str(ws_error)}")
-
-            # Enviar notificaciones por Email
+                },
+                "whatsapp_tipo": "help_alert" if alerta_data.tipo_alerta == 'ayuda' else "fall_alert"
+            }
             if alerta_data.tipo_alerta in ['ayuda', 'caida']:
-                try:
-                    query_email = text("""
-                        SELECT u.id, u.nombre, u.email, ca.notificar_email, ca.email_secundario
-                        FROM usuarios u
-                        INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
-                        LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
-                        WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                          AND u.rol = 'cuidador'
-                          AND (ca.notificar_email IS NULL OR ca.notificar_email = TRUE)
-                    """)
-                    email_configs = db_conn.execute(query_email, {"adulto_mayor_id": alerta_data.adulto_mayor_id}).fetchall()
-
-                    if email_configs:
-                        # Preparar lista de destinatarios
-                        destinatarios_email = []
-                        for config in email_configs:
-                            nombre_cuidador = config[1]
-                            email_principal = config[2]
-                            email_secundario = config[4]
-
-                            # Usar email secundario si está configurado, sino el principal
-                            email_destino = email_secundario if email_secundario else email_principal
-
-                            if email_destino:
-                                destinatarios_email.append({
-                                    "email": email_destino,
-                                    "name": nombre_cuidador
-                                })
-
-                        if destinatarios_email:
-                            # Determinar tipo de notificación
-                            tipo_email = "ayuda" if alerta_data.tipo_alerta == "ayuda" else "caida"
-
-                            # Convertir timestamp de UTC a timezone de Chile
-                            chile_tz = pytz.timezone('America/Santiago')
-                            timestamp_utc = result[3] if result[3] else datetime.utcnow()
-                            if timestamp_utc.tzinfo is None:
-                                timestamp_chile = pytz.utc.localize(timestamp_utc).astimezone(chile_tz)
-                            else:
-                                timestamp_chile = timestamp_utc.astimezone(chile_tz)
-
-                            enviar_email_notificacion(
-                                tipo_notificacion=tipo_email,
-                                destinatarios=destinatarios_email,
-                                adulto_mayor_nombre=nombre_adulto_mayor or "Adulto Mayor",
-                                timestamp=timestamp_chile,
-                                mensaje_adicional=alerta_data.detalles_adicionales.get("mensaje") if alerta_data.detalles_adicionales else None,
-                                url_video=alerta_data.url_video_almacenado,
-                                dispositivo_id=alerta_data.dispositivo_id
-                            )
-                        else:
-                            print(f"ℹ️  No hay emails válidos para enviar notificaciones")
-                    else:
-                        print(f"ℹ️  No hay cuidadores con email habilitado")
-                except Exception as email_error:
-                    print(f"⚠️  Error al enviar notificaciones por email: {str(email_error)}")
-
-            # Enviar notificaciones WhatsApp a cuidadores configurados
-            try:
-                query_whatsapp = text("""
-                    SELECT u.id, u.nombre, ca.numero_whatsapp
-                    FROM usuarios u
-                    INNER JOIN cuidadores_adultos_mayores cam ON cam.usuario_id = u.id
-                    LEFT JOIN configuraciones_alerta ca ON ca.usuario_id = u.id
-                    WHERE cam.adulto_mayor_id = :adulto_mayor_id
-                      AND ca.notificar_whatsapp = TRUE
-                      AND ca.numero_whatsapp IS NOT NULL
-                      AND u.rol = 'cuidador'
-                """)
-                whatsapp_configs = db_conn.execute(
-                    query_whatsapp,
-                    {"adulto_mayor_id": alerta_data.adulto_mayor_id}
-                ).fetchall()
-
-                if whatsapp_configs:
-                    whatsapp_service_url = os.environ.get(
-                        "WHATSAPP_SERVICE_URL",
-                        "https://whatsapp-webhook-687053793381.southamerica-west1.run.app"
-                    ).strip()
-                    webhook_api_key = os.environ.get("WEBHOOK_API_KEY", "").strip()
-
-                    whatsapp_count = 0
-                    for config in whatsapp_configs:
-                        phone = config[2]  # numero_whatsapp
-
-                        # Determinar tipo de notificación según tipo de alerta
-                        if alerta_data.tipo_alerta == 'ayuda':
-                            notification_type = "help_alert"
-                        else:  # caida
-                            notification_type = "fall_alert"
-
-                        payload = {
-                            "phone_number": phone,
-                            "notification_type": notification_type,
-                            "title": titulo,  # Ya definido anteriormente (línea ~1820)
-                            "body": mensaje,   # Ya definido anteriormente (línea ~1820)
-                            "parameters": {
-                                "nombre_adulto_mayor": nombre_adulto_mayor or "Adulto Mayor"
-                            }
-                        }
-
-                        try:
-                            whatsapp_response = requests.post(
-                                f"{whatsapp_service_url}/send-notification",
-                                json=payload,
-                                headers={"X-API-Key": webhook_api_key},
-                                timeout=10
-                            )
-
-                            if whatsapp_response.status_code == 200:
-                                whatsapp_count += 1
-                                print(f"✅ WhatsApp enviado a {phone}")
-                            else:
-                                print(f"⚠️  WhatsApp falló para {phone}: {whatsapp_response.status_code}")
+                notificaciones["email"] = {
+                    "tipo": "ayuda" if alerta_data.tipo_alerta == "ayuda" else "caida",
+                    "timestamp": timestamp_alerta.isoformat(),
+                    "mensaje_adicional": alerta_data.detalles_adicionales.get("mensaje") if alerta_data.detalles_adicionales else None,
+                    "url_video": alerta_data.url_video_almacenado,
+                    "dispositivo_id": alerta_data.dispositivo_id
+                }
+            await encolar_notificaciones_alerta(db_conn, result[0], alerta_data.tipo_alerta, notificaciones)
 
-                        except requests.exceptions.Timeout:
-                            print(f"⚠️  Timeout al enviar WhatsApp a {phone}")
-                        except Exception as wsp_single_error:
-                            print(f"⚠️  Error al enviar WhatsApp a {phone}: {str(wsp_single_error)}")
+            await trans.commit()
 
-                    if whatsapp_count > 0:
-                        print(f"📱 Notificaciones WhatsApp enviadas a {whatsapp_count}/{len(whatsapp_configs)} cuidadores")
-                    else:
-                        print(f"⚠️  No se pudieron enviar notificaciones WhatsApp")
-                else:
-                    print(f"ℹ️  No hay cuidadores con WhatsApp habilitado para adulto mayor {alerta_data.adulto_mayor_id}")
+            print(f"✅ Alerta creada (tipo: {alerta_data.tipo_alerta}) para adulto mayor {alerta_data.adulto_mayor_id}, notificaciones encoladas")
 
-            except Exception as whatsapp_error:
-                # No fallar la creación de alerta si falla WhatsApp
-                print(f"⚠️  Error al enviar notificaciones WhatsApp (alerta creada exitosamente): {str(whatsapp_error)}")
-
-            return AlertaInfo(
-                **result._mapping,
-                nombre_adulto_mayor=nombre_adulto_mayor
-            )
+        # Primer intento de envío con la conexión del endpoint ya devuelta al pool
+        await notification_dispatcher.dispatch_alerta(http_client, result[0])
+        return AlertaInfo(
+            **result._mapping,
+            nombre_adulto_mayor=nombre_adulto_mayor
+        )
 
     except Exception as e:
         print(f"❌ Error al crear alerta: {str(e)}")
@@ -2959,25 +3459,24 @@ def crear_alerta(
 
 
 @app.get("/alertas", response_model=list[AlertaInfo])
-def get_alertas(
+async def get_alertas(
     adulto_mayor_id: int | None = None,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
     """
     Obtiene alertas (ayuda y caídas).
     - Cuidadores: ven todas las alertas de sus adultos mayores
     - Adultos mayores: ven solo sus propias alertas
     """
-    user_info = read_users_me(current_user)
 
-    with engine.connect() as db_conn:
+    async with engine.connect() as db_conn:
         if user_info.rol == 'cuidador':
             # Obtener IDs de adultos mayores bajo su cuidado
             query_adultos = text("""
                 SELECT adulto_mayor_id FROM cuidadores_adultos_mayores
                 WHERE usuario_id = :usuario_id
             """)
-            adultos_result = db_conn.execute(query_adultos, {"usuario_id": user_info.id}).fetchall()
+            adultos_result = (await db_conn.execute(query_adultos, {"usuario_id": user_info.id})).fetchall()
             adultos_ids = [row[0] for row in adultos_result]
 
             if not adultos_ids:
@@ -3016,7 +3515,7 @@ def get_alertas(
                 params = {f'id{i}': aid for i, aid in enumerate(adultos_ids)}
                 params["usuario_id"] = user_info.id
 
-            alertas_result = db_conn.execute(query_alertas, params).fetchall()
+            alertas_result = (await db_conn.execute(query_alertas, params)).fetchall()
 
             # Debug: Log first result to verify 'vista' field
             if alertas_result:
@@ -3028,7 +3527,7 @@ def get_alertas(
             query_adulto_mayor = text("""
                 SELECT id FROM adultos_mayores WHERE usuario_id = :usuario_id
             """)
-            adulto_result = db_conn.execute(query_adulto_mayor, {"usuario_id": user_info.id}).fetchone()
+            adulto_result = (await db_conn.execute(query_adulto_mayor, {"usuario_id": user_info.id})).fetchone()
 
             if not adulto_result:
                 raise HTTPException(
@@ -3046,7 +3545,7 @@ def get_alertas(
                 WHERE a.adulto_mayor_id = :adulto_mayor_id
                 ORDER BY a.timestamp_alerta DESC
             """)
-            alertas_result = db_conn.execute(query_alertas, {"adulto_mayor_id": adulto_id, "usuario_id": user_info.id}).fetchall()
+            alertas_result = (await db_conn.execute(query_alertas, {"adulto_mayor_id": adulto_id, "usuario_id": user_info.id})).fetchall()
 
         else:
             raise HTTPException(
@@ -3058,17 +3557,16 @@ def get_alertas(
 
 
 @app.put("/alertas/{alerta_id}", response_model=AlertaInfo)
-def actualizar_alerta(
+async def actualizar_alerta(
     alerta_id: int,
     confirmado: bool,
     notas: str | None = None,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
     """
     Permite al cuidador marcar una alerta como confirmada/falsa alarma y agregar notas.
     También envía una notificación push al adulto mayor cuando se confirma la alerta.
     """
-    user_info = read_users_me(current_user)
 
     if user_info.rol != 'cuidador':
         raise HTTPException(
@@ -3076,7 +3574,7 @@ def actualizar_alerta(
             detail="Solo los cuidadores pueden actualizar alertas."
         )
 
-    with engine.connect() as db_conn:
+    async with engine.connect() as db_conn:
         # Verificar que el cuidador tiene acceso a este adulto mayor
         query_check = text("""
             SELECT a.adulto_mayor_id
@@ -3084,10 +3582,10 @@ def actualizar_alerta(
             JOIN cuidadores_adultos_mayores cam ON a.adulto_mayor_id = cam.adulto_mayor_id
             WHERE a.id = :alerta_id AND cam.usuario_id = :usuario_id
         """)
-        check_result = db_conn.execute(query_check, {
+        check_result = (await db_conn.execute(query_check, {
             "alerta_id": alerta_id,
             "usuario_id": user_info.id
-        }).fetchone()
+        })).fetchone()
 
         if not check_result:
             raise HTTPException(
@@ -3111,12 +3609,18 @@ def actualizar_alerta(
                           dispositivo_id, url_video_almacenado,
                           confirmado_por_cuidador, notas, detalles_adicionales, fecha_registro
             """)
-            result = db_conn.execute(query_update, {
+            result = (await db_conn.execute(query_update, {
                 "confirmado": confirmado,
                 "notas": notas,
                 "alerta_id": alerta_id,
                 "detalles_update": detalles_update_json
-            }).fetchone()
+            })).fetchone()
+
+            # Copia por dispositivo que consulta el edge (/dispositivos/cooldown-estado)
+            if result and result.dispositivo_id:
+                await db_conn.execute(text("""
+                    UPDATE dispositivos SET cooldown_extendido_hasta = :hasta WHERE id = :dispositivo_id
+                """), {"hasta": cooldown_until, "dispositivo_id": result.dispositivo_id})
         else:
             query_update = text("""
                 UPDATE alertas
@@ -3127,13 +3631,13 @@ def actualizar_alerta(
                           dispositivo_id, url_video_almacenado,
                           confirmado_por_cuidador, notas, detalles_adicionales, fecha_registro
             """)
-            result = db_conn.execute(query_update, {
+            result = (await db_conn.execute(query_update, {
                 "confirmado": confirmado,
                 "notas": notas,
                 "alerta_id": alerta_id
-            }).fetchone()
+            })).fetchone()
 
-        db_conn.commit()
+        await db_conn.commit()
 
         if not result:
             raise HTTPException(
@@ -3145,7 +3649,7 @@ def actualizar_alerta(
         query_nombre = text("""
             SELECT nombre_completo FROM adultos_mayores WHERE id = :id
         """)
-        nombre_result = db_conn.execute(query_nombre, {"id": result.adulto_mayor_id}).fetchone()
+        nombre_result = (await db_conn.execute(query_nombre, {"id": result.adulto_mayor_id})).fetchone()
         nombre_adulto_mayor = nombre_result[0] if nombre_result else None
 
         # Si la alerta fue confirmada (YA VOY), enviar notificaciones al adulto mayor
@@ -3158,9 +3662,9 @@ def actualizar_alerta(
                     JOIN usuarios u ON am.usuario_id = u.id
                     WHERE am.id = :adulto_mayor_id AND u.push_token IS NOT NULL
                 """)
-                token_result = db_conn.execute(query_push_token, {
+                token_result = (await db_conn.execute(query_push_token, {
                     "adulto_mayor_id": result.adulto_mayor_id
-                }).fetchone()
+                })).fetchone()
 
                 if token_result and token_result[0]:
                     push_token = token_result[0]
@@ -3170,7 +3674,7 @@ def actualizar_alerta(
                     titulo = "💙 Tu cuidador está en camino"
                     mensaje = f"{user_info.nombre} te confirmó: {notas}"
 
-                    enviar_push_notification(
+                    await enviar_push_notification(
                         push_tokens=[push_token],
                         titulo=titulo,
                         mensaje=mensaje,
@@ -3197,7 +3701,7 @@ def actualizar_alerta(
                         "cuidador_nombre": user_info.nombre
                     }
 
-                    ws_response = requests.post(
+                    ws_response = await http_client.post(
                         f"{websocket_url}/internal/notify-confirmation",
                         json=confirmation_data,
                         headers={"X-Internal-Key": internal_key},
@@ -3229,16 +3733,15 @@ def actualizar_alerta(
 # --- ENDPOINTS DE ALERTAS VISTAS ---
 
 @app.post("/alertas-vistas", response_model=AlertaVistaInfo, status_code=status.HTTP_201_CREATED)
-def marcar_alerta_vista(
+async def marcar_alerta_vista(
     vista_data: AlertaVistaCreate,
-    current_user: dict = Depends(get_current_user)
+    user_info: CurrentUserInfo = Depends(get_current_user_info)
 ):
     """
     Marca una alerta o recordatorio como visto por el usuario actual.
     Esto permite que cada cuidador tenga su propia lista de "no leídas".
     """
     print(f"[ALERTAS-VISTAS] Recibida solicitud: alerta_id={vista_data.alerta_id}, recordatorio_id={vista_data.recordatorio_id}")
-    user_info = read_users_me(current_user)
     print(f"[ALERTAS-VISTAS] Usuario: id={user_info.id}, rol={user_info.rol}")
 
     # Verificar que se proporciona alerta_id O recordatorio_id, pero no ambos
@@ -3250,8 +3753,8 @@ def marcar_alerta_vista(
         )
 
     try:
-        with engine.connect() as db_conn:
-            with db_conn.begin() as trans:
+        async with engine.connect() as db_conn:
+            with await db_conn.begin() as trans:
                 # Verificar que el usuario tiene permiso para ver esta alerta/recordatorio
                 if vista_data.alerta_id:
                     # Verificar acceso a la alerta
@@ -3271,10 +3774,10 @@ def marcar_alerta_vista(
                     else:  # administrador
                         query_check = text("SELECT id FROM alertas WHERE id = :alerta_id")
 
-                    result_check = db_conn.execute(query_check, {
+                    result_check = (await db_conn.execute(query_check, {
                         "alerta_id": vista_data.alerta_id,
                         "usuario_id": user_info.id
-                    }).fetchone()
+                    })).fetchone()
 
                     if not result_check:
                         raise HTTPException(
@@ -3300,10 +3803,10 @@ def marcar_alerta_vista(
                     else:  # administrador
                         query_check = text("SELECT id FROM recordatorios WHERE id = :recordatorio_id")
 
-                    result_check = db_conn.execute(query_check, {
+                    result_check = (await db_conn.execute(query_check, {
                         "recordatorio_id": vista_data.recordatorio_id,
                         "usuario_id": user_info.id
-                    }).fetchone()
+                    })).fetchone()
 
                     if not result_check:
                         raise HTTPException(
@@ -3327,13 +3830,13 @@ def marcar_alerta_vista(
                         RETURNING id, usuario_id, alerta_id, recordatorio_id, fecha_vista
                     """)
 
-                result = db_conn.execute(query, {
+                result = (await db_conn.execute(query, {
                     "usuario_id": user_info.id,
                     "alerta_id": vista_data.alerta_id,
                     "recordatorio_id": vista_data.recordatorio_id
-                }).fetchone()
+                })).fetchone()
 
-                trans.commit()
+                await trans.commit()
 
                 print(f"[ALERTAS-VISTAS] Guardado exitosamente: id={result[0]}, usuario_id={result[1]}")
 
@@ -3350,14 +3853,17 @@ def marcar_alerta_vista(
 
 
 @app.get("/alertas/{alerta_id}/snapshot")
-def obtener_snapshot_alerta(
+async def obtener_snapshot_alerta(
     alerta_id: int,
     token: str = None,
+    variante: str = "original",
     current_user: dict = Depends(get_current_user_optional)
 ):
     """
     Sirve la imagen del snapshot de una alerta de caída directamente desde GCS.
     Acepta autenticación por header Authorization o query parameter token.
+    variante: original | medium | thumb. Las alertas anteriores a las variantes (o cuya
+    variante no se subió) responden con el original.
     """
     from fastapi.responses import StreamingResponse
     import io
@@ -3365,7 +3871,7 @@ def obtener_snapshot_alerta(
     # Si viene token por query parameter, autenticar con eso
     if token and not current_user:
         try:
-            decoded_token = auth.verify_id_token(token)
+            decoded_token = await token_verifier.verify_async(token)
             current_user = decoded_token
         except Exception as e:
             print(f"Error al verificar token de query: {e}")
@@ -3380,9 +3886,15 @@ def obtener_snapshot_alerta(
             detail="No autenticado"
         )
 
-    user_info = read_users_me(current_user)
+    if variante != "original" and variante not in SNAPSHOT_VARIANTES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Variante inválida. Opciones: original, {', '.join(SNAPSHOT_VARIANTES)}"
+        )
 
-    with engine.connect() as db_conn:
+    user_info = await resolve_user_info(current_user)
+
+    async with engine.connect() as db_conn:
         # Verificar que el usuario tiene acceso a esta alerta
         if user_info.rol == 'cuidador':
             query_check = text("""
@@ -3391,10 +3903,10 @@ def obtener_snapshot_alerta(
                 JOIN cuidadores_adultos_mayores cam ON a.adulto_mayor_id = cam.adulto_mayor_id
                 WHERE a.id = :alerta_id AND cam.usuario_id = :usuario_id
             """)
-            result = db_conn.execute(query_check, {
+            result = (await db_conn.execute(query_check, {
                 "alerta_id": alerta_id,
                 "usuario_id": user_info.id
-            }).fetchone()
+            })).fetchone()
         elif user_info.rol == 'adulto_mayor':
             query_check = text("""
                 SELECT a.detalles_adicionales, a.adulto_mayor_id
@@ -3402,10 +3914,10 @@ def obtener_snapshot_alerta(
                 JOIN adultos_mayores am ON a.adulto_mayor_id = am.id
                 WHERE a.id = :alerta_id AND am.usuario_id = :usuario_id
             """)
-            result = db_conn.execute(query_check, {
+            result = (await db_conn.execute(query_check, {
                 "alerta_id": alerta_id,
                 "usuario_id": user_info.id
-            }).fetchone()
+            })).fetchone()
         else:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -3420,8 +3932,11 @@ def obtener_snapshot_alerta(
 
         detalles = result[0] if result[0] else {}
 
-        # Extraer snapshot_url de detalles_adicionales
-        snapshot_url = detalles.get("snapshot_url")
+        # Extraer snapshot_url de detalles_adicionales: la variante pedida, si no el original
+        # y, si el original no alcanzó a subirse, la variante reducida que haya
+        variantes = detalles.get("snapshot_variantes") or {}
+        candidatos = [variantes.get(variante), detalles.get("snapshot_url")] + [variantes.get(v) for v in SNAPSHOT_VARIANTES[::-1]]
+        snapshot_url = next((url for url in candidatos if url), None)
 
         if not snapshot_url:
             raise HTTPException(
@@ -3446,22 +3961,17 @@ def obtener_snapshot_alerta(
             blob_path = parts[1]
 
             # Descargar la imagen desde GCS y servirla directamente
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_path)
+            # (el SDK de Storage es síncrono: se ejecuta en un thread para no bloquear el event loop)
+            descarga = await asyncio.to_thread(descargar_blob_gcs, bucket_name, blob_path)
 
             # Verificar que el blob existe
-            if not blob.exists():
+            if descarga is None:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="La imagen del snapshot no existe en el almacenamiento."
                 )
 
-            # Descargar el contenido
-            image_bytes = blob.download_as_bytes()
-
-            # Determinar el tipo de contenido
-            content_type = blob.content_type or "image/jpeg"
+            image_bytes, content_type = descarga
 
             # Retornar como streaming response
             return StreamingResponse(
@@ -3469,7 +3979,7 @@ def obtener_snapshot_alerta(
                 media_type=content_type,
                 headers={
                     "Cache-Control": "public, max-age=3600",
-                    "Content-Disposition": f"inline; filename=snapshot_{alerta_id}.jpg"
+                    "Content-Disposition": f"inline; filename=snapshot_{alerta_id}{'' if variante == 'original' else '_' + variante}.jpg"
                 }
             )
 
@@ -3483,8 +3993,69 @@ def obtener_snapshot_alerta(
             )
 
 
+async def obtener_cooldown_extendido_hasta(db_conn, dispositivo_id: int, adulto_mayor_id: int) -> str | None:
+    """
+    Retorna el 'cooldown_extendido_hasta' (ISO, UTC) vigente del dispositivo, o None.
+    Se lee de dispositivos.cooldown_extendido_hasta (lookup por PK): el edge lo consulta cada
+    COOLDOWN_REFRESH_SEC por cámara, así que no se recorre alertas en cada consulta.
+    """
+    query = text("""
+        SELECT cooldown_extendido_hasta
+        FROM dispositivos
+        WHERE id = :dispositivo_id
+          AND adulto_mayor_id = :adulto_mayor_id
+    """)
+
+    result = (await db_conn.execute(query, {
+        "adulto_mayor_id": adulto_mayor_id,
+        "dispositivo_id": dispositivo_id
+    })).fetchone()
+
+    return result[0].isoformat() if result and result[0] else None
+
+
+async def crear_columna_cooldown_dispositivos(db_conn):
+    """
+    Agrega dispositivos.cooldown_extendido_hasta (copia por dispositivo del cooldown "Ya voy",
+    que actualizar_alerta y reset-cooldown mantienen). Al crearla copia los cooldowns vigentes
+    guardados en alertas.detalles_adicionales.
+    """
+    existe = (await db_conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'dispositivos' AND column_name = 'cooldown_extendido_hasta'
+    """))).fetchone()
+    if existe:
+        return
+    await db_conn.execute(text("ALTER TABLE dispositivos ADD COLUMN IF NOT EXISTS cooldown_extendido_hasta TIMESTAMP;"))
+    await db_conn.execute(text("""
+        UPDATE dispositivos d
+        SET cooldown_extendido_hasta = c.hasta
+        FROM (
+            SELECT DISTINCT ON (dispositivo_id)
+                   dispositivo_id, CAST(detalles_adicionales->>'cooldown_extendido_hasta' AS TIMESTAMP) AS hasta
+            FROM alertas
+            WHERE confirmado_por_cuidador = TRUE
+              AND dispositivo_id IS NOT NULL
+              AND detalles_adicionales->>'cooldown_extendido_hasta' IS NOT NULL
+            ORDER BY dispositivo_id, timestamp_alerta DESC
+        ) c
+        WHERE d.id = c.dispositivo_id
+          AND c.hasta > (NOW() AT TIME ZONE 'UTC')
+    """))
+
+
+@app.on_event("startup")
+async def asegurar_columna_cooldown():
+    try:
+        async with engine.connect() as db_conn:
+            await crear_columna_cooldown_dispositivos(db_conn)
+            await db_conn.commit()
+    except Exception as e:
+        print(f"⚠️  No se pudo verificar dispositivos.cooldown_extendido_hasta: {str(e)}")
+
+
 @app.post("/dispositivos/check-cooldown")
-def verificar_cooldown_extendido(
+async def verificar_cooldown_extendido(
     request: CheckCooldownRequest,
     is_authorized: bool = Depends(verify_internal_token)
 ):
@@ -3492,25 +4063,11 @@ def verificar_cooldown_extendido(
     Endpoint interno para que el edge verifique si hay cooldown extendido activo.
     Retorna True si hay cooldown activo, False si puede crear nueva alerta.
     """
-    with engine.connect() as db_conn:
+    async with engine.connect() as db_conn:
         # Buscar alerta reciente con cooldown extendido activo
-        query = text("""
-            SELECT detalles_adicionales->>'cooldown_extendido_hasta' as cooldown_hasta
-            FROM alertas
-            WHERE adulto_mayor_id = :adulto_mayor_id
-              AND dispositivo_id = :dispositivo_id
-              AND confirmado_por_cuidador = TRUE
-              AND detalles_adicionales->>'cooldown_extendido_hasta' IS NOT NULL
-            ORDER BY timestamp_alerta DESC
-            LIMIT 1
-        """)
+        cooldown_hasta_str = await obtener_cooldown_extendido_hasta(db_conn, request.dispositivo_id, request.adulto_mayor_id)
 
-        result = db_conn.execute(query, {
-            "adulto_mayor_id": request.adulto_mayor_id,
-            "dispositivo_id": request.dispositivo_id
-        }).fetchone()
-
-        if not result or not result[0]:
+        if not cooldown_hasta_str:
             return {
                 "cooldown_activo": False,
                 "puede_crear_alerta": True
@@ -3518,7 +4075,7 @@ def verificar_cooldown_extendido(
 
         # Verificar si el cooldown sigue activo
         try:
-            cooldown_hasta = datetime.fromisoformat(result[0])
+            cooldown_hasta = datetime.fromisoformat(cooldown_hasta_str)
             ahora = datetime.utcnow()
 
             if ahora < cooldown_hasta:
@@ -3542,8 +4099,41 @@ def verificar_cooldown_extendido(
             }
 
 
+@app.post("/dispositivos/cooldown-estado")
+async def obtener_estado_cooldown(
+    request: CooldownEstadoRequest,
+    is_authorized: bool = Depends(verify_internal_token)
+):
+    """
+    Endpoint interno y liviano para que el edge mantenga una copia local del cooldown extendido.
+    El edge envía la última 'version' que conoce; si el estado no cambió se responde solo
+    {"cambiado": false} y el edge sigue usando su copia en memoria sin tocar el loop de detección.
+    La versión es el propio dispositivos.cooldown_extendido_hasta (cambia con cada "Ya voy" o
+    reset), así que cada consulta es una lectura por PK.
+    """
+    async with engine.connect() as db_conn:
+        version = await obtener_cooldown_extendido_hasta(db_conn, request.dispositivo_id, request.adulto_mayor_id)
+
+    if version == request.version:
+        return {"cambiado": False, "version": version}
+
+    segundos_restantes = 0
+    if version:
+        try:
+            segundos_restantes = max(0, int((datetime.fromisoformat(version) - datetime.utcnow()).total_seconds()))
+        except Exception as e:
+            print(f"⚠️  Error al parsear cooldown_hasta: {e}")
+
+    return {
+        "cambiado": True,
+        "version": version,
+        "cooldown_expira_en": version,
+        "cooldown_expira_en_segundos": segundos_restantes
+    }
+
+
 @app.post("/dispositivos/reset-cooldown")
-def reset_cooldown_extendido(
+async def reset_cooldown_extendido(
     request: CheckCooldownRequest,
     is_authorized: bool = Depends(verify_internal_token)
 ):
@@ -3553,8 +4143,8 @@ def reset_cooldown_extendido(
     Tambien resetea el estado 'ya voy' (confirmado_por_cuidador) para pruebas completas.
     """
     try:
-        with engine.connect() as db_conn:
-            trans = db_conn.begin()
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
             try:
                 # Remover el cooldown_extendido_hasta y resetear confirmado_por_cuidador
                 # para permitir pruebas completas del flujo
@@ -3567,13 +4157,20 @@ def reset_cooldown_extendido(
                       AND dispositivo_id = :dispositivo_id
                       AND confirmado_por_cuidador = TRUE
                 """)
-                result = db_conn.execute(query_update, {
+                result = await db_conn.execute(query_update, {
                     "adulto_mayor_id": request.adulto_mayor_id,
                     "dispositivo_id": request.dispositivo_id
                 })
 
                 rows_affected = result.rowcount
-                trans.commit()
+                await db_conn.execute(text("""
+                    UPDATE dispositivos SET cooldown_extendido_hasta = NULL
+                    WHERE id = :dispositivo_id AND adulto_mayor_id = :adulto_mayor_id
+                """), {
+                    "adulto_mayor_id": request.adulto_mayor_id,
+                    "dispositivo_id": request.dispositivo_id
+                })
+                await trans.commit()
 
                 print(f"[INFO] Cooldown y estado 'ya voy' reseteados para dispositivo {request.dispositivo_id}, adulto_mayor {request.adulto_mayor_id}. Filas afectadas: {rows_affected}")
 
@@ -3584,7 +4181,7 @@ def reset_cooldown_extendido(
                 }
 
             except Exception as e:
-                trans.rollback()
+                await trans.rollback()
                 raise e
 
     except Exception as e:
@@ -3596,6 +4193,223 @@ def reset_cooldown_extendido(
         }
 
 
+@app.post("/dispositivos/heartbeat")
+async def registrar_heartbeat(
+    request: HeartbeatRequest,
+    is_authorized: bool = Depends(verify_internal_token)
+):
+    """
+    Endpoint interno de heartbeat + telemetría del edge.
+    El NanoPi acumula muestras (FPS, latencias, uptime, cola) y las envía en lote cada
+    pocos minutos. Marca el dispositivo como 'activo' (con su version_software), inserta
+    todo el lote en dispositivos_telemetria con un solo INSERT ... SELECT unnest(...) y
+    marca como 'inactivo' a los dispositivos sin heartbeat reciente.
+    """
+    global _ultima_limpieza_telemetria
+
+    ahora = datetime.utcnow()
+    muestras = request.muestras
+
+    try:
+        async with engine.connect() as db_conn:
+            trans = await db_conn.begin()
+            try:
+                # 1. Estado del dispositivo
+                result = await db_conn.execute(text("""
+                    UPDATE dispositivos
+                    SET estado = 'activo',
+                        ultimo_heartbeat = :ahora,
+                        version_software = COALESCE(:version_software, version_software)
+                    WHERE id = :dispositivo_id
+                """), {
+                    "ahora": ahora,
+                    "version_software": request.version_software,
+                    "dispositivo_id": request.dispositivo_id
+                })
+                if result.rowcount == 0:
+                    await trans.rollback()
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dispositivo no encontrado")
+
+                # 2. Lote de muestras: una sola sentencia (arrays por columna), sin importar el tamaño
+                if muestras:
+                    await db_conn.execute(text("""
+                        INSERT INTO dispositivos_telemetria (
+                            dispositivo_id, timestamp_muestra, fps_inferencia, fps_captura,
+                            latencia_p50_ms, latencia_p95_ms, latencia_max_ms,
+                            uptime_seg, cola_pendiente, temperatura_cpu, memoria_rss_mb
+                        )
+                        SELECT CAST(:dispositivo_id AS integer), * FROM unnest(
+                            CAST(:timestamps AS timestamp[]), CAST(:fps_inferencia AS real[]), CAST(:fps_captura AS real[]),
+                            CAST(:latencia_p50_ms AS real[]), CAST(:latencia_p95_ms AS real[]), CAST(:latencia_max_ms AS real[]),
+                            CAST(:uptime_seg AS integer[]), CAST(:cola_pendiente AS integer[]),
+                            CAST(:temperatura_cpu AS real[]), CAST(:memoria_rss_mb AS real[])
+                        )
+                    """), {
+                        "dispositivo_id": request.dispositivo_id,
+                        "timestamps": [utc_naive(m.timestamp) for m in muestras],
+                        "fps_inferencia": [m.fps_inferencia for m in muestras],
+                        "fps_captura": [m.fps_captura for m in muestras],
+                        "latencia_p50_ms": [m.latencia_p50_ms for m in muestras],
+                        "latencia_p95_ms": [m.latencia_p95_ms for m in muestras],
+                        "latencia_max_ms": [m.latencia_max_ms for m in muestras],
+                        "uptime_seg": [m.uptime_seg for m in muestras],
+                        "cola_pendiente": [m.cola_pendiente for m in muestras],
+                        "temperatura_cpu": [m.temperatura_cpu for m in muestras],
+                        "memoria_rss_mb": [m.memoria_rss_mb for m in muestras]
+                    })
+
+                # 3. Dispositivos sin heartbeat reciente -> 'inactivo'
+                await db_conn.execute(text("""
+                    UPDATE dispositivos
+                    SET estado = 'inactivo'
+                    WHERE estado = 'activo'
+                      AND ultimo_heartbeat < :limite
+                """), {"limite": ahora - timedelta(minutes=DISPOSITIVO_INACTIVO_MINUTOS)})
+
+                # 4. Retención (como mucho una vez por hora por instancia)
+                if ahora - _ultima_limpieza_telemetria > timedelta(hours=1):
+                    borradas = (await db_conn.execute(text("""
+                        DELETE FROM dispositivos_telemetria WHERE timestamp_muestra < :limite
+                    """), {"limite": ahora - timedelta(days=TELEMETRIA_RETENCION_DIAS)})).rowcount
+                    _ultima_limpieza_telemetria = ahora
+                    if borradas:
+                        print(f"🧹 Telemetría: {borradas} muestras con más de {TELEMETRIA_RETENCION_DIAS} días eliminadas")
+
+                await trans.commit()
+            except Exception:
+                await trans.rollback()
+                raise
+
+        return {
+            "success": True,
+            "estado": "activo",
+            "muestras_insertadas": len(muestras)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error al registrar heartbeat del dispositivo {request.dispositivo_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al registrar heartbeat: {str(e)}"
+        )
+
+
+@app.post("/internal/setup-telemetria-table")
+async def setup_telemetria_table(
+    is_authorized: bool = Depends(verify_internal_token)
+):
+    """
+    Endpoint interno para crear la tabla dispositivos_telemetria y la columna
+    dispositivos.ultimo_heartbeat si no existen. Protegido por token interno.
+    """
+    try:
+        async with engine.connect() as db_conn:
+            await db_conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS dispositivos_telemetria (
+                    id BIGSERIAL PRIMARY KEY,
+                    dispositivo_id INTEGER NOT NULL REFERENCES dispositivos(id) ON DELETE CASCADE,
+                    timestamp_muestra TIMESTAMP NOT NULL,
+                    fps_inferencia REAL,
+                    fps_captura REAL,
+                    latencia_p50_ms REAL,
+                    latencia_p95_ms REAL,
+                    latencia_max_ms REAL,
+                    uptime_seg INTEGER,
+                    cola_pendiente INTEGER,
+                    temperatura_cpu REAL,
+                    memoria_rss_mb REAL,
+                    fecha_registro TIMESTAMP DEFAULT NOW()
+                );
+            """))
+            await db_conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_telemetria_dispositivo_ts
+                ON dispositivos_telemetria(dispositivo_id, timestamp_muestra DESC);
+            """))
+            await db_conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS idx_telemetria_ts ON dispositivos_telemetria(timestamp_muestra);
+            """))
+            await db_conn.execute(text("ALTER TABLE dispositivos ADD COLUMN IF NOT EXISTS ultimo_heartbeat TIMESTAMP;"))
+            await db_conn.commit()
+            print("✅ Tabla dispositivos_telemetria y columna ultimo_heartbeat verificadas/creadas")
+
+            return {
+                "status": "success",
+                "message": "Tabla dispositivos_telemetria, índices y columna ultimo_heartbeat creados/verificados correctamente"
+            }
+
+    except Exception as e:
+        print(f"❌ Error al crear tabla dispositivos_telemetria: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al crear tabla: {str(e)}"
+        )
+
+
+@app.post("/internal/setup-notificaciones-outbox-table")
+async def setup_notificaciones_outbox_table(
+    is_authorized: bool = Depends(verify_internal_token)
+):
+    """
+    Endpoint interno para crear la tabla notificaciones_outbox (una fila por alerta con el estado
+    de cada canal) si no existe. Protegido por token interno.
+    """
+    try:
+        async with engine.connect() as db_conn:
+            await crear_tabla_notificaciones_outbox(db_conn)
+            await db_conn.commit()
+            print("✅ Tabla notificaciones_outbox verificada/creada")
+
+            return {
+                "status": "success",
+                "message": "Tabla notificaciones_outbox y sus índices creados/verificados correctamente"
+            }
+
+    except Exception as e:
+        print(f"❌ Error al crear tabla notificaciones_outbox: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al crear tabla: {str(e)}"
+        )
+
+
+@app.post("/internal/notificaciones/despachar")
+async def despachar_notificaciones(
+    is_authorized: bool = Depends(verify_internal_token)
+):
+    """
+    Despacha dentro de la petición las notificaciones pendientes (hasta vaciar la cola o 100 filas).
+    Respaldo para Cloud Scheduler cuando la instancia no tiene CPU fuera de las peticiones.
+    """
+    procesadas = 0
+    while procesadas < 100:
+        ronda = await notification_dispatcher.drain_async(http_client)
+        if ronda == 0:
+            break
+        procesadas += ronda
+    return {"status": "ok", "procesadas": procesadas}
+
+
+@app.get("/internal/notificaciones/{alerta_id}")
+async def obtener_estado_notificaciones(
+    alerta_id: int,
+    is_authorized: bool = Depends(verify_internal_token)
+):
+    """Estado de las notificaciones de una alerta y su reporte de entrega, por canal y destinatario"""
+    async with engine.connect() as db_conn:
+        fila = (await db_conn.execute(text("""
+            SELECT o.alerta_id, o.tipo_alerta, o.estado, o.intentos, o.canales, o.proximo_intento,
+                   o.fecha_creacion, o.fecha_actualizacion, a.reporte_notificaciones
+            FROM notificaciones_outbox o
+            JOIN alertas a ON a.id = o.alerta_id
+            WHERE o.alerta_id = :alerta_id
+        """), {"alerta_id": alerta_id})).fetchone()
+    if not fila:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay notificaciones para esta alerta.")
+    return dict(fila._mapping)
+
+
 @app.post("/internal/setup-alertas-vistas-table")
 async def setup_alertas_vistas_table(
     is_authorized: bool = Depends(verify_internal_token)
@@ -3605,7 +4419,7 @@ async def setup_alertas_vistas_table(
     Protegido por token interno.
     """
     try:
-        with engine.connect() as db_conn:
+        async with engine.connect() as db_conn:
             # Crear la tabla si no existe
             create_table_query = text("""
                 CREATE TABLE IF NOT EXISTS alertas_vistas (
@@ -3623,8 +4437,8 @@ async def setup_alertas_vistas_table(
                 );
             """)
 
-            db_conn.execute(create_table_query)
-            db_conn.commit()
+            await db_conn.execute(create_table_query)
+            await db_conn.commit()
             print("✅ Tabla alertas_vistas verificada/creada")
 
             # Crear índices si no existen
@@ -3636,8 +4450,8 @@ async def setup_alertas_vistas_table(
             ]
 
             for index_query in indices:
-                db_conn.execute(text(index_query))
-                db_conn.commit()
+                await db_conn.execute(text(index_query))
+                await db_conn.commit()
 
             print("✅ Índices verificados/creados")
 
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Verifica que TTLCache y FirebaseTokenVerifier sean idénticos en api-backend y alertas-websocket
+
+Cada servicio se construye desde su propio directorio, así que ese código está copiado en los
+dos main.py. Sale con código 1 y muestra el diff si las copias se separaron.
+
+Uso:
+    python servicios/check_auth_copies.py
+"""
+
+import difflib
+import sys
+from pathlib import Path
+
+SERVICIOS = Path(__file__).resolve().parent
+COPIAS = ("api-backend/main.py", "alertas-websocket/main.py")
+# (inicio, fin) de cada bloque copiado; el fin no se incluye
+BLOQUES = (
+    ("class TTLCache:", "\n\n"),
+    ("TOKEN_CACHE_MAX_ENTRIES = ", "token_verifier = FirebaseTokenVerifier()"),
+)
+
+
+def bloque(src: str, inicio: str, fin: str) -> str:
+    start = src.index(inicio)
+    if fin == "\n\n":
+        # TTLCache termina en la primera línea en blanco después de __len__
+        return src[start:src.index(fin, src.index("def __len__", start))]
+    return src[start:src.index(fin, start)]
+
+
+def main():
+    fuentes = [(SERVICIOS / path).read_text(encoding="utf-8") for path in COPIAS]
+    ok = True
+    for inicio, fin in BLOQUES:
+        a, b = (bloque(src, inicio, fin) for src in fuentes)
+        if a != b:
+            ok = False
+            print(f"❌ Bloque '{inicio.strip()}' distinto:")
+            sys.stdout.writelines(difflib.unified_diff(
+                a.splitlines(keepends=True), b.splitlines(keepends=True), *COPIAS))
+    if not ok:
+        sys.exit(1)
+    print(f"✅ TTLCache y FirebaseTokenVerifier idénticos en {' y '.join(COPIAS)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de FallDetector (máquina de estados) vs la versión anterior (deques + listas)
+
+Mide el costo por frame y la memoria transitoria que reserva cada update con secuencias
+sintéticas de métricas (sin cámara ni inferencia), y verifica que ambas versiones tomen
+las mismas decisiones: caídas nuevas, señales, contador, alertas, cooldown y timeout.
+
+Uso (en el NanoPi, con el venv del servicio):
+    python bench_fall_detector.py [--frames 20000]
+"""
+
+import argparse
+import platform
+import random
+import time
+import tracemalloc
+from collections import deque
+
+import fall_detection_edge as edge
+from fall_detection_edge import (FallDetector, SMOOTH_WINDOW, TORSO_TILT_DEG, HIP_Y_RATIO, ASPECT_THRESHOLD,
+                                 FRAMES_CONFIRM, ALERT_COOLDOWN_SEC, ALERT_TIMEOUT_SEC)
+
+
+class LegacyDetector:
+    """Versión anterior (DetectionState + update_detection + cooldown en el loop), copiada como referencia"""
+
+    def __init__(self):
+        self.tilt_hist = deque(maxlen=SMOOTH_WINDOW)
+        self.hip_hist = deque(maxlen=SMOOTH_WINDOW)
+        self.ar_hist = deque(maxlen=SMOOTH_WINDOW)
+        self.tilt_sum = 0.0
+        self.hip_sum = 0.0
+        self.ar_sum = 0.0
+        self.fall_counter = 0
+        self.alert_active = False
+        self.alert_start_time = 0
+        self.last_alert_time = -ALERT_COOLDOWN_SEC
+
+    def update(self, metrics, now):
+        _, _, torso_angle, hip_y_ratio, bbox = metrics or (None, None, None, None, None)
+        pose_signals = []
+
+        if torso_angle is not None:
+            if len(self.tilt_hist) >= SMOOTH_WINDOW:
+                self.tilt_sum -= self.tilt_hist[0]
+            self.tilt_hist.append(torso_angle)
+            self.tilt_sum += torso_angle
+            if self.tilt_sum / len(self.tilt_hist) > TORSO_TILT_DEG:
+                pose_signals.append("tilt")
+
+        if hip_y_ratio is not None:
+            if len(self.hip_hist) >= SMOOTH_WINDOW:
+                self.hip_sum -= self.hip_hist[0]
+            self.hip_hist.append(hip_y_ratio)
+            self.hip_sum += hip_y_ratio
+            if self.hip_sum / len(self.hip_hist) > HIP_Y_RATIO:
+                pose_signals.append("hip")
+
+        if bbox is not None:
+            x1, y1, x2, y2 = bbox
+            w = x2 - x1
+            h = y2 - y1
+            if h > 0:
+                ar = w / float(h)
+                if len(self.ar_hist) >= SMOOTH_WINDOW:
+                    self.ar_sum -= self.ar_hist[0]
+                self.ar_hist.append(ar)
+                self.ar_sum += ar
+                if self.ar_sum / len(self.ar_hist) > ASPECT_THRESHOLD:
+                    pose_signals.append("aspect")
+
+        prev_alert = self.alert_active
+        if len(pose_signals) >= 2:
+            self.fall_counter += 1
+        else:
+            self.fall_counter -= 2
+        self.fall_counter = max(0, min(self.fall_counter, FRAMES_CONFIRM * 2))
+        self.alert_active = self.fall_counter >= FRAMES_CONFIRM
+
+        timed_out = False
+        if self.alert_active and self.alert_start_time > 0:
+            if now - self.alert_start_time > ALERT_TIMEOUT_SEC:
+                self.fall_counter = 0
+                self.alert_active = False
+                self.alert_start_time = 0
+                prev_alert = False
+                timed_out = True
+
+        new_fall = self.alert_active and not prev_alert
+        if new_fall:
+            self.alert_start_time = now
+        if not self.alert_active:
+            self.alert_start_time = 0
+
+        alert = False
+        if new_fall and now - self.last_alert_time >= ALERT_COOLDOWN_SEC:
+            self.last_alert_time = now
+            alert = True
+        return new_fall, alert, tuple(pose_signals), self.fall_counter, self.alert_active, timed_out
+
+
+def make_sequence(rng, frames, fps=7.0):
+    """Métricas tipo landmark_metrics alternando tramos de pie, acostado, ruido y sin persona"""
+    samples = []
+    t = 1.0
+    mode = "de_pie"
+    for i in range(frames):
+        if i % 40 == 0:
+            mode = rng.choice(("de_pie", "de_pie", "acostado", "acostado_largo", "ruido", "sin_persona"))
+        t += 1.0 / fps
+        if mode == "sin_persona":
+            samples.append((t, None))
+            continue
+        if mode == "de_pie":
+            tilt, hip, ar = rng.uniform(0, 30), rng.uniform(0.4, 0.65), rng.uniform(0.3, 0.8)
+        elif mode in ("acostado", "acostado_largo"):
+            tilt, hip, ar = rng.uniform(60, 90), rng.uniform(0.72, 0.95), rng.uniform(1.6, 3.0)
+        else:
+            tilt, hip, ar = rng.uniform(0, 90), rng.uniform(0.3, 1.0), rng.uniform(0.3, 3.0)
+        h = rng.randint(20, 200)
+        bbox = (10, 10, 10 + int(h * ar), 10 + h) if rng.random() > 0.05 else None
+        samples.append((t, (None, None,
+                            tilt if rng.random() > 0.1 else None,
+                            hip if rng.random() > 0.1 else None,
+                            bbox)))
+        if mode == "acostado_largo":
+            t += 5.0  # Alertas que superan ALERT_TIMEOUT_SEC
+    return samples
+
+
+def decisions_match(legacy, detector, samples):
+    mismatches = 0
+    for now, metrics in samples:
+        expected = legacy.update(metrics, now)
+        d = detector.update(metrics, now)
+        got = (d.new_fall, d.alert, d.reasons, d.fall_counter, d.alert_active, d.timed_out)
+        mismatches += expected != got
+    return mismatches
+
+
+def bench(make, samples, rounds):
+    per_frame_us = []
+    for _ in range(rounds):
+        detector = make()
+        t0 = time.perf_counter()
+        for now, metrics in samples:
+            detector.update(metrics, now)
+        per_frame_us.append((time.perf_counter() - t0) / len(samples) * 1e6)
+    per_frame_us.sort()
+    return per_frame_us[0], per_frame_us[len(per_frame_us) // 2]
+
+
+def transient_bytes(make, samples):
+    """Pico de memoria reservada durante los updates por encima de la memoria ya en uso"""
+    detector = make()
+    detector.update(samples[0][1], samples[0][0])
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for now, metrics in samples:
+        detector.update(metrics, now)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak - base
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de FallDetector")
+    parser.add_argument("--frames", type=int, default=20000, help="Frames sintéticos por ronda")
+    parser.add_argument("--rounds", type=int, default=7, help="Rondas de medición")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    edge.log = lambda msg: None  # Sin logs de timeout durante la medición
+    samples = make_sequence(random.Random(args.seed), args.frames)
+    mismatches = decisions_match(LegacyDetector(), FallDetector(), samples)
+    detector = FallDetector()
+    falls = sum(detector.update(metrics, now).new_fall for now, metrics in samples)
+
+    print(f"Plataforma: {platform.machine()} | Python {platform.python_version()}")
+    print(f"Frames: {args.frames} x {args.rounds} rondas | Caídas en la secuencia: {falls} | "
+          f"Diferencias de decisión: {mismatches}")
+
+    for name, make in (("anterior", LegacyDetector), ("FallDetector", FallDetector)):
+        best, median = bench(make, samples, args.rounds)
+        peak = transient_bytes(make, samples)
+        print(f"{name:<12} mejor {best:6.2f} us/frame | mediana {median:6.2f} us/frame | "
+              f"memoria transitoria {peak} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de extract_pose_metrics (versión vectorizada vs versión anterior)
+
+Mide el costo por frame con landmarks sintéticos (sin cámara ni inferencia),
+y verifica que ambas versiones entreguen las mismas métricas.
+
+Uso (en el NanoPi, con el venv del servicio):
+    python bench_pose_metrics.py [--frames 20000]
+"""
+
+import argparse
+import math
+import platform
+import random
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from fall_detection_edge import extract_pose_metrics, FRAME_WIDTH, FRAME_HEIGHT
+
+
+def extract_pose_metrics_legacy(frame, results):
+    """Versión anterior (listas + np.array por frame), copiada como referencia"""
+    if not results or not results.pose_landmarks:
+        return None, None, None, None, None
+
+    H, W = frame.shape[:2]
+    lms = results.pose_landmarks.landmark
+
+    LS, RS, LH, RH = 11, 12, 23, 24
+    VMIN = 0.4
+
+    try:
+        ls_lm, rs_lm, lh_lm, rh_lm = lms[LS], lms[RS], lms[LH], lms[RH]
+
+        ls_xy = (int(ls_lm.x * W), int(ls_lm.y * H)) if ls_lm.visibility >= VMIN else None
+        rs_xy = (int(rs_lm.x * W), int(rs_lm.y * H)) if rs_lm.visibility >= VMIN else None
+        lh_xy = (int(lh_lm.x * W), int(lh_lm.y * H)) if lh_lm.visibility >= VMIN else None
+        rh_xy = (int(rh_lm.x * W), int(rh_lm.y * H)) if rh_lm.visibility >= VMIN else None
+
+        mid_shoulder = ((ls_xy[0] + rs_xy[0]) // 2, (ls_xy[1] + rs_xy[1]) // 2) if (ls_xy and rs_xy) else None
+        mid_hip = ((lh_xy[0] + rh_xy[0]) // 2, (lh_xy[1] + rh_xy[1]) // 2) if (lh_xy and rh_xy) else None
+
+        torso_angle = None
+        if mid_shoulder and mid_hip:
+            dx = abs(mid_hip[0] - mid_shoulder[0])
+            dy = mid_hip[1] - mid_shoulder[1]
+            if dy > 1e-6:
+                torso_angle = math.degrees(math.atan2(dx, dy))
+
+        hip_y_ratio = (mid_hip[1] / float(H)) if mid_hip else None
+
+        visible_points = [(int(lm.x * W), int(lm.y * H)) for lm in lms if lm.visibility >= VMIN]
+
+        bbox = None
+        if visible_points:
+            points_array = np.array(visible_points)
+            x_min, y_min = points_array.min(axis=0)
+            x_max, y_max = points_array.max(axis=0)
+
+            pad = 20
+            x1 = max(0, x_min - pad)
+            y1 = max(0, y_min - pad)
+            x2 = min(W - 1, x_max + pad)
+            y2 = min(H - 1, y_max + pad)
+
+            if x2 > x1 and y2 > y1:
+                bbox = (x1, y1, x2, y2)
+
+        return mid_shoulder, mid_hip, torso_angle, hip_y_ratio, bbox
+
+    except Exception:
+        return None, None, None, None, None
+
+
+def make_results(rng):
+    """Resultado tipo MediaPipe con 33 landmarks aleatorios (valores representables en float32)"""
+    landmarks = [
+        SimpleNamespace(
+            x=float(np.float32(rng.uniform(-0.05, 1.05))),
+            y=float(np.float32(rng.uniform(-0.05, 1.05))),
+            visibility=float(np.float32(rng.uniform(0.0, 1.0))),
+        )
+        for _ in range(33)
+    ]
+    return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=landmarks))
+
+
+def same_metrics(a, b):
+    for va, vb in zip(a, b):
+        if va is None or vb is None:
+            if va is not vb:
+                return False
+        elif isinstance(va, float):
+            if abs(va - vb) > 1e-6:
+                return False
+        elif tuple(int(v) for v in va) != tuple(int(v) for v in vb):
+            return False
+    return True
+
+
+def bench(fn, frame, samples, rounds):
+    per_frame_us = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for results in samples:
+            fn(frame, results)
+        per_frame_us.append((time.perf_counter() - t0) / len(samples) * 1e6)
+    return min(per_frame_us), float(np.median(per_frame_us))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de extract_pose_metrics")
+    parser.add_argument("--frames", type=int, default=2000, help="Frames sintéticos por ronda")
+    parser.add_argument("--rounds", type=int, default=7, help="Rondas de medición")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    samples = [make_results(rng) for _ in range(args.frames)]
+
+    mismatches = sum(
+        not same_metrics(extract_pose_metrics_legacy(frame, r), extract_pose_metrics(frame, r))
+        for r in samples
+    )
+    print(f"Plataforma: {platform.machine()} | Python {platform.python_version()} | numpy {np.__version__}")
+    print(f"Frames: {args.frames} x {args.rounds} rondas | Diferencias de métricas: {mismatches}")
+
+    for name, fn in (("anterior", extract_pose_metrics_legacy), ("vectorizada", extract_pose_metrics)):
+        best, median = bench(fn, frame, samples, args.rounds)
+        print(f"{name:<12} mejor {best:7.1f} us/frame | mediana {median:7.1f} us/frame")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Chequeo aleatorio de equivalencia: landmarks -> métricas -> decisión, versión anterior vs actual
+
+Genera secuencias de landmarks tipo MediaPipe con semilla fija (persona de pie que se cae,
+queda en el suelo, se levanta, pierde visibilidad o sale de cuadro), con coordenadas que caen
+seguido justo en un borde de píxel, y las pasa por las dos cadenas completas:
+    anterior: extract_pose_metrics_legacy + LegacyDetector
+    actual:   extract_pose_metrics + FallDetector
+Compara frame a frame las métricas (math.isclose) y las decisiones (exactas), y revisa
+invariantes de FallDetector: contador acotado, alerta solo en caída nueva, alertas separadas
+por ALERT_COOLDOWN_SEC y alert_active consistente con el contador.
+
+Sin mediciones de tiempo: sale con código 1 si encuentra una diferencia (reporta semilla y frame
+para reproducirla con --seed).
+
+Uso (en el NanoPi o en desarrollo, con el venv del servicio):
+    python check_fall_detector.py [--sequences 50] [--frames 600] [--seed 0]
+"""
+
+import argparse
+import math
+import random
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+import fall_detection_edge as edge
+from fall_detection_edge import (FallDetector, extract_pose_metrics, FRAME_WIDTH, FRAME_HEIGHT,
+                                 FRAMES_CONFIRM, ALERT_COOLDOWN_SEC)
+from bench_fall_detector import LegacyDetector
+from bench_pose_metrics import extract_pose_metrics_legacy
+
+# Índices MediaPipe de hombros y caderas: fijan el torso del esqueleto sintético
+SHOULDERS, HIPS = (11, 12), (23, 24)
+
+
+def f32(value):
+    """Valor representable en float32 (igual que los landmarks reales de MediaPipe)"""
+    return float(np.float32(value))
+
+
+def near_pixel_edge(rng, value, size):
+    """
+    A veces mueve la coordenada al float32 más cercano a un borde de píxel (k / size): ahí
+    `int(v * size)` depende de la precisión del producto, que es lo que más fácil se rompe
+    """
+    if rng.random() < 0.15:
+        return f32(round(value * size) / size)
+    return f32(value)
+
+
+class LandmarkSequence:
+    """Persona sintética: 33 landmarks alrededor de un torso que rota entre de pie y acostado"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.center = [rng.uniform(0.3, 0.7), rng.uniform(0.35, 0.6)]
+        self.angle = 0.0                    # 0 = de pie, 90 = acostado (grados)
+        self.target = 0.0
+        self.offsets = [(rng.uniform(-0.12, 0.12), rng.uniform(-0.35, 0.35)) for _ in range(33)]
+        self.visibility = [rng.uniform(0.3, 1.0) for _ in range(33)]
+        self.absent = 0                     # Frames restantes sin persona
+
+    def step(self):
+        rng = self.rng
+        if self.absent:
+            self.absent -= 1
+            return None
+        r = rng.random()
+        if r < 0.01:
+            self.absent = rng.randint(1, 30)
+            return None
+        if r < 0.04:
+            # Caída o recuperación: el torso rota y la cadera baja (o sube)
+            self.target = rng.choice((0.0, rng.uniform(60, 95), rng.uniform(20, 60)))
+        self.angle += (self.target - self.angle) * rng.uniform(0.2, 0.6)
+        lying = self.angle / 90.0
+        self.center[0] = min(1.0, max(0.0, self.center[0] + rng.gauss(0, 0.01)))
+        self.center[1] = min(1.0, max(0.0, 0.5 + 0.35 * lying + rng.gauss(0, 0.02)))
+
+        rad = math.radians(self.angle)
+        cos_a, sin_a = math.cos(rad), math.sin(rad)
+        landmarks = []
+        for i, (ox, oy) in enumerate(self.offsets):
+            if i in SHOULDERS:
+                ox, oy = (-0.05 if i == 11 else 0.05), -0.25
+            elif i in HIPS:
+                ox, oy = (-0.04 if i == 23 else 0.04), 0.0
+            x = self.center[0] + ox * cos_a - oy * sin_a + rng.gauss(0, 0.005)
+            y = self.center[1] + ox * sin_a + oy * cos_a + rng.gauss(0, 0.005)
+            self.visibility[i] = min(1.0, max(0.0, self.visibility[i] + rng.gauss(0, 0.08)))
+            landmarks.append(SimpleNamespace(x=near_pixel_edge(rng, x, FRAME_WIDTH),
+                                             y=near_pixel_edge(rng, y, FRAME_HEIGHT),
+                                             visibility=f32(self.visibility[i])))
+        return SimpleNamespace(pose_landmarks=SimpleNamespace(landmark=landmarks))
+
+
+def same_value(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, (tuple, list, np.ndarray)) or isinstance(b, (tuple, list, np.ndarray)):
+        return len(a) == len(b) and all(same_value(x, y) for x, y in zip(a, b))
+    return math.isclose(float(a), float(b), rel_tol=1e-6, abs_tol=1e-6)
+
+
+class Diferencia(Exception):
+    """Primer frame en que las versiones difieren o se rompe un invariante"""
+
+
+def check_sequence(seed, frames, fps):
+    """Retorna la cantidad de caídas de la secuencia; lanza Diferencia en el primer frame distinto"""
+    rng = random.Random(seed)
+    person = LandmarkSequence(rng)
+    frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    legacy, detector = LegacyDetector(), FallDetector()
+    last_alert = None
+    falls = 0
+    now = 1.0
+    for i in range(frames):
+        now += 1.0 / fps
+        if rng.random() < 0.02:
+            now += rng.uniform(1.0, 40.0)  # Huecos (frames descartados, alertas que vencen por timeout)
+        results = person.step()
+
+        expected_metrics = extract_pose_metrics_legacy(frame, results)
+        got_metrics = extract_pose_metrics(frame, results)
+        if not same_value(expected_metrics, got_metrics):
+            raise Diferencia(f"seed {seed} frame {i}: métricas {expected_metrics} != {got_metrics}")
+
+        expected = legacy.update(expected_metrics, now)
+        d = detector.update(got_metrics, now)
+        got = (d.new_fall, d.alert, d.reasons, d.fall_counter, d.alert_active, d.timed_out)
+        if expected != got:
+            raise Diferencia(f"seed {seed} frame {i}: decisión {expected} != {got}")
+
+        # Invariantes
+        if not 0 <= d.fall_counter <= FRAMES_CONFIRM * 2:
+            raise Diferencia(f"seed {seed} frame {i}: fall_counter fuera de rango ({d.fall_counter})")
+        if d.alert and not d.new_fall:
+            raise Diferencia(f"seed {seed} frame {i}: alerta sin caída nueva")
+        if d.alert_active != (d.fall_counter >= FRAMES_CONFIRM) and not d.timed_out:
+            raise Diferencia(f"seed {seed} frame {i}: alert_active inconsistente con fall_counter")
+        if d.alert:
+            if last_alert is not None and now - last_alert < ALERT_COOLDOWN_SEC:
+                raise Diferencia(f"seed {seed} frame {i}: alertas separadas por {now - last_alert:.1f}s < cooldown")
+            last_alert = now
+        falls += d.new_fall
+    return falls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Equivalencia aleatoria de métricas de pose y FallDetector")
+    parser.add_argument("--sequences", type=int, default=50, help="Secuencias aleatorias")
+    parser.add_argument("--frames", type=int, default=600, help="Frames por secuencia")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de la primera secuencia")
+    parser.add_argument("--fps", type=float, default=7.0)
+    args = parser.parse_args()
+
+    edge.log = lambda msg: None  # Sin logs de timeout de alerta
+    total_falls = 0
+    for seed in range(args.seed, args.seed + args.sequences):
+        try:
+            total_falls += check_sequence(seed, args.frames, args.fps)
+        except Diferencia as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+    print(f"✅ {args.sequences} secuencias x {args.frames} frames (semillas {args.seed}..{args.seed + args.sequences - 1}): "
+          f"métricas y decisiones idénticas, {total_falls} caídas, invariantes OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Detección de Caídas en Edge con MediaPipe
+Detección de Caídas en Edge con MediaPipe (o MoveNet TFLite, ver PoseEngine)
 Para NanoPi Neo4 + Cámara Dahua RTSP
 
 Optimizado para ARM64 y recursos limitados (1GB RAM)
@@ -14,20 +14,33 @@ OPTIMIZACIONES DE VELOCIDAD v2.0:
 - FRAMES_CONFIRM=3 para detección ultra-rápida (~0.5s)
 """
 
+import time
+STARTUP_T0 = time.monotonic()  # Inicio del proceso (el arranque medido incluye los imports)
+
+import argparse
 import cv2
 import math
 import os
 import sys
-import time
 import json
+import queue
+import random
+import socket
+import sqlite3
+import subprocess
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import gc  # Garbage collector para liberar memoria
+import hmac
+import tracemalloc
 import numpy as np
 from collections import deque
 from datetime import datetime, timezone
-from google.cloud import storage
-from threading import Thread
-import mediapipe as mp
+from threading import Thread, Condition, Event, Lock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
 
 # ===========================
 # CONFIGURACIÓN
@@ -37,6 +50,8 @@ import mediapipe as mp
 RTSP_USER = os.environ.get("RTSP_USER", "admin")
 RTSP_PASS = os.environ.get("RTSP_PASS", "Filianore.1")
 CAMERA_IP = os.environ.get("CAMERA_IP", "")  # Se carga desde /etc/camera_ip.env
+CAMERA_IPS = [ip.strip() for ip in os.environ.get("CAMERA_IPS", "").split(",") if ip.strip()]  # Multi-cámara: "ip1,ip2"
+CAMERA_IP_FILE = "/etc/camera_ip.env"  # Escrito por scan_camera.sh
 RTSP_PORT = os.environ.get("RTSP_PORT", "554")
 RTSP_PATH = os.environ.get("RTSP_PATH", "/cam/realmonitor?channel=1&subtype=1")  # subtype=1 = substream (menor RAM/bandwidth)
 
@@ -44,6 +59,9 @@ RTSP_PATH = os.environ.get("RTSP_PATH", "/cam/realmonitor?channel=1&subtype=1")
 BUCKET_NAME = os.environ.get("BUCKET_NAME", "nanopi-videos-input")
 BACKEND_API_URL = os.environ.get("BACKEND_API_URL", "https://api-backend-687053793381.southamerica-west1.run.app")
 INTERNAL_API_KEY = os.environ.get("INTERNAL_API_KEY", "CAMBIA_ESTA_CLAVE_SECRETA_POR_DEFECTO_TEST2")
+BACKEND_KEEPALIVE_SEC = int(os.environ.get("BACKEND_KEEPALIVE_SEC", "60"))  # Ping para mantener la conexión TLS caliente
+COOLDOWN_REFRESH_SEC = float(os.environ.get("COOLDOWN_REFRESH_SEC", "2"))   # Refresco en background del cooldown "Ya voy"
+COOLDOWN_MAX_AGE_SEC = float(os.environ.get("COOLDOWN_MAX_AGE_SEC", "2"))    # Copia más vieja -> el outbox refresca antes de notificar
 
 # Parámetros de detección (optimizados para velocidad + estabilidad)
 TORSO_TILT_DEG = 50      # inclinación torso (más sensible)
@@ -55,12 +73,109 @@ SMOOTH_WINDOW = 2        # suavizado mínimo para estabilidad
 # Procesamiento de video (OPTIMIZADO PARA VELOCIDAD - configuración probada estable)
 FRAME_WIDTH = 320        # Balance rendimiento/precisión (probado estable a 6.6-6.8 FPS)
 FRAME_HEIGHT = 240
-SKIP_FRAMES = 2          # Procesar cada 3er frame (balance velocidad/precisión)
+SKIP_FRAMES = 2          # Paso mínimo entre frames analizados (ya no descarta a ciegas, ver FrameRingBuffer)
+CAPTURE_BUFFER_SLOTS = 3 # Slots preasignados del ring buffer de captura (mínimo 2)
+
+# Backend de captura: auto = GStreamer con decodificación H.264 por hardware (MPP / V4L2 del
+# RK3399) si está disponible, si no FFmpeg por software; ffmpeg = siempre FFmpeg
+CAPTURE_BACKEND = os.environ.get("CAPTURE_BACKEND", "auto").lower()
+GST_DECODERS = tuple(d.strip() for d in os.environ.get(
+    "GST_DECODERS", "mppvideodec,v4l2slh264dec,v4l2h264dec").split(",") if d.strip())  # En orden de preferencia
+
+# Supervisión de la captura RTSP (reconexión en background + watchdog de stream congelado)
+CAPTURE_STALL_SEC = float(os.environ.get("CAPTURE_STALL_SEC", "10"))    # Sin frames o timestamps quietos -> reconectar
+CAPTURE_WATCHDOG_SEC = 1.0           # Revisión de salud del stream
+CAPTURE_BACKOFF_BASE_SEC = 1.0       # Primer reintento (se duplica en cada fallo, con jitter)
+CAPTURE_BACKOFF_MAX_SEC = float(os.environ.get("CAPTURE_BACKOFF_MAX_SEC", "30"))
+CAPTURE_REDISCOVER_SEC = int(os.environ.get("CAPTURE_REDISCOVER_SEC", "120"))  # Corte mínimo antes de buscar otra IP
+CAPTURE_RESCAN_INTERVAL_SEC = 900    # Mínimo entre scans de red
+CAPTURE_SCAN_TIMEOUT_SEC = 300
+SCAN_CAMERA_CMD = os.environ.get("SCAN_CAMERA_CMD", "/opt/vigilia-edge/scan_camera.sh")  # "" = sin redescubrimiento
+
+# Motor de pose: el pipeline de señales solo ve landmarks normalizados (ver PoseEngine)
+POSE_ENGINE = os.environ.get("POSE_ENGINE", "mediapipe").lower()  # mediapipe | movenet
+POSE_MODEL_PATH = os.environ.get("POSE_MODEL_PATH", "/opt/vigilia-edge/models/movenet_lightning_int8.tflite")
+POSE_THREADS = int(os.environ.get("POSE_THREADS", "2"))  # Threads de inferencia TFLite (RK3399: 2x A72 + 4x A53)
+MOVENET_MIN_SCORE = 0.2   # Si ningún keypoint supera este score no hay persona en el frame
+MOVENET_VMIN = 0.3        # Umbral de visibilidad para MoveNet (sus scores son más bajos que los de MediaPipe)
+
+# Compuerta de movimiento: en escenas estáticas la pose baja a una tasa keep-alive
+MOTION_GATE_ENABLED = os.environ.get("MOTION_GATE_ENABLED", "1") == "1"
+MOTION_SIZE = (80, 60)           # Resolución del frame gris para diferenciar (muy barato)
+MOTION_PIXEL_DELTA = 15          # Diferencia de intensidad (0-255) para contar un pixel como cambiado
+MOTION_MIN_AREA = 0.005          # Fracción de pixeles cambiados para considerar movimiento (0.5%)
+MOTION_HOLD_SEC = 3.0            # Tasa completa durante N segundos tras el último movimiento
+MOTION_IDLE_INTERVAL_SEC = float(os.environ.get("MOTION_IDLE_INTERVAL_SEC", "2.0"))  # Pose keep-alive en reposo
+
+# Control adaptativo (resolución y paso entre frames según latencia, temperatura y RAM)
+ADAPTIVE_ENABLED = os.environ.get("ADAPTIVE_ENABLED", "1") == "1"
+ADAPTIVE_TARGET_MS = float(os.environ.get("ADAPTIVE_TARGET_MS", "250"))  # Latencia objetivo captura -> decisión
+ADAPTIVE_RESOLUTIONS = ((FRAME_WIDTH, FRAME_HEIGHT), (256, 192), (192, 144))  # De mejor calidad a más barata
+ADAPTIVE_SKIP_MIN = int(os.environ.get("ADAPTIVE_SKIP_MIN", "1"))  # Límites del paso entre frames analizados
+ADAPTIVE_SKIP_MAX = int(os.environ.get("ADAPTIVE_SKIP_MAX", "6"))
+ADAPTIVE_INTERVAL_SEC = 5.0      # Cada cuánto se reevalúa el punto de operación
+ADAPTIVE_RECOVER_SEC = 30.0      # Holgura sostenida antes de subir calidad (evita oscilar)
+ADAPTIVE_TEMP_HOT_C = 75.0       # CPU sobre esta temperatura: bajar carga (el RK3399 throttlea ~85°C)
+ADAPTIVE_TEMP_HYST_C = 5.0       # Histéresis de temperatura para volver a subir
+ADAPTIVE_MEM_LOW_MB = 80         # MemAvailable mínimo antes de bajar resolución
 
 # Cooldown entre alertas (evitar spam)
 ALERT_COOLDOWN_SEC = 60  # 60 segundos entre alertas
 ALERT_TIMEOUT_SEC = 60   # Tiempo máximo en estado de alerta antes de reset automático (60s, se reduce a 10s con "Ya voy")
 
+# Snapshots de alertas
+SNAPSHOT_JPEG_QUALITY = int(os.environ.get("SNAPSHOT_JPEG_QUALITY", "85"))  # Calidad JPEG (0-100) de snapshots
+SNAPSHOT_VARIANTS_ENABLED = os.environ.get("SNAPSHOT_VARIANTS_ENABLED", "1") == "1"
+SNAPSHOT_VARIANTS = (            # (nombre, ancho máximo, calidad JPEG): se suben junto al original
+    ("thumb", 160, 60),          # Miniatura para listas y notificaciones (~3-5KB)
+    ("medium", 320, 70),         # Vista en el celular (~10-15KB vs ~40KB+ del original)
+)
+
+# Clip pre-evento (tira de frames de los segundos previos a la caída -> url_video_almacenado)
+CLIP_ENABLED = os.environ.get("CLIP_ENABLED", "1") == "1"
+CLIP_PRE_SEC = float(os.environ.get("CLIP_PRE_SEC", "6"))        # Segundos previos a la confirmación
+CLIP_FPS = 2.0                   # Frames por segundo guardados en el buffer
+CLIP_SIZE = (160, 120)           # Resolución de cada frame del clip (~4KB en JPEG)
+CLIP_JPEG_QUALITY = 70
+CLIP_MAX_BYTES = int(os.environ.get("CLIP_MAX_BYTES", str(1024 * 1024)))  # Tope duro del buffer en RAM (1MB)
+CLIP_STRIP_COLUMNS = 4           # Columnas de la tira (12 frames -> grilla 4x3 de 640x360)
+CLIP_STRIP_MAX_FRAMES = 16       # Tope de frames en la tira (se submuestrea si hay más)
+
+# Outbox persistente de alertas (SQLite WAL): sobrevive a cortes de internet y reinicios
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", "/opt/vigilia-edge/outbox.db")
+OUTBOX_MAX_EVENTS = int(os.environ.get("OUTBOX_MAX_EVENTS", "500"))            # Máximo de alertas pendientes en disco
+OUTBOX_MAX_BYTES = int(os.environ.get("OUTBOX_MAX_BYTES", str(20 * 1024 * 1024)))  # Máximo de bytes de snapshots en disco
+OUTBOX_MEM_QUEUE = 8                # Alertas en RAM esperando ser persistidas (frames crudos)
+OUTBOX_BACKOFF_BASE_SEC = 2         # Backoff exponencial: 2s, 4s, 8s, ... (con jitter)
+OUTBOX_BACKOFF_MAX_SEC = 300        # Tope del backoff (5 min)
+OUTBOX_SNAPSHOT_MAX_ATTEMPTS = 3    # Tras N fallos de GCS se notifica sin snapshot (no retrasar al cuidador)
+
+# Heartbeat / telemetría al backend (muestras acumuladas, envío en lote)
+SOFTWARE_VERSION = "2.1.0"
+TELEMETRY_SAMPLE_SEC = int(os.environ.get("TELEMETRY_SAMPLE_SEC", "60"))   # Una muestra por minuto
+TELEMETRY_SEND_SEC = int(os.environ.get("TELEMETRY_SEND_SEC", "300"))      # Lote cada 5 minutos
+TELEMETRY_MAX_SAMPLES = 240          # Tope de muestras en RAM si el backend no responde (4h)
+TELEMETRY_LATENCY_WINDOW = 2000      # Latencias guardadas entre muestras para los percentiles
+
+# Métricas (endpoint HTTP en formato Prometheus, solo stdlib)
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))   # 0 = deshabilitado
+METRICS_BIND = os.environ.get("METRICS_BIND", "0.0.0.0")     # /metrics es de solo lectura (scraper de la flota)
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN", "").strip()      # /debug/* desde otra máquina: header X-Debug-Token
+METRICS_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.35, 0.5, 1.0, 2.5, 5.0, 10.0)  # Segundos
+METRICS_OUTAGE_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 900.0, 3600.0)          # Cortes de video
+
+# Gobernador de memoria (presupuesto de RSS del proceso con recorte de carga por escalones)
+MEMORY_BUDGET_MB = int(os.environ.get("MEMORY_BUDGET_MB", "500"))  # 0 = sin recorte (solo medición)
+MEMORY_SHED_STEPS = (0.80, 0.90, 0.95)  # Fracción del presupuesto de cada escalón: buffer pre-evento,
+                                        # resolución mínima, pausa de uploads secundarios
+MEMORY_CHECK_SEC = 5.0           # Revisión del RSS contra el presupuesto
+MEMORY_RECOVER_MARGIN = 0.05     # Bajar de escalón requiere RSS bajo (umbral - 5% del presupuesto)...
+MEMORY_RECOVER_SEC = 60.0        # ...sostenido este tiempo (evita oscilar)
+MEMORY_CLIP_SHED_DIVISOR = 4     # Escalón 1: el buffer pre-evento guarda 1/4 de bytes y la mitad de segundos
+MEMORY_TRACEMALLOC = os.environ.get("MEMORY_TRACEMALLOC", "0") == "1"  # Trazar allocs desde el arranque (cuesta CPU)
+MEMORY_TOP_N = 10                # Top de líneas que más memoria reservaron (tracemalloc)
+MEMORY_SOAK_SAMPLE_SEC = 30.0    # Intervalo mínimo entre muestras de RSS del modo soak
+
 # Hardware ID
 def get_hardware_id():
     """Obtiene la MAC address de eth0 como ID único"""
@@ -74,24 +189,6 @@ def get_hardware_id():
 
 HARDWARE_ID = get_hardware_id()
 
-# ===========================
-# MEDIAPIPE SETUP (Optimizado)
-# ===========================
-print("🤖 Inicializando MediaPipe Pose (modo lite para ARM)...")
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
-
-# Configuración optimizada para ARM/edge
-pose = mp_pose.Pose(
-    static_image_mode=False,
-    model_complexity=0,  # 0 = lite (más rápido en ARM)
-    smooth_landmarks=True,
-    enable_segmentation=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
-print("✅ MediaPipe inicializado (modelo lite)")
-
 # ===========================
 # FUNCIONES AUXILIARES
 # ===========================
@@ -100,24 +197,82 @@ def log(msg):
     """Log con timestamp"""
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
 
-def load_camera_ip():
-    """Carga la IP de la cámara desde el archivo de entorno"""
-    global CAMERA_IP
+class StartupTimer:
+    """
+    Fases del arranque hasta la primera inferencia. Con Restart=always nadie vigila al
+    adulto mayor mientras el servicio arranca: este tiempo se loguea y se expone en /metrics
+    """
+
+    def __init__(self):
+        self.last = STARTUP_T0
+        self.phases = []
+        self.done = False
+
+    def mark(self, phase):
+        now = time.monotonic()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+        metrics.set("vigilia_startup_phase_seconds", round(self.phases[-1][1], 3), fase=phase)
+
+    def finish(self):
+        """Cierra el arranque en la primera inferencia y loguea el desglose"""
+        self.mark("primera inferencia")
+        self.done = True
+        total = self.last - STARTUP_T0
+        metrics.set("vigilia_time_to_first_inference_seconds", round(total, 3))
+        detail = " | ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases)
+        log(f"⏱️  Arranque hasta la primera inferencia: {total:.2f}s ({detail})")
+
+def load_camera_ips():
+    """
+    Carga las IPs de cámara. CAMERA_IPS (env o /etc/camera_ip.env) habilita multi-cámara;
+    si no existe se usa la única CAMERA_IP del archivo de entorno. Retorna la lista (vacía si no hay)
+    """
+    global CAMERA_IP, CAMERA_IPS
     try:
-        with open('/etc/camera_ip.env', 'r') as f:
+        with open(CAMERA_IP_FILE, 'r') as f:
             for line in f:
-                if line.startswith('CAMERA_IP='):
-                    CAMERA_IP = line.split('=')[1].strip()
-                    return True
+                key, _, value = line.strip().partition('=')
+                if key == 'CAMERA_IP':
+                    CAMERA_IP = value.strip()
+                elif key == 'CAMERA_IPS' and not CAMERA_IPS:
+                    CAMERA_IPS = [ip.strip() for ip in value.split(',') if ip.strip()]
     except Exception as e:
-        log(f"⚠️  No se pudo cargar IP de cámara: {e}")
-    return False
+        if not CAMERA_IPS:
+            log(f"⚠️  No se pudo cargar IP de cámara: {e}")
+            return []
+    if not CAMERA_IPS and CAMERA_IP:
+        CAMERA_IPS = [CAMERA_IP]
+    if CAMERA_IPS:
+        CAMERA_IP = CAMERA_IPS[0]
+    return CAMERA_IPS
+
+def read_camera_ip_file():
+    """CAMERA_IP actual de CAMERA_IP_FILE (la reescribe scan_camera.sh) o None"""
+    try:
+        with open(CAMERA_IP_FILE, 'r') as f:
+            for line in f:
+                key, _, value = line.strip().partition('=')
+                if key == 'CAMERA_IP' and value.strip():
+                    return value.strip()
+    except OSError:
+        pass
+    return None
+
+def rtsp_port_open(camera_ip, timeout=2.0):
+    """True si la IP acepta conexiones en el puerto RTSP (la cámara sigue ahí)"""
+    try:
+        with socket.create_connection((camera_ip, int(RTSP_PORT)), timeout=timeout):
+            return True
+    except (OSError, ValueError):
+        return False
 
-def get_camera_url():
-    """Construye la URL RTSP"""
-    if not CAMERA_IP:
+def get_camera_url(camera_ip=None):
+    """Construye la URL RTSP (por defecto de CAMERA_IP)"""
+    camera_ip = camera_ip or CAMERA_IP
+    if not camera_ip:
         return None
-    return f"rtsp://{RTSP_USER}:{RTSP_PASS}@{CAMERA_IP}:{RTSP_PORT}{RTSP_PATH}"
+    return f"rtsp://{RTSP_USER}:{RTSP_PASS}@{camera_ip}:{RTSP_PORT}{RTSP_PATH}"
 
 def angle_from_vertical(p_top, p_bottom):
     """Ángulo respecto a la vertical"""
@@ -139,33 +294,87 @@ def midpoint(p1, p2):
 def to_px(lm, W, H):
     return (int(lm.x * W), int(lm.y * H)), lm.visibility
 
+# Buffers preasignados para extract_pose_metrics (se reutilizan en cada frame, sin allocs de numpy).
+# Las vistas también se crean una sola vez: en arrays de 33 filas el overhead por llamada domina.
+NUM_LANDMARKS = 33
+VMIN = 0.4
+BBOX_PAD = 20
+
+LANDMARK_BUF = np.zeros((NUM_LANDMARKS, 3), dtype=np.float32)  # x, y, visibility (normalizados)
+LANDMARK_FLAT = LANDMARK_BUF.ravel()
+# Vista (33, 2, 2) que repite (x, y) dos veces sin copiar -> [[x, y], [x, y]] por landmark
+LANDMARK_XY2 = np.lib.stride_tricks.as_strided(
+    LANDMARK_BUF, shape=(NUM_LANDMARKS, 2, 2),
+    strides=(LANDMARK_BUF.strides[0], 0, LANDMARK_BUF.strides[1]), writeable=False
+)
+LANDMARK_VIS = LANDMARK_BUF[:, 2:]
+
+# Píxeles truncados (como int()) en layout (x, y, -x, -y): min enmascarado = min y max en una reducción.
+# float64 como `int(lm.x * W)` en Python: en float32 un producto cercano a un entero puede
+# redondear al otro lado y truncar a un píxel distinto.
+PX_BUF = np.zeros((NUM_LANDMARKS, 4), dtype=np.float64)
+PX_XY2 = PX_BUF.reshape(NUM_LANDMARKS, 2, 2)
+PX_SCALE = np.zeros((2, 2), dtype=np.float64)                  # [[W, H], [-W, -H]]
+VIS_MASK = np.zeros((NUM_LANDMARKS, 1), dtype=bool)
+BBOX_BUF = np.zeros(4, dtype=np.float64)                       # x_min, y_min, -x_max, -y_max
+
+# Hombros (11, 12) y caderas (23, 24): slices con paso 12 -> [hombro, cadera] izq / der
+MID_BUF = np.zeros((2, 2), dtype=np.float64)                   # [mid_shoulder, mid_hip]
+PAIR_VIS = np.zeros((2, 1), dtype=bool)
+PX_LEFT = PX_BUF[11:24:12, :2]
+PX_RIGHT = PX_BUF[12:25:12, :2]
+VIS_LEFT = VIS_MASK[11:24:12]
+VIS_RIGHT = VIS_MASK[12:25:12]
+
+def fill_landmarks(lms):
+    """Copia los 33 landmarks de MediaPipe al array (33, 3) preasignado, en su lugar (sin listas por frame)"""
+    if len(lms) != NUM_LANDMARKS:
+        raise ValueError(f"se esperaban {NUM_LANDMARKS} landmarks, llegaron {len(lms)}")
+    flat = LANDMARK_FLAT
+    i = 0
+    for lm in lms:
+        flat[i] = lm.x
+        flat[i + 1] = lm.y
+        flat[i + 2] = lm.visibility
+        i += 3
+    return LANDMARK_BUF
+
 def extract_pose_metrics(frame, results):
-    """Extrae métricas de postura (OPTIMIZADO para velocidad)"""
+    """Extrae métricas de postura desde el resultado de MediaPipe Pose"""
     if not results or not results.pose_landmarks:
         return None, None, None, None, None
+    try:
+        fill_landmarks(results.pose_landmarks.landmark)
+    except Exception:
+        return None, None, None, None, None
+    return landmark_metrics(frame)
 
+def landmark_metrics(frame, vmin=VMIN):
+    """
+    Métricas de postura desde LANDMARK_BUF (VECTORIZADO con numpy sobre buffers preasignados).
+    Independiente del motor de pose: basta con que el motor llene el buffer en índices MediaPipe
+    """
     H, W = frame.shape[:2]
-    lms = results.pose_landmarks.landmark
-
-    # Índices de landmarks clave
-    LS, RS, LH, RH = 11, 12, 23, 24
-    VMIN = 0.4
 
     try:
-        # Extraer landmarks clave directamente (sin función auxiliar)
-        ls_lm, rs_lm, lh_lm, rh_lm = lms[LS], lms[RS], lms[LH], lms[RH]
-
-        # Convertir a píxeles solo si visibilidad suficiente
-        ls_xy = (int(ls_lm.x * W), int(ls_lm.y * H)) if ls_lm.visibility >= VMIN else None
-        rs_xy = (int(rs_lm.x * W), int(rs_lm.y * H)) if rs_lm.visibility >= VMIN else None
-        lh_xy = (int(lh_lm.x * W), int(lh_lm.y * H)) if lh_lm.visibility >= VMIN else None
-        rh_xy = (int(rh_lm.x * W), int(rh_lm.y * H)) if rh_lm.visibility >= VMIN else None
-
-        # Calcular puntos medios inline
-        mid_shoulder = ((ls_xy[0] + rs_xy[0]) // 2, (ls_xy[1] + rs_xy[1]) // 2) if (ls_xy and rs_xy) else None
-        mid_hip = ((lh_xy[0] + rh_xy[0]) // 2, (lh_xy[1] + rh_xy[1]) // 2) if (lh_xy and rh_xy) else None
-
-        # Calcular ángulo de torso inline
+        # Escala a píxeles (x, y, -x, -y) + truncado + máscara de visibilidad
+        if PX_SCALE[0, 0] != W or PX_SCALE[0, 1] != H:
+            PX_SCALE[:] = ((W, H), (-W, -H))
+        np.multiply(LANDMARK_XY2, PX_SCALE, out=PX_XY2)
+        np.trunc(PX_BUF, out=PX_BUF)
+        np.greater_equal(LANDMARK_VIS, vmin, out=VIS_MASK)
+
+        # Puntos medios de hombros y caderas a la vez
+        np.add(PX_LEFT, PX_RIGHT, out=MID_BUF)
+        np.floor_divide(MID_BUF, 2, out=MID_BUF)
+        np.logical_and(VIS_LEFT, VIS_RIGHT, out=PAIR_VIS)
+
+        (sx, sy), (hx, hy) = MID_BUF.tolist()
+        (shoulder_ok,), (hip_ok,) = PAIR_VIS.tolist()
+        mid_shoulder = (int(sx), int(sy)) if shoulder_ok else None
+        mid_hip = (int(hx), int(hy)) if hip_ok else None
+
+        # Ángulo de torso respecto a la vertical
         torso_angle = None
         if mid_shoulder and mid_hip:
             dx = abs(mid_hip[0] - mid_shoulder[0])
@@ -176,23 +385,17 @@ def extract_pose_metrics(frame, results):
         # Hip Y ratio
         hip_y_ratio = (mid_hip[1] / float(H)) if mid_hip else None
 
-        # BBox aproximada usando numpy para velocidad
-        # Extraer solo coordenadas visibles en un solo paso
-        visible_points = [(int(lm.x * W), int(lm.y * H)) for lm in lms if lm.visibility >= VMIN]
+        # BBox de landmarks visibles (una sola reducción enmascarada)
+        np.min(PX_BUF, axis=0, where=VIS_MASK, initial=np.inf, out=BBOX_BUF)
+        x_min, y_min, neg_x_max, neg_y_max = BBOX_BUF.tolist()
 
         bbox = None
-        if visible_points:
-            # Usar numpy para min/max rápido
-            points_array = np.array(visible_points)
-            x_min, y_min = points_array.min(axis=0)
-            x_max, y_max = points_array.max(axis=0)
-
+        if x_min != math.inf:  # Al menos un landmark visible
             # Padding
-            pad = 20
-            x1 = max(0, x_min - pad)
-            y1 = max(0, y_min - pad)
-            x2 = min(W - 1, x_max + pad)
-            y2 = min(H - 1, y_max + pad)
+            x1 = max(0, int(x_min) - BBOX_PAD)
+            y1 = max(0, int(y_min) - BBOX_PAD)
+            x2 = min(W - 1, int(-neg_x_max) + BBOX_PAD)
+            y2 = min(H - 1, int(-neg_y_max) + BBOX_PAD)
 
             if x2 > x1 and y2 > y1:
                 bbox = (x1, y1, x2, y2)
@@ -202,61 +405,1093 @@ def extract_pose_metrics(frame, results):
     except Exception:
         return None, None, None, None, None
 
-def save_snapshot_to_gcs(frame):
-    """Guarda snapshot en GCS y retorna URL (síncrono - solo para thread)"""
+# ===========================
+# MOTORES DE POSE
+# ===========================
+
+class PoseEngine:
+    """
+    Interfaz de motor de pose. El pipeline de señales (inclinación, ratio de cadera, aspecto
+    del bbox, histéresis) solo ve LANDMARK_BUF: cada motor llena x, y, visibilidad normalizados
+    en los índices de MediaPipe (hombros 11/12, caderas 23/24...) y deja en 0 los que no tiene.
+    """
+    name = "base"
+    vmin = VMIN  # Umbral de visibilidad acorde a los scores del motor
+
+    def detect(self, rgb):
+        """Corre el modelo sobre un frame RGB. True si hay persona (LANDMARK_BUF lleno)"""
+        raise NotImplementedError
+
+    def estimate(self, frame, rgb):
+        """detect + métricas de postura del frame (ver landmark_metrics)"""
+        if not self.detect(rgb):
+            return None, None, None, None, None
+        return landmark_metrics(frame, self.vmin)
+
+    def describe(self):
+        return self.name
+
+    def close(self):
+        pass
+
+class MediaPipeEngine(PoseEngine):
+    """
+    MediaPipe Pose lite (BlazePose). Con varias cámaras se usa static_image_mode=True: los frames
+    llegan intercalados y el tracking/suavizado entre frames mezclaría personas de distintas
+    salas (el suavizado temporal lo hace el FallDetector de cada cámara).
+    """
+    name = "mediapipe"
+
+    def __init__(self, multi=False):
+        import mediapipe as mp
+        self.pose = mp.solutions.pose.Pose(
+            static_image_mode=multi,
+            model_complexity=0,  # 0 = lite (más rápido en ARM)
+            smooth_landmarks=not multi,
+            enable_segmentation=False,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+
+    def detect(self, rgb):
+        results = self.pose.process(rgb)
+        if not results or not results.pose_landmarks:
+            return False
+        fill_landmarks(results.pose_landmarks.landmark)
+        return True
+
+    def describe(self):
+        return "MediaPipe Pose lite"
+
+    def close(self):
+        self.pose.close()
+
+class MoveNetEngine(PoseEngine):
+    """
+    MoveNet SinglePose en TFLite (ej. Lightning int8, ~3MB) con POSE_THREADS threads.
+
+    La entrada es cuadrada: el frame se escala sin deformar y se rellena abajo/derecha con
+    negro (letterbox). Los 17 keypoints COCO se llevan a coordenadas normalizadas del frame y
+    a los índices de MediaPipe. Sin tracking entre frames: sirve igual con varias cámaras.
+    """
+    name = "movenet"
+    vmin = MOVENET_VMIN
+    # Nariz, ojos, orejas, hombros, codos, muñecas, caderas, rodillas, tobillos (orden COCO)
+    COCO_TO_MEDIAPIPE = np.array((0, 2, 5, 7, 8, 11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28))
+
+    def __init__(self, multi=False, model_path=POSE_MODEL_PATH, threads=POSE_THREADS):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            try:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+            except ImportError:
+                raise RuntimeError("POSE_ENGINE=movenet requiere tflite-runtime (pip install tflite-runtime)")
+        if not os.path.exists(model_path):
+            raise RuntimeError(f"No existe el modelo MoveNet {model_path} (ver POSE_MODEL_PATH)")
+
+        self.threads = threads
+        self.interpreter = Interpreter(model_path=model_path, num_threads=threads)
+        self.interpreter.allocate_tensors()
+        input_details = self.interpreter.get_input_details()[0]
+        self.input_index = input_details["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.size = int(input_details["shape"][1])  # 192 Lightning, 256 Thunder
+        self.input = np.zeros((1, self.size, self.size, 3), dtype=input_details["dtype"])
+        self.content = None  # (h, w) del frame escalado dentro de la entrada
+
+    def detect(self, rgb):
+        H, W = rgb.shape[:2]
+        scale = self.size / max(H, W)
+        w, h = max(1, round(W * scale)), max(1, round(H * scale))
+        if self.content != (h, w):
+            self.input.fill(0)  # Cambió la relación de aspecto: limpiar el relleno
+            self.content = (h, w)
+        self.input[0, :h, :w] = cv2.resize(rgb, (w, h), interpolation=cv2.INTER_AREA)
+
+        self.interpreter.set_tensor(self.input_index, self.input)
+        self.interpreter.invoke()
+        keypoints = self.interpreter.get_tensor(self.output_index)[0, 0]  # (17, 3): y, x, score
+        if keypoints[:, 2].max() < MOVENET_MIN_SCORE:
+            return False
+
+        idx = self.COCO_TO_MEDIAPIPE
+        LANDMARK_BUF.fill(0)
+        LANDMARK_BUF[idx, 0] = keypoints[:, 1] * (self.size / w)
+        LANDMARK_BUF[idx, 1] = keypoints[:, 0] * (self.size / h)
+        LANDMARK_BUF[idx, 2] = keypoints[:, 2]
+        return True
+
+    def describe(self):
+        return f"MoveNet {self.size}px TFLite ({self.threads} threads)"
+
+POSE_ENGINES = {"mediapipe": MediaPipeEngine, "movenet": MoveNetEngine}
+
+def create_pose_engine(name=POSE_ENGINE, multi=False):
+    """Instancia el motor de pose por nombre. multi=True: frames intercalados de varias cámaras"""
+    if name not in POSE_ENGINES:
+        raise ValueError(f"Motor de pose desconocido: {name} (opciones: {', '.join(POSE_ENGINES)})")
+    return POSE_ENGINES[name](multi=multi)
+
+class PoseEngineLoader(Thread):
+    """
+    Carga el motor de pose en background (import de mediapipe/tflite + grafo del modelo,
+    lo más lento del arranque) mientras main() abre el RTSP y se registra en el backend
+    """
+
+    def __init__(self, engine_name, multi=False):
+        super().__init__(daemon=True, name="pose-loader")
+        self.engine_name = engine_name
+        self.multi = multi
+        self.engine = None
+        self.error = None
+        self.load_s = 0.0
+
+    def run(self):
+        t0 = time.monotonic()
+        try:
+            self.engine = create_pose_engine(self.engine_name, self.multi)
+        except Exception as e:
+            self.error = e
+        self.load_s = time.monotonic() - t0
+
+    def result(self):
+        """Espera la carga. Retorna el motor o relanza el error de inicialización"""
+        self.join()
+        if self.error:
+            raise self.error
+        return self.engine
+
+# ===========================
+# COMPUERTA DE MOVIMIENTO
+# ===========================
+
+class MotionGate:
+    """
+    Decide si vale la pena correr MediaPipe en el frame actual.
+
+    Diferencia de frames sobre una versión gris de 80x60 (buffers preasignados, ~0.2ms).
+    Con movimiento la pose corre a tasa completa de inmediato; en escena estática baja a una
+    inferencia cada MOTION_IDLE_INTERVAL_SEC. Si el detector ya tiene señales de caída
+    (persona acostada, contador > 0 o alerta activa) nunca se salta la pose.
+    """
+
+    def __init__(self):
+        self.small = np.zeros((MOTION_SIZE[1], MOTION_SIZE[0], 3), dtype=np.uint8)
+        self.gray = np.zeros((MOTION_SIZE[1], MOTION_SIZE[0]), dtype=np.uint8)
+        self.prev = np.zeros_like(self.gray)
+        self.diff = np.zeros_like(self.gray)
+        self.has_prev = False
+        self.last_motion = 0.0
+        self.last_pose = 0.0
+        self.frames_gated = 0
+
+    def has_motion(self, frame):
+        """True si cambió al menos MOTION_MIN_AREA de la escena respecto al frame anterior"""
+        cv2.resize(frame, MOTION_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        # Con frames RGB (GStreamer) el gris pondera R y B al revés: indiferente para la diferencia
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if not self.has_prev:
+            self.has_prev = True
+            self.prev, self.gray = self.gray, self.prev
+            return True
+        cv2.absdiff(self.gray, self.prev, dst=self.diff)
+        cv2.threshold(self.diff, MOTION_PIXEL_DELTA, 255, cv2.THRESH_BINARY, dst=self.diff)
+        changed = cv2.countNonZero(self.diff)
+        self.prev, self.gray = self.gray, self.prev  # Intercambio de buffers (sin copia)
+        return changed >= MOTION_MIN_AREA * self.diff.size
+
+    def should_run_pose(self, frame, now, detector):
+        """Aplica las reglas de la compuerta; `now` en el mismo reloj que FallDetector.update"""
+        if self.has_motion(frame):
+            self.last_motion = now
+        run = (
+            now - self.last_motion < MOTION_HOLD_SEC              # Movimiento reciente: tasa completa
+            or detector.fall_counter > 0 or detector.alert_active # Persona ya acostada: seguir confirmando
+            or now - self.last_pose >= MOTION_IDLE_INTERVAL_SEC   # Keep-alive en reposo
+        )
+        if run:
+            self.last_pose = now
+        else:
+            self.frames_gated += 1
+        return run
+
+# ===========================
+# CONTROL ADAPTATIVO (punto de operación)
+# ===========================
+
+def read_cpu_temp():
+    """Temperatura de CPU en °C (thermal_zone0) o None si no está disponible"""
     try:
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{HARDWARE_ID}/snapshots/fall_{ts}.jpg"
-        local_path = f"/tmp/fall_{ts}.jpg"
+        with open("/sys/class/thermal/thermal_zone0/temp") as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
 
-        # Guardar localmente
-        cv2.imwrite(local_path, frame)
-        log(f"📸 Snapshot guardado localmente: {local_path}")
+def read_mem_available_mb():
+    """MemAvailable de /proc/meminfo en MB o None si no está disponible"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class AdaptiveController:
+    """
+    Ajusta resolución de entrada y paso entre frames para sostener ADAPTIVE_TARGET_MS.
+
+    Mide la latencia captura -> decisión y el tiempo de inferencia (EWMA) y cada
+    ADAPTIVE_INTERVAL_SEC lee temperatura de CPU y RAM libre:
+      - Latencia alta o poca RAM -> baja la resolución (si ya es la mínima, sube el paso)
+      - CPU caliente -> sube el paso (si ya es el máximo, baja la resolución)
+      - Holgura sostenida ADAPTIVE_RECOVER_SEC -> recupera un escalón (primero resolución)
+    Cada cambio se registra en el log.
+    """
+
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, skip=SKIP_FRAMES, resolutions=ADAPTIVE_RESOLUTIONS, target_ms=ADAPTIVE_TARGET_MS):
+        self.resolutions = resolutions
+        self.level = 0
+        self.skip = min(max(skip, ADAPTIVE_SKIP_MIN), ADAPTIVE_SKIP_MAX)
+        self.target = target_ms / 1000.0
+        self.latency = None    # EWMA captura -> decisión (s)
+        self.infer = None      # EWMA resize + color + pose + métricas (s)
+        self.temp_c = None
+        self.mem_mb = None
+        self.changes = 0
+        self.last_eval = 0.0
+        self.calm_since = None
+        self.min_level = 0     # Piso de resolución impuesto por el gobernador de memoria
+        self._buffers = {}     # Un buffer preasignado por resolución
+
+    @property
+    def size(self):
+        return self.resolutions[self.level]
+
+    def prepare(self, frame):
+        """Redimensiona al punto de operación actual (nunca agranda). Válido hasta la siguiente llamada"""
+        w, h = self.size
+        if frame.shape[1] <= w:
+            return frame
+        buf = self._buffers.get((w, h))
+        if buf is None:
+            buf = self._buffers[(w, h)] = np.empty((h, w, 3), dtype=np.uint8)
+        cv2.resize(frame, (w, h), dst=buf, interpolation=cv2.INTER_AREA)
+        return buf
+
+    def observe(self, latency, infer, now):
+        """Registra un frame analizado; reevalúa el punto de operación cada ADAPTIVE_INTERVAL_SEC"""
+        if self.latency is None:
+            self.latency, self.infer = latency, infer
+        else:
+            self.latency += self.EWMA_ALPHA * (latency - self.latency)
+            self.infer += self.EWMA_ALPHA * (infer - self.infer)
+        if now - self.last_eval >= ADAPTIVE_INTERVAL_SEC:
+            self.last_eval = now
+            self._evaluate(now)
+
+    def _evaluate(self, now):
+        self.temp_c = read_cpu_temp()
+        self.mem_mb = read_mem_available_mb()
+        lat_ms = self.latency * 1000
+        slow = self.latency > self.target
+        hot = self.temp_c is not None and self.temp_c >= ADAPTIVE_TEMP_HOT_C
+        low_mem = self.mem_mb is not None and self.mem_mb < ADAPTIVE_MEM_LOW_MB
+
+        if slow or low_mem:
+            reason = f"latencia {lat_ms:.0f}ms > {self.target * 1000:.0f}ms" if slow else f"RAM libre {self.mem_mb}MB"
+            self.calm_since = None
+            if not self._set(self.level + 1, self.skip, reason):
+                self._set(self.level, self.skip + 1, reason)
+            return
+        if hot:
+            self.calm_since = None
+            if not self._set(self.level, self.skip + 1, f"CPU {self.temp_c:.0f}°C"):
+                self._set(self.level + 1, self.skip, f"CPU {self.temp_c:.0f}°C")
+            return
+
+        calm = (
+            self.latency < self.target * 0.7
+            and (self.temp_c is None or self.temp_c < ADAPTIVE_TEMP_HOT_C - ADAPTIVE_TEMP_HYST_C)
+        )
+        if not calm:
+            self.calm_since = None
+            return
+        if self.calm_since is None:
+            self.calm_since = now
+        elif now - self.calm_since >= ADAPTIVE_RECOVER_SEC:
+            self.calm_since = now
+            reason = f"holgura (latencia {lat_ms:.0f}ms)"
+            if not self._set(self.level - 1, self.skip, reason):
+                self._set(self.level, self.skip - 1, reason)
+
+    def set_min_level(self, level, reason):
+        """
+        Fija el escalón mínimo de resolución (0 = libre). Al subirlo baja de inmediato y suelta
+        los buffers de las resoluciones mayores; al liberarlo se recupera por holgura, como siempre
+        """
+        self.min_level = min(level, len(self.resolutions) - 1)
+        if self.level < self.min_level:
+            self._set(self.min_level, self.skip, reason)
+            self._buffers = {size: buf for size, buf in self._buffers.items() if size == self.size}
+
+    def _set(self, level, skip, reason):
+        """Aplica un punto de operación dentro de los límites; False si no hay escalón disponible"""
+        if not self.min_level <= level < len(self.resolutions) or not ADAPTIVE_SKIP_MIN <= skip <= ADAPTIVE_SKIP_MAX:
+            return False
+        (old_w, old_h), old_skip = self.size, self.skip
+        self.level, self.skip = level, skip
+        self.latency = None  # Medir de nuevo con el punto de operación nuevo
+        self.changes += 1
+        w, h = self.size
+        log(f"🎛️  Punto de operación: {old_w}x{old_h} skip={old_skip} -> {w}x{h} skip={skip} ({reason})")
+        return True
 
-        # Subir a GCS
-        storage_client = storage.Client()
-        bucket = storage_client.bucket(BUCKET_NAME)
-        blob = bucket.blob(filename)
-        blob.upload_from_filename(local_path)
+    def describe(self):
+        """Resumen del punto de operación para el log de FPS"""
+        w, h = self.size
+        parts = [f"{w}x{h} skip={self.skip}"]
+        if self.infer is not None:
+            parts.append(f"inferencia {self.infer * 1000:.0f}ms")
+        if self.temp_c is not None:
+            parts.append(f"{self.temp_c:.0f}°C")
+        if self.mem_mb is not None:
+            parts.append(f"RAM {self.mem_mb}MB")
+        return " ".join(parts)
 
-        # Limpiar
-        os.remove(local_path)
+# ===========================
+# DETECCIÓN (suavizado + histéresis)
+# ===========================
+
+# Señales de caída como bits: las razones de cada decisión salen de una tabla precalculada
+SIGNAL_TILT = 1
+SIGNAL_HIP = 2
+SIGNAL_ASPECT = 4
+SIGNAL_NAMES = tuple(
+    tuple(name for bit, name in ((SIGNAL_TILT, "tilt"), (SIGNAL_HIP, "hip"), (SIGNAL_ASPECT, "aspect")) if mask & bit)
+    for mask in range(8)
+)
+
+class RunningMean:
+    """Media móvil de ventana fija sobre un buffer circular preasignado (running sum, sin deque)"""
+
+    __slots__ = ("buf", "size", "index", "count", "total")
+
+    def __init__(self, size):
+        self.buf = [0.0] * size
+        self.size = size
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, value):
+        """Agrega un valor y retorna la media de la ventana"""
+        if self.count == self.size:
+            self.total -= self.buf[self.index]
+        else:
+            self.count += 1
+        self.buf[self.index] = value
+        self.total += value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+        return self.total / self.count
+
+    def reset(self):
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+
+class FallDecision:
+    """
+    Resultado de FallDetector.update(). Es siempre el mismo objeto por detector (se sobrescribe
+    en cada frame): copiar lo que se necesite conservar.
+
+    new_fall: transición a alerta en este frame. alert: new_fall fuera del cooldown (hay que
+    avisar). reasons: señales que superaron su umbral. timed_out: la alerta expiró en este frame.
+    """
+
+    __slots__ = ("new_fall", "alert", "signals", "fall_counter", "alert_active", "timed_out", "cooldown_remaining")
+
+    def __init__(self):
+        self.new_fall = False
+        self.alert = False
+        self.signals = 0
+        self.fall_counter = 0
+        self.alert_active = False
+        self.timed_out = False
+        self.cooldown_remaining = 0.0
+
+    @property
+    def reasons(self):
+        return SIGNAL_NAMES[self.signals]
+
+
+class FallDetector:
+    """
+    Máquina de estados de caída de una cámara: suavizado, histéresis, timeout y cooldown.
+
+    update(metrics, now) recibe la tupla de landmark_metrics() / PoseEngine.estimate() (o None
+    sin persona) y el reloj de referencia (time.time() en vivo, tiempo de video en replay).
+    Buffers preasignados y un FallDecision reutilizado: no crea objetos por frame. La usan
+    main() (una por cámara), el modo replay y bench_fall_detector.py.
+    """
+
+    __slots__ = ("tilt", "hip", "aspect", "fall_counter", "alert_active", "alert_start_time",
+                 "last_alert_time", "decision")
+
+    def __init__(self, window=SMOOTH_WINDOW):
+        self.tilt = RunningMean(window)
+        self.hip = RunningMean(window)
+        self.aspect = RunningMean(window)
+        self.fall_counter = 0
+        self.alert_active = False
+        self.alert_start_time = 0.0   # Momento en que empezó la alerta actual
+        self.last_alert_time = float("-inf")  # Última alerta avisada (para ALERT_COOLDOWN_SEC)
+        self.decision = FallDecision()
+
+    def update(self, metrics, now):
+        """Aplica las métricas de un frame y retorna el FallDecision (reutilizado)"""
+        signals = 0
+        if metrics is not None:
+            _, _, torso_angle, hip_y_ratio, bbox = metrics
+            if torso_angle is not None and self.tilt.push(torso_angle) > TORSO_TILT_DEG:
+                signals |= SIGNAL_TILT
+            if hip_y_ratio is not None and self.hip.push(hip_y_ratio) > HIP_Y_RATIO:
+                signals |= SIGNAL_HIP
+            if bbox is not None:
+                h = bbox[3] - bbox[1]
+                if h > 0 and self.aspect.push((bbox[2] - bbox[0]) / float(h)) > ASPECT_THRESHOLD:
+                    signals |= SIGNAL_ASPECT
+
+        # Histéresis: al menos 2 señales suman, sin señal resta 2x (reset rápido)
+        prev_alert = self.alert_active
+        if len(SIGNAL_NAMES[signals]) >= 2:
+            self.fall_counter = min(self.fall_counter + 1, FRAMES_CONFIRM * 2)
+        else:
+            self.fall_counter = max(self.fall_counter - 2, 0)
+        self.alert_active = self.fall_counter >= FRAMES_CONFIRM
+
+        decision = self.decision
+        decision.new_fall = False
+        decision.alert = False
+        decision.timed_out = False
+        decision.cooldown_remaining = 0.0
+        if self.alert_active and not prev_alert:
+            # Caída confirmada (transición a alerta): marcar inicio de esta alerta
+            self.alert_start_time = now
+            decision.new_fall = True
+            since_last = now - self.last_alert_time
+            if since_last < ALERT_COOLDOWN_SEC:
+                decision.cooldown_remaining = ALERT_COOLDOWN_SEC - since_last
+            else:
+                decision.alert = True
+                self.last_alert_time = now
+        elif self.alert_active and now - self.alert_start_time > ALERT_TIMEOUT_SEC:
+            # Timeout automático: demasiado tiempo en alerta, forzar reset
+            log(f"⏰ Timeout de alerta alcanzado ({now - self.alert_start_time:.1f}s), reseteando estado")
+            self.fall_counter = 0
+            self.alert_active = False
+            decision.timed_out = True
+
+        decision.signals = signals
+        decision.fall_counter = self.fall_counter
+        decision.alert_active = self.alert_active
+        return decision
+
+    def suppress(self, now):
+        """Cuenta una alerta no enviada (cooldown extendido "Ya voy") para el cooldown normal"""
+        self.last_alert_time = now
+        self.decision.alert = False
+
+# ===========================
+# MÉTRICAS (endpoint Prometheus)
+# ===========================
+
+class Metrics:
+    """
+    Registro mínimo de métricas con salida en formato de texto Prometheus (sin dependencias).
+
+    Contadores, gauges e histogramas se actualizan desde cualquier thread (con lock).
+    Los valores que ya viven en otros objetos (FPS de captura, reconexiones, RSS...) se
+    registran como funciones y se leen recién al momento del scrape.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._meta = {}         # nombre -> (tipo, ayuda)
+        self._values = {}       # (nombre, labels) -> valor (counter / gauge)
+        self._histograms = {}   # (nombre, labels) -> [conteo por bucket..., suma, total]
+        self._collectors = {}   # (nombre, labels) -> fn() que retorna el valor o None
+        self._buckets = {}      # nombre -> límites del histograma (default METRICS_LATENCY_BUCKETS)
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text)
+        if buckets:
+            self._buckets[name] = buckets
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._buckets.get(name, METRICS_LATENCY_BUCKETS)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    def collect(self, name, fn, **labels):
+        """Registra una función leída en cada scrape (ej. lambda: capture.capture_fps)"""
+        self._collectors[(name, tuple(sorted(labels.items())))] = fn
+
+    def render(self):
+        """Texto de exposición Prometheus (version 0.0.4)"""
+        with self._lock:
+            values = dict(self._values)
+            histograms = {key: list(hist) for key, hist in self._histograms.items()}
+        for key, fn in list(self._collectors.items()):
+            try:
+                value = fn()
+            except Exception:
+                value = None
+            if value is not None:
+                values[key] = value
+
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+        lines = []
+        for name, (kind, help_text) in self._meta.items():
+            series = sorted((key for key in (histograms if kind == "histogram" else values) if key[0] == name),
+                            key=lambda key: key[1])
+            if not series:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key in series:
+                labels = key[1]
+                if kind != "histogram":
+                    lines.append(f"{name}{fmt_labels(labels)} {values[key]}")
+                    continue
+                hist = histograms[key]
+                cumulative = 0
+                for bound, count in zip(self._buckets.get(name, METRICS_LATENCY_BUCKETS), hist):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {hist[-1]}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {hist[-2]:.6f}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+for _name, _kind, _help in (
+    ("vigilia_capture_fps", "gauge", "FPS de captura RTSP"),
+    ("vigilia_inference_fps", "gauge", "FPS de inferencia (ultimos 100 frames analizados)"),
+    ("vigilia_frames_captured_total", "counter", "Frames leidos del stream RTSP"),
+    ("vigilia_frames_dropped_total", "counter", "Frames capturados que nunca se analizaron"),
+    ("vigilia_frames_gated_total", "counter", "Frames sin pose por escena estatica"),
+    ("vigilia_frames_analyzed_total", "counter", "Frames procesados por el motor de pose"),
+    ("vigilia_inference_seconds", "histogram", "Resize + color + pose + metricas por frame"),
+    ("vigilia_detection_latency_seconds", "histogram", "Latencia captura -> decision por frame"),
+    ("vigilia_fall_counter", "gauge", "Frames consecutivos con senales de caida"),
+    ("vigilia_alert_active", "gauge", "1 si hay una alerta de caida activa"),
+    ("vigilia_falls_total", "counter",
+     "Caidas confirmadas por resultado (alerta, cooldown, cooldown_extendido, cooldown_extendido_outbox)"),
+    ("vigilia_rtsp_stalls_total", "counter", "Streams congelados detectados por el watchdog"),
+    ("vigilia_rtsp_reconnect_seconds", "histogram", "Duracion de cada intento de reconexion RTSP"),
+    ("vigilia_rtsp_connected", "gauge", "1 si el stream entrega frames"),
+    ("vigilia_camera_rescans_total", "counter", "Scans de red por posible cambio de IP de la camara"),
+    ("vigilia_rtsp_reconnects_total", "counter", "Reconexiones del stream RTSP"),
+    ("vigilia_operating_point_width", "gauge", "Ancho de entrada al motor de pose"),
+    ("vigilia_operating_point_skip", "gauge", "Paso minimo entre frames analizados"),
+    ("vigilia_gcs_upload_seconds", "histogram", "Duracion de uploads a GCS por tipo"),
+    ("vigilia_gcs_upload_errors_total", "counter", "Uploads a GCS fallidos por tipo"),
+    ("vigilia_backend_request_seconds", "histogram", "Duracion de requests al backend por endpoint"),
+    ("vigilia_backend_errors_total", "counter", "Requests al backend fallidos (excepcion o HTTP >= 400)"),
+    ("vigilia_outbox_pending", "gauge", "Alertas pendientes en el outbox"),
+    ("vigilia_process_rss_bytes", "gauge", "Memoria residente del proceso"),
+    ("vigilia_cpu_temperature_celsius", "gauge", "Temperatura de CPU (thermal_zone0)"),
+    ("vigilia_startup_phase_seconds", "gauge", "Duracion de cada fase del arranque"),
+    ("vigilia_time_to_first_inference_seconds", "gauge", "Inicio del proceso -> primera inferencia"),
+    ("vigilia_memory_budget_bytes", "gauge", "Presupuesto de RSS del gobernador de memoria (0 = sin recorte)"),
+    ("vigilia_memory_shed_level", "gauge", "Escalon de recorte de carga por memoria (0 = normal)"),
+    ("vigilia_memory_stage_peak_bytes", "gauge", "RSS maximo observado al terminar cada etapa"),
+):
+    metrics.describe(_name, _kind, _help)
+metrics.describe("vigilia_rtsp_outage_seconds", "histogram", "Cortes de video: perdida del stream -> primer frame",
+                 buckets=METRICS_OUTAGE_BUCKETS)
+
+def read_rss_bytes():
+    """RSS del proceso desde /proc/self/statm o None si no está disponible"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+metrics.collect("vigilia_process_rss_bytes", read_rss_bytes)
+metrics.collect("vigilia_cpu_temperature_celsius", read_cpu_temp)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    GET /metrics -> texto Prometheus
+    GET /debug/memory -> reporte del gobernador de memoria (?trace=1 inicia tracemalloc, ?trace=0 lo detiene)
+
+    /debug/* tiene costo (tracemalloc) y expone trazas de asignación: solo se atiende desde
+    localhost, o desde la red con X-Debug-Token igual a DEBUG_TOKEN (sin token configurado, 403).
+    """
+
+    def debug_allowed(self):
+        if self.client_address[0] in ("127.0.0.1", "::1"):
+            return True
+        token = self.headers.get("X-Debug-Token", "")
+        return bool(DEBUG_TOKEN) and hmac.compare_digest(token.encode("utf-8"), DEBUG_TOKEN.encode("utf-8"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.startswith("/debug/") and not self.debug_allowed():
+            self.send_error(403)
+            return
+        if url.path == "/metrics":
+            body = metrics.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif url.path == "/debug/memory":
+            query = dict(part.split("=", 1) for part in url.query.split("&") if "=" in part)
+            if query.get("trace") == "1":
+                memory.start_tracing()
+            elif query.get("trace") == "0":
+                memory.stop_tracing()
+            body = memory.report().encode("utf-8")
+            content_type = "text/plain; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Sin una línea de log por cada scrape
+
+def start_metrics_server():
+    """Sirve /metrics en un thread daemon (METRICS_PORT=0 lo deshabilita)"""
+    if not METRICS_PORT:
+        return None
+    try:
+        server = ThreadingHTTPServer((METRICS_BIND, METRICS_PORT), MetricsHandler)
+    except OSError as e:
+        log(f"⚠️  No se pudo abrir el endpoint de métricas en :{METRICS_PORT}: {e}")
+        return None
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    log(f"📈 Métricas en http://{METRICS_BIND}:{METRICS_PORT}/metrics")
+    return server
+
+# ===========================
+# GOBERNADOR DE MEMORIA
+# ===========================
+
+class MemoryGovernor:
+    """
+    Presupuesto de RSS del proceso (MEMORY_BUDGET_MB) con recorte de carga por escalones.
+
+    El servicio systemd corre sin MemoryMax/MemoryHigh: en vez de que el OOM killer mate el
+    proceso a mitad de una caída, el gobernador revisa el RSS cada MEMORY_CHECK_SEC y al
+    cruzar cada fracción de MEMORY_SHED_STEPS aplica un escalón más:
+      1. Buffer pre-evento reducido (PreEventBuffer.shrink)
+      2. Resolución mínima de entrada (piso del AdaptiveController)
+      3. Pausa de uploads secundarios: clip y variantes del snapshot (la alerta y su
+         snapshot nunca se frenan)
+    Cada subida de escalón fuerza un gc.collect(); se baja de a uno con RSS bajo el umbral
+    (menos MEMORY_RECOVER_MARGIN) sostenido MEMORY_RECOVER_SEC.
+
+    checkpoint(etapa) registra el máximo de RSS al terminar cada etapa (arranque, pose,
+    outbox...). tracemalloc se activa bajo demanda (/debug/memory?trace=1 o
+    MEMORY_TRACEMALLOC=1) y el reporte muestra las líneas que más crecieron desde entonces.
+    """
+
+    LEVELS = ("normal", "buffer pre-evento reducido", "resolución mínima", "uploads secundarios en pausa")
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB):
+        self.budget = budget_mb * 1024 * 1024
+        self.level = 0
+        self.rss = None
+        self.stage_peaks = {}   # etapa -> RSS máximo (bytes)
+        self.last_check = 0.0
+        self.calm_since = None
+        self.pre_events = []
+        self.controller = None
+        self.outbox = None
+        self.baseline = None    # Snapshot de tracemalloc al iniciar el trazado
+
+    def attach(self, pre_events, controller, outbox):
+        """Registra lo que se puede recortar (buffers pre-evento de cada cámara, control adaptativo, outbox)"""
+        self.pre_events = pre_events
+        self.controller = controller
+        self.outbox = outbox
+
+    def checkpoint(self, stage):
+        """Lee el RSS (~10us) y actualiza el máximo de la etapa. Retorna el RSS en bytes o None"""
+        rss = read_rss_bytes()
+        if rss is not None:
+            self.rss = rss
+            if rss > self.stage_peaks.get(stage, 0):
+                self.stage_peaks[stage] = rss
+                metrics.set("vigilia_memory_stage_peak_bytes", rss, etapa=stage)
+        return rss
+
+    def observe(self, now):
+        """Compara el RSS con el presupuesto cada MEMORY_CHECK_SEC y sube o baja de escalón"""
+        if now - self.last_check < MEMORY_CHECK_SEC:
+            return
+        self.last_check = now
+        rss = self.checkpoint("periodico")
+        if not self.budget or rss is None:
+            return
+        target = sum(rss >= step * self.budget for step in MEMORY_SHED_STEPS)
+        if target > self.level:
+            self.calm_since = None
+            self._apply(target, f"RSS {rss / 1e6:.0f}MB / presupuesto {self.budget / 1e6:.0f}MB")
+            gc.collect()
+            self.log_top_allocators()
+        elif self.level and rss < (MEMORY_SHED_STEPS[self.level - 1] - MEMORY_RECOVER_MARGIN) * self.budget:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= MEMORY_RECOVER_SEC:
+                self.calm_since = now
+                self._apply(self.level - 1, f"RSS {rss / 1e6:.0f}MB")
+        else:
+            self.calm_since = None
+
+    def _apply(self, level, reason):
+        old, self.level = self.level, level
+        for pre_event in self.pre_events:
+            pre_event.shrink(level >= 1)
+        if self.controller:
+            self.controller.set_min_level(len(self.controller.resolutions) - 1 if level >= 2 else 0,
+                                          f"memoria: {reason}")
+        elif level >= 2 and old < 2:
+            log("⚠️  Memoria: sin control adaptativo (ADAPTIVE_ENABLED=0) no se puede bajar la resolución")
+        if self.outbox:
+            self.outbox.uploads_paused = level >= 3
+        icon = "⚠️ " if level > old else "✅"
+        log(f"{icon} Memoria: escalón {old} -> {level} ({self.LEVELS[level]}) - {reason}")
+
+    def start_tracing(self):
+        """Inicia tracemalloc (si no estaba) y toma la base para comparar crecimiento"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.baseline = tracemalloc.take_snapshot()
+            log("🔬 tracemalloc iniciado (el reporte compara contra este momento)")
+
+    def stop_tracing(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self.baseline = None
+            log("🔬 tracemalloc detenido")
+
+    def top_allocators(self, limit=MEMORY_TOP_N):
+        """Líneas con mayor crecimiento de memoria desde start_tracing() ([] sin tracemalloc)"""
+        if not tracemalloc.is_tracing():
+            return []
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen *>"))
+        snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        if self.baseline is None:
+            return snapshot.statistics("lineno")[:limit]
+        return snapshot.compare_to(self.baseline.filter_traces(ignore), "lineno")[:limit]
+
+    def log_top_allocators(self):
+        for stat in self.top_allocators():
+            log(f"🔬   {stat}")
+
+    def describe(self):
+        """Resumen para el log de FPS"""
+        if self.rss is None:
+            return "RSS ?"
+        text = f"RSS {self.rss / 1e6:.0f}MB"
+        if self.level:
+            text += f" (escalón {self.level})"
+        return text
+
+    def report(self):
+        """Reporte de texto para /debug/memory"""
+        rss = read_rss_bytes()
+        lines = [
+            f"rss_mb {rss / 1e6:.1f}" if rss else "rss_mb ?",
+            f"presupuesto_mb {self.budget / 1e6:.0f}" if self.budget else "presupuesto_mb 0 (sin recorte)",
+            f"escalon {self.level} ({self.LEVELS[self.level]})",
+            "",
+            "RSS maximo por etapa (MB):",
+        ]
+        lines += [f"  {stage:<14}{peak / 1e6:8.1f}" for stage, peak in sorted(self.stage_peaks.items())]
+        lines.append("")
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"tracemalloc: {current / 1e6:.1f}MB trazados (pico {peak / 1e6:.1f}MB), top crecimiento:")
+            lines += [f"  {stat}" for stat in self.top_allocators()]
+        else:
+            lines.append("tracemalloc inactivo (GET /debug/memory?trace=1 para iniciarlo)")
+        return "\n".join(lines) + "\n"
+
+memory = MemoryGovernor()
+metrics.collect("vigilia_memory_budget_bytes", lambda: memory.budget)
+metrics.collect("vigilia_memory_shed_level", lambda: memory.level)
+
+# Cliente y bucket de GCS: se crean una sola vez y se reutilizan en cada alerta.
+# google.cloud.storage se importa recién aquí (segundos en ARM): fuera del arranque
+gcs_bucket = None
+gcs_lock = Lock()
+
+def init_gcs_bucket():
+    """
+    Importa Storage y crea el cliente y el handle del bucket. main() lo precalienta en
+    background tras la primera inferencia; si aún no está, lo crea el primer upload
+    """
+    global gcs_bucket
+    with gcs_lock:  # Precalentamiento y primer upload pueden coincidir
+        if gcs_bucket is not None:
+            return gcs_bucket
+        try:
+            t0 = time.perf_counter()
+            from google.cloud import storage
+            gcs_bucket = storage.Client().bucket(BUCKET_NAME)
+            log(f"☁️  Cliente GCS listo ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        except Exception as e:
+            log(f"⚠️  No se pudo crear cliente GCS: {e} (se reintentará en el primer upload)")
+        return gcs_bucket
+
+def encode_snapshot(frame):
+    """Codifica el frame a JPEG en memoria (sin escribir en la SD). Retorna bytes o None"""
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_JPEG_QUALITY])
+    return buf.tobytes() if ok else None
+
+def encode_snapshot_variants(frame):
+    """
+    Codifica las variantes reducidas del snapshot (SNAPSHOT_VARIANTS). Retorna {nombre: bytes}.
+
+    Se escalan manteniendo la proporción y nunca se agrandan: si el frame ya es más angosto
+    que la variante, solo se recomprime con la calidad menor.
+    """
+    variants = {}
+    if not SNAPSHOT_VARIANTS_ENABLED:
+        return variants
+    h, w = frame.shape[:2]
+    for name, width, quality in SNAPSHOT_VARIANTS:
+        img = frame
+        if w > width:
+            img = cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ok:
+            variants[name] = buf.tobytes()
+    return variants
+
+def save_snapshot_to_gcs(jpeg_bytes, fall_time, folder="snapshots", hardware_id=None, variant=None):
+    """
+    Sube un JPEG (snapshot, variante o clip) directo desde memoria a GCS y retorna URL (síncrono - solo para thread).
+    Las variantes quedan junto al original: snapshots/fall_<ts>_<variante>.jpg
+    """
+    tipo = variant or folder
+    label = "Clip" if folder == "clips" else f"Snapshot {variant}" if variant else "Snapshot"
+    try:
+        ts = fall_time.strftime("%Y%m%d_%H%M%S")
+        suffix = f"_{variant}" if variant else ""
+        filename = f"{hardware_id or HARDWARE_ID}/{folder}/fall_{ts}{suffix}.jpg"
+
+        bucket = gcs_bucket or init_gcs_bucket()
+        if bucket is None:
+            metrics.inc("vigilia_gcs_upload_errors_total", tipo=tipo)
+            return None
+        blob = bucket.blob(filename)
+        t0 = time.perf_counter()
+        blob.upload_from_string(jpeg_bytes, content_type="image/jpeg")
+        metrics.observe("vigilia_gcs_upload_seconds", time.perf_counter() - t0, tipo=tipo)
 
         url = f"gs://{BUCKET_NAME}/{filename}"
-        log(f"☁️  Snapshot subido a GCS: {url}")
+        log(f"☁️  {label} subido a GCS: {url}")
         return url
     except Exception as e:
-        log(f"❌ Error al guardar snapshot: {e}")
+        metrics.inc("vigilia_gcs_upload_errors_total", tipo=tipo)
+        log(f"❌ Error al guardar {label.lower()}: {e}")
         return None
 
-def save_snapshot_async(frame, dispositivo_id, adulto_mayor_id):
-    """Guarda snapshot y notifica backend en thread separado (NO BLOQUEA detección)"""
-    def _async_upload():
-        try:
-            # Upload snapshot
-            snapshot_url = save_snapshot_to_gcs(frame)
+# ===========================
+# CLIP PRE-EVENTO
+# ===========================
 
-            # Notify backend
-            if dispositivo_id and snapshot_url:
-                notify_backend(dispositivo_id, adulto_mayor_id, snapshot_url)
-        except Exception as e:
-            log(f"❌ Error en upload asíncrono: {e}")
+class PreEventBuffer:
+    """
+    Últimos CLIP_PRE_SEC segundos de video como JPEGs pequeños ya codificados.
+
+    Guarda CLIP_FPS frames por segundo a CLIP_SIZE (~4KB c/u en vez de 230KB crudos) con un
+    tope duro de CLIP_MAX_BYTES: al superarlo se descartan los más antiguos. Solo lo usa el
+    thread de inferencia; snapshot() entrega una copia inmutable para el outbox.
+    """
+
+    def __init__(self):
+        self.frames = deque()  # (timestamp, jpeg_bytes)
+        self.bytes = 0
+        self.small = np.empty((CLIP_SIZE[1], CLIP_SIZE[0], 3), dtype=np.uint8)
+        self.last_push = 0.0
+        self.max_sec = CLIP_PRE_SEC
+        self.max_bytes = CLIP_MAX_BYTES
+
+    def shrink(self, enabled):
+        """Recorte del gobernador de memoria: 1/MEMORY_CLIP_SHED_DIVISOR de bytes y la mitad de segundos"""
+        self.max_sec = CLIP_PRE_SEC / 2 if enabled else CLIP_PRE_SEC
+        self.max_bytes = CLIP_MAX_BYTES // MEMORY_CLIP_SHED_DIVISOR if enabled else CLIP_MAX_BYTES
+        if self.frames:
+            self._trim(self.frames[-1][0])
+
+    def _trim(self, now):
+        while self.frames and (now - self.frames[0][0] > self.max_sec or self.bytes > self.max_bytes):
+            self.bytes -= len(self.frames.popleft()[1])
+
+    def push(self, frame, timestamp, rgb=False):
+        """Agrega el frame si toca según CLIP_FPS (resize + JPEG, ~1ms). rgb: frame de GStreamer"""
+        if timestamp - self.last_push < 1.0 / CLIP_FPS:
+            return
+        self.last_push = timestamp
+        cv2.resize(frame, CLIP_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        if rgb:
+            cv2.cvtColor(self.small, cv2.COLOR_RGB2BGR, dst=self.small)  # imencode espera BGR
+        ok, buf = cv2.imencode(".jpg", self.small, [cv2.IMWRITE_JPEG_QUALITY, CLIP_JPEG_QUALITY])
+        if not ok:
+            return
+        jpeg = buf.tobytes()
+        self.frames.append((timestamp, jpeg))
+        self.bytes += len(jpeg)
+        self._trim(timestamp)
+
+    def snapshot(self):
+        """Copia de los frames actuales (los bytes son inmutables, no se duplican)"""
+        return list(self.frames)
+
+def build_clip_strip(frames):
+    """Arma una tira JPEG (grilla) con los frames pre-evento [(timestamp, jpeg)]. Retorna bytes o None"""
+    if not frames:
+        return None
+    if len(frames) > CLIP_STRIP_MAX_FRAMES:
+        step = len(frames) / CLIP_STRIP_MAX_FRAMES
+        frames = [frames[int(i * step)] for i in range(CLIP_STRIP_MAX_FRAMES - 1)] + [frames[-1]]
+    w, h = CLIP_SIZE
+    cols = min(CLIP_STRIP_COLUMNS, len(frames))
+    rows = -(-len(frames) // cols)
+    strip = np.zeros((rows * h, cols * w, 3), dtype=np.uint8)
+    t_end = frames[-1][0]
+    for i, (timestamp, jpeg) in enumerate(frames):
+        tile = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if tile is None or tile.shape[:2] != (h, w):
+            continue
+        r, c = divmod(i, cols)
+        strip[r * h:(r + 1) * h, c * w:(c + 1) * w] = tile
+        # Tiempo relativo a la confirmación de la caída
+        cv2.putText(strip, f"{timestamp - t_end:+.1f}s", (c * w + 4, r * h + 14),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    ok, buf = cv2.imencode(".jpg", strip, [cv2.IMWRITE_JPEG_QUALITY, CLIP_JPEG_QUALITY])
+    return buf.tobytes() if ok else None
+
+# ===========================
+# SESIÓN HTTP CON BACKEND
+# ===========================
 
-    # Ejecutar en thread separado para no bloquear
-    Thread(target=_async_upload, daemon=True).start()
-    log("🚀 Upload y notificación iniciados en background")
+class InstrumentedSession(requests.Session):
+    """Session que registra duración y errores de cada request al backend (por endpoint)"""
 
-def get_or_create_device_id():
-    """Obtiene o crea dispositivo en backend"""
-    endpoint = f"{BACKEND_API_URL}/dispositivos/get-or-create"
-    headers = {
+    def request(self, method, url, *args, **kwargs):
+        endpoint = urlsplit(url).path
+        t0 = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception:
+            metrics.inc("vigilia_backend_errors_total", endpoint=endpoint)
+            raise
+        finally:
+            metrics.observe("vigilia_backend_request_seconds", time.perf_counter() - t0, endpoint=endpoint)
+        if response.status_code >= 400:
+            metrics.inc("vigilia_backend_errors_total", endpoint=endpoint)
+        return response
+
+def create_backend_session():
+    """
+    Sesión HTTP compartida por todas las llamadas al backend (keep-alive + pool de conexiones).
+
+    Evita pagar un handshake TCP+TLS completo contra Cloud Run en cada llamada desde la CPU ARM.
+    Los reintentos solo cubren fallos de conexión y 502/503/504; el backoff largo lo maneja el
+    outbox, que reenvía cada alerta con su idempotency_key (el backend no la registra dos veces).
+    """
+    retry = Retry(
+        total=3,
+        connect=3,
+        read=0,
+        status=2,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+    session = InstrumentedSession()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
         "X-Internal-Token": INTERNAL_API_KEY,
         "Content-Type": "application/json"
-    }
-    payload = {"hardware_id": HARDWARE_ID}
+    })
+    return session
+
+backend_session = create_backend_session()
 
+def ping_backend():
+    """Request liviano que abre (o mantiene viva) la conexión TLS con el backend"""
     try:
-        response = requests.post(endpoint, json=payload, headers=headers, timeout=10)
+        t0 = time.perf_counter()
+        backend_session.get(f"{BACKEND_API_URL}/", timeout=5)
+        return (time.perf_counter() - t0) * 1000
+    except Exception as e:
+        log(f"[WARN] Ping al backend falló: {e}")
+        return None
+
+def start_backend_keepalive():
+    """Calienta la conexión y la mantiene viva con pings periódicos (todo en background, no demora el arranque)"""
+    def _keepalive():
+        elapsed_ms = ping_backend()
+        if elapsed_ms is not None:
+            log(f"🔗 Conexión con backend precalentada ({elapsed_ms:.0f}ms)")
+        while True:
+            time.sleep(BACKEND_KEEPALIVE_SEC)
+            ping_backend()
+
+    Thread(target=_keepalive, daemon=True, name="backend-keepalive").start()
+
+def get_or_create_device_id(hardware_id=None):
+    """Obtiene o crea dispositivo en backend (por defecto el del NanoPi; cada cámara extra tiene el suyo)"""
+    endpoint = f"{BACKEND_API_URL}/dispositivos/get-or-create"
+    payload = {"hardware_id": hardware_id or HARDWARE_ID}
+
+    try:
+        response = backend_session.post(endpoint, json=payload, timeout=10)
         response.raise_for_status()
         data = response.json()
         return data.get("id"), data.get("adulto_mayor_id")
@@ -264,47 +1499,180 @@ def get_or_create_device_id():
         log(f"❌ Error al obtener device ID: {e}")
         return None, None
 
-def check_cooldown_extendido(dispositivo_id, adulto_mayor_id):
-    """Verifica si hay cooldown extendido activo (cuidador confirmo "Ya voy")"""
-    endpoint = f"{BACKEND_API_URL}/dispositivos/check-cooldown"
-    headers = {
-        "X-Internal-Token": INTERNAL_API_KEY,
-        "Content-Type": "application/json"
-    }
-
-    try:
-        response = requests.post(
-            endpoint,
-            json={"dispositivo_id": dispositivo_id, "adulto_mayor_id": adulto_mayor_id},
-            headers=headers,
-            timeout=5
-        )
-        response.raise_for_status()
-        data = response.json()
+class CooldownCache(Thread):
+    """
+    Copia local del cooldown extendido ("Ya voy" del cuidador), refrescada en background.
+
+    El loop de detección solo consulta is_active() (lectura en memoria, sin HTTP ni locks).
+    El thread consulta /dispositivos/cooldown-estado cada COOLDOWN_REFRESH_SEC enviando la
+    última versión conocida; el backend solo responde con datos cuando el estado cambió, así que
+    sondear seguido es barato. El último chequeo antes de notificar lo hace el outbox en su thread
+    (ensure_fresh), para no alertar si el cuidador confirmó "Ya voy" entre la caída y el envío.
+    """
+
+    def __init__(self, dispositivo_id, adulto_mayor_id):
+        super().__init__(daemon=True, name="cooldown-cache")
+        self.dispositivo_id = dispositivo_id
+        self.adulto_mayor_id = adulto_mayor_id
+        self.version = None
+        self.expires_at = 0.0      # time.time() en que expira el cooldown (0 = sin cooldown)
+        self.last_refresh = 0.0
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.running = True
+
+    def is_active(self):
+        """True si hay cooldown extendido vigente (lookup en memoria)"""
+        return time.time() < self.expires_at
+
+    def remaining(self):
+        return max(0, int(self.expires_at - time.time()))
+
+    def ensure_fresh(self, max_age=COOLDOWN_MAX_AGE_SEC):
+        """Refresca si la copia local es más vieja que max_age. Hace HTTP: nunca desde el loop de detección"""
+        if time.time() - self.last_refresh > max_age:
+            self.refresh(timeout=2)
+
+    def refresh(self, timeout=5):
+        """Consulta el estado en el backend; retorna True si se pudo refrescar"""
+        with self.lock:
+            return self._refresh(timeout)
+
+    def _refresh(self, timeout):
+        endpoint = f"{BACKEND_API_URL}/dispositivos/cooldown-estado"
+        try:
+            response = backend_session.post(
+                endpoint,
+                json={
+                    "dispositivo_id": self.dispositivo_id,
+                    "adulto_mayor_id": self.adulto_mayor_id,
+                    "version": self.version
+                },
+                timeout=timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            log(f"[WARN] Error al refrescar cooldown: {e} (se mantiene estado local)")
+            return False
 
-        if data.get("cooldown_activo"):
+        self.last_refresh = time.time()
+        if data.get("cambiado"):
+            self.version = data.get("version")
             segundos_restantes = data.get("cooldown_expira_en_segundos", 0)
-            log(f"[COOLDOWN] Cooldown extendido activo: {segundos_restantes}s restantes (cuidador confirmo asistencia)")
-            return True
-        return False
-    except Exception as e:
-        log(f"[WARN] Error al verificar cooldown: {e} (asumiendo sin cooldown)")
-        return False
+            # Expiración relativa al reloj local (inmune a desfase de reloj con el backend)
+            self.expires_at = time.time() + segundos_restantes if segundos_restantes > 0 else 0.0
+            if segundos_restantes > 0:
+                log(f"[COOLDOWN] Cooldown extendido activo: {segundos_restantes}s restantes (cuidador confirmo asistencia)")
+        return True
+
+    def run(self):
+        while self.running:
+            self.refresh()
+            self.wakeup.wait(timeout=COOLDOWN_REFRESH_SEC)
+            self.wakeup.clear()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+
+class TelemetryReporter(Thread):
+    """
+    Heartbeat + telemetría hacia /dispositivos/heartbeat.
+
+    Cada TELEMETRY_SAMPLE_SEC arma una muestra (FPS, percentiles de latencia, uptime,
+    cola del outbox, temperatura, RSS) y cada TELEMETRY_SEND_SEC envía todas las
+    acumuladas en un solo POST. Si el backend no responde las muestras se conservan
+    (hasta TELEMETRY_MAX_SAMPLES) para el siguiente envío. El loop de detección solo
+    llama record_latency() (append a un deque, sin locks ni HTTP).
+    """
+
+    def __init__(self, dispositivo_id, capture, outbox, hardware_id=None):
+        super().__init__(daemon=True, name="telemetry")
+        self.dispositivo_id = dispositivo_id
+        self.hardware_id = hardware_id
+        self.capture = capture
+        self.outbox = outbox
+        self.started = time.time()
+        self.latencies = deque(maxlen=TELEMETRY_LATENCY_WINDOW)
+        self.frames_analyzed = 0
+        self.samples = deque(maxlen=TELEMETRY_MAX_SAMPLES)
+        self.wakeup = Event()
+        self.running = True
+
+    def record_latency(self, latency):
+        """Latencia captura -> decisión de un frame analizado (segundos)"""
+        self.latencies.append(latency)
+        self.frames_analyzed += 1
+
+    def sample(self, elapsed):
+        """Resume la ventana desde la muestra anterior y la deja en el buffer"""
+        latencies = np.fromiter(self.latencies, dtype=np.float64, count=len(self.latencies)) * 1000
+        self.latencies.clear()
+        analyzed, self.frames_analyzed = self.frames_analyzed, 0
+        rss = read_rss_bytes()
+        p50, p95, p_max = np.percentile(latencies, (50, 95, 100)) if latencies.size else (None, None, None)
+        self.samples.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "fps_inferencia": round(analyzed / elapsed, 2) if elapsed > 0 else None,
+            "fps_captura": round(self.capture.capture_fps, 2),
+            "latencia_p50_ms": None if p50 is None else round(float(p50), 1),
+            "latencia_p95_ms": None if p95 is None else round(float(p95), 1),
+            "latencia_max_ms": None if p_max is None else round(float(p_max), 1),
+            "uptime_seg": int(time.time() - self.started),
+            "cola_pendiente": self.outbox.backlog,
+            "temperatura_cpu": read_cpu_temp(),
+            "memoria_rss_mb": round(rss / 1024 / 1024, 1) if rss else None,
+        })
+
+    def send(self):
+        """Envía las muestras acumuladas; retorna True si el backend las recibió"""
+        if not self.dispositivo_id:
+            self.dispositivo_id = get_or_create_device_id(self.hardware_id)[0]
+            if not self.dispositivo_id:
+                return False
+        batch = list(self.samples)
+        try:
+            response = backend_session.post(
+                f"{BACKEND_API_URL}/dispositivos/heartbeat",
+                json={"dispositivo_id": self.dispositivo_id, "version_software": SOFTWARE_VERSION, "muestras": batch},
+                timeout=10
+            )
+            response.raise_for_status()
+        except Exception as e:
+            log(f"[WARN] Heartbeat falló: {e} ({len(batch)} muestras se reintentan en el próximo envío)")
+            return False
+        for _ in batch:
+            self.samples.popleft()
+        return True
+
+    def run(self):
+        last_sample = last_send = time.time()
+        self.send()  # Heartbeat inicial: marca el dispositivo 'activo' apenas arranca
+        while self.running:
+            self.wakeup.wait(timeout=max(0.0, last_sample + TELEMETRY_SAMPLE_SEC - time.time()))
+            self.wakeup.clear()
+            now = time.time()
+            self.sample(now - last_sample)
+            last_sample = now
+            if now - last_send >= TELEMETRY_SEND_SEC or not self.running:
+                self.send()
+                last_send = now
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
 
 
 def reset_cooldown_extendido(dispositivo_id, adulto_mayor_id):
     """Resetea el cooldown extendido al iniciar el servicio (util para pruebas)"""
     endpoint = f"{BACKEND_API_URL}/dispositivos/reset-cooldown"
-    headers = {
-        "X-Internal-Token": INTERNAL_API_KEY,
-        "Content-Type": "application/json"
-    }
 
     try:
-        response = requests.post(
+        response = backend_session.post(
             endpoint,
             json={"dispositivo_id": dispositivo_id, "adulto_mayor_id": adulto_mayor_id},
-            headers=headers,
             timeout=5
         )
         response.raise_for_status()
@@ -323,65 +1691,516 @@ def reset_cooldown_extendido(dispositivo_id, adulto_mayor_id):
         return False
 
 
-def notify_backend(dispositivo_id, adulto_mayor_id, snapshot_url):
-    """Notifica caída al backend"""
+def notify_backend(dispositivo_id, adulto_mayor_id, snapshot_url, timestamp_caida, clip_url=None, snapshot_variants=None,
+                   idempotency_key=None):
+    """
+    Notifica caída al backend con el timestamp original de la detección.
+    snapshot_variants: {nombre: gs://...} de las variantes reducidas que sí se subieron.
+    idempotency_key: UUID fijo de la alerta en el outbox; un reintento tras un timeout de
+    lectura (alerta ya registrada) devuelve la alerta existente en vez de crear otra.
+
+    Retorna True si se notificó, False si el error es transitorio (reintentar)
+    y None si el backend rechazó el evento (4xx, no tiene sentido reintentar).
+    """
     endpoint = f"{BACKEND_API_URL}/eventos-caida/notificar"
-    headers = {
-        "X-Internal-Token": INTERNAL_API_KEY,
-        "Content-Type": "application/json"
-    }
 
     payload = {
         "dispositivo_id": dispositivo_id,
-        "timestamp_caida": datetime.now(timezone.utc).isoformat(),
-        "url_video_almacenado": "",  # No enviamos video en edge
+        "timestamp_caida": timestamp_caida,
+        "url_video_almacenado": clip_url or "",  # Tira de frames pre-evento (si se subió)
         "snapshot_url": snapshot_url
     }
 
     if adulto_mayor_id:
         payload["adulto_mayor_id"] = adulto_mayor_id
+    if snapshot_variants:
+        payload["snapshot_variantes"] = snapshot_variants
+    if idempotency_key:
+        payload["idempotency_key"] = idempotency_key
 
     try:
-        response = requests.post(endpoint, json=payload, headers=headers, timeout=10)
+        response = backend_session.post(endpoint, json=payload, timeout=10)
         response.raise_for_status()
         log(f"✅ Backend notificado exitosamente")
         return True
+    except requests.HTTPError as e:
+        code = e.response.status_code
+        if 400 <= code < 500 and code not in (408, 429):
+            log(f"❌ Backend rechazó la alerta ({code}): {e.response.text[:200]}")
+            return None
+        log(f"❌ Error al notificar backend: {e}")
+        return False
     except Exception as e:
         log(f"❌ Error al notificar backend: {e}")
         return False
 
 # ===========================
-# MAIN LOOP
+# OUTBOX PERSISTENTE DE ALERTAS
 # ===========================
 
-def main():
-    log("="*50)
-    log("🚀 DETECCIÓN DE CAÍDAS EN EDGE - MediaPipe")
-    log(f"🔧 Hardware ID: {HARDWARE_ID}")
-    log(f"📦 Bucket: gs://{BUCKET_NAME}/{HARDWARE_ID}/")
-    log(f"🎯 Backend: {BACKEND_API_URL}")
-    log("="*50)
+class AlertOutbox(Thread):
+    """
+    Cola persistente de alertas de caída (SQLite en modo WAL).
+
+    enqueue() solo deja el frame en una cola acotada en RAM (NO BLOQUEA detección).
+    El thread lo codifica a JPEG, lo persiste en disco y drena la cola en orden
+    (snapshot a GCS + notificación al backend) con backoff exponencial ante fallos.
+    Las alertas pendientes sobreviven a cortes de internet y a reinicios del servicio,
+    y conservan su timestamp_caida original.
+    """
+
+    def __init__(self, path=OUTBOX_PATH, streams=()):
+        super().__init__(daemon=True, name="alert-outbox")
+        self.path = path
+        self.streams = streams     # Cámaras: su CooldownCache se revisa antes de notificar
+        self.pending = queue.Queue(maxsize=OUTBOX_MEM_QUEUE)
+        self.wakeup = Event()
+        self.running = True
+        self.failures = 0          # Fallos consecutivos (para el backoff)
+        self.next_attempt = 0.0
+        self.device_ids = {}       # hardware_id -> (dispositivo_id, adulto_mayor_id) resuelto en background
+        self.timings = {}          # row_id -> tiempos por etapa (ms) de alertas de esta ejecución
+        self.last_timings = None   # Tiempos de la última alerta entregada
+        self.backlog = 0           # Alertas pendientes en disco (para métricas)
+        self.uploads_paused = False  # Gobernador de memoria: sin clip ni variantes (la alerta y su snapshot siguen)
+
+    def enqueue(self, frame, dispositivo_id, adulto_mayor_id, clip_frames=None, hardware_id=None):
+        """
+        Encola una caída confirmada. El frame debe ser una copia propia (frame.copy());
+        clip_frames son los JPEGs pre-evento de PreEventBuffer.snapshot() y hardware_id
+        identifica la cámara (multi-cámara) para resolver su dispositivo y su carpeta en GCS
+        """
+        event = {
+            "idempotency_key": str(uuid.uuid4()),
+            "detected_at": time.perf_counter(),
+            "timestamp_caida": datetime.now(timezone.utc).isoformat(),
+            "dispositivo_id": dispositivo_id,
+            "adulto_mayor_id": adulto_mayor_id,
+            "clip_frames": clip_frames or [],
+            "hardware_id": hardware_id or HARDWARE_ID,
+        }
+        try:
+            self.pending.put_nowait((frame, event))
+        except queue.Full:
+            log("❌ Outbox en memoria lleno, alerta descartada")
+            return False
+        self.wakeup.set()
+        return True
 
-    # Cargar IP de cámara
-    if not load_camera_ip():
-        log("❌ No se pudo cargar IP de cámara. Ejecuta scan_camera.sh primero.")
-        sys.exit(1)
+    def _open_db(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # Durable ante caída del proceso, mínimo fsync en SD
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp_caida TEXT NOT NULL,
+                dispositivo_id INTEGER,
+                adulto_mayor_id INTEGER,
+                snapshot BLOB,
+                snapshot_url TEXT,
+                upload_attempts INTEGER NOT NULL DEFAULT 0,
+                clip BLOB,
+                clip_url TEXT,
+                hardware_id TEXT,
+                idempotency_key TEXT
+            )
+        """)
+        # Migración de outbox.db creados antes del clip pre-evento / multi-cámara / variantes del snapshot
+        # / clave de idempotencia
+        columns = {row[1] for row in db.execute("PRAGMA table_info(outbox)")}
+        variant_columns = [(col, t) for name, _, _ in SNAPSHOT_VARIANTS for col, t in ((name, "BLOB"), (f"{name}_url", "TEXT"))]
+        for column, sql_type in [("clip", "BLOB"), ("clip_url", "TEXT"), ("hardware_id", "TEXT"),
+                                 ("idempotency_key", "TEXT")] + variant_columns:
+            if column not in columns:
+                db.execute(f"ALTER TABLE outbox ADD COLUMN {column} {sql_type}")
+        # Filas pendientes de una versión anterior: clave propia desde ahora (antes de su próximo envío)
+        for (row_id,) in db.execute("SELECT id FROM outbox WHERE idempotency_key IS NULL").fetchall():
+            db.execute("UPDATE outbox SET idempotency_key = ? WHERE id = ?", (str(uuid.uuid4()), row_id))
+        db.commit()
+        return db
+
+    def _persist_pending(self, db):
+        """Codifica y guarda en disco las alertas que esperan en RAM. Retorna True si guardó alguna"""
+        stored = False
+        while True:
+            try:
+                frame, event = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            t0 = time.perf_counter()
+            jpeg = encode_snapshot(frame)
+            paused = self.uploads_paused
+            variants = {} if paused else encode_snapshot_variants(frame)
+            clip = None if paused else build_clip_strip(event["clip_frames"])
+            t1 = time.perf_counter()
+            names = [name for name, _, _ in SNAPSHOT_VARIANTS if name in variants]
+            cursor = db.execute(
+                f"INSERT INTO outbox (timestamp_caida, dispositivo_id, adulto_mayor_id, snapshot, clip, hardware_id, "
+                f"idempotency_key{''.join(', ' + n for n in names)}) VALUES (?, ?, ?, ?, ?, ?, ?{', ?' * len(names)})",
+                (event["timestamp_caida"], event["dispositivo_id"], event["adulto_mayor_id"],
+                 sqlite3.Binary(jpeg) if jpeg else None, sqlite3.Binary(clip) if clip else None, event["hardware_id"],
+                 event["idempotency_key"], *(sqlite3.Binary(variants[n]) for n in names))
+            )
+            db.commit()
+            self.timings[cursor.lastrowid] = {
+                "detected_at": event["detected_at"],
+                "queue_ms": (t0 - event["detected_at"]) * 1000,
+                "encode_ms": (t1 - t0) * 1000,
+                "persist_ms": (time.perf_counter() - t1) * 1000,
+                "bytes": len(jpeg) if jpeg else 0,
+                "variant_bytes": sum(len(v) for v in variants.values()),
+                "clip_bytes": len(clip) if clip else 0,
+            }
+            stored = True
+            memory.checkpoint("outbox")
+        if stored:
+            self._enforce_budget(db)
+        return stored
+
+    def _enforce_budget(self, db):
+        """Mantiene el outbox dentro de OUTBOX_MAX_BYTES / OUTBOX_MAX_EVENTS"""
+        # 1) Liberar clips, variantes (de la más grande a la más chica), snapshots y por último la
+        #    variante más chica, de las alertas más antiguas (el evento se notifica igual, sin imagen;
+        #    la miniatura pesa poco y es lo último en irse). Derivado de SNAPSHOT_VARIANTS: una
+        #    variante nueva entra sola en el presupuesto.
+        variants = [name for name, _, _ in sorted(SNAPSHOT_VARIANTS, key=lambda v: v[1], reverse=True)]
+        blobs = ("clip", *variants[:-1], "snapshot", *variants[-1:])
+        total = db.execute(
+            "SELECT " + " + ".join(f"COALESCE(SUM(LENGTH({col})), 0)" for col in blobs) + " FROM outbox"
+        ).fetchone()[0]
+        for col in blobs:
+            while total > OUTBOX_MAX_BYTES:
+                row = db.execute(f"SELECT id, LENGTH({col}) FROM outbox WHERE {col} IS NOT NULL ORDER BY id LIMIT 1").fetchone()
+                if not row:
+                    break
+                db.execute(f"UPDATE outbox SET {col} = NULL WHERE id = ?", (row[0],))
+                total -= row[1]
+                log(f"⚠️  Outbox sobre presupuesto de disco, {col} de alerta {row[0]} descartado")
+
+        # 2) Descartar los eventos más antiguos si aún se excede el máximo
+        count = db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        if count > OUTBOX_MAX_EVENTS:
+            db.execute("DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)",
+                       (count - OUTBOX_MAX_EVENTS,))
+            log(f"⚠️  Outbox lleno, {count - OUTBOX_MAX_EVENTS} alertas antiguas descartadas")
+            oldest = db.execute("SELECT MIN(id) FROM outbox").fetchone()[0]
+            for row_id in [r for r in self.timings if r < oldest]:
+                del self.timings[row_id]
+        db.commit()
+
+    def _resolve_device(self, dispositivo_id, adulto_mayor_id, hardware_id):
+        """Si la alerta se generó sin backend disponible, resolver el device ID (de esa cámara) ahora"""
+        if dispositivo_id:
+            return dispositivo_id, adulto_mayor_id
+        hardware_id = hardware_id or HARDWARE_ID
+        if hardware_id not in self.device_ids:
+            resolved = get_or_create_device_id(hardware_id)
+            if resolved[0]:
+                self.device_ids[hardware_id] = resolved
+        return self.device_ids.get(hardware_id, (None, None))
+
+    def _cooldown_active(self, dispositivo_id):
+        """Último chequeo del cooldown extendido antes de subir y notificar (en el thread del outbox)"""
+        cache = next((s.cooldown_cache for s in self.streams
+                      if s.cooldown_cache and s.dispositivo_id == dispositivo_id), None) if dispositivo_id else None
+        if cache is None:
+            return False
+        cache.ensure_fresh()
+        return cache.is_active()
+
+    def _drain(self, db):
+        """Envía las alertas pendientes en orden. Retorna False al primer fallo transitorio"""
+        while self.running:
+            row = db.execute(
+                "SELECT id, timestamp_caida, dispositivo_id, adulto_mayor_id, snapshot, snapshot_url, upload_attempts, "
+                "clip, clip_url, hardware_id, idempotency_key FROM outbox ORDER BY id LIMIT 1"
+            ).fetchone()
+            if not row:
+                return True
+            (row_id, timestamp_caida, dispositivo_id, adulto_mayor_id, snapshot, snapshot_url, upload_attempts,
+             clip, clip_url, hardware_id, idempotency_key) = row
+            timings = self.timings.setdefault(row_id, {})
+
+            # "Ya voy" confirmado entre la caída y el envío: no se sube ni se notifica
+            if self._cooldown_active(dispositivo_id):
+                log(f"⏭️  Alerta {row_id} ({timestamp_caida}) descartada: cooldown extendido activo")
+                metrics.inc("vigilia_falls_total", resultado="cooldown_extendido_outbox")
+                db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                db.commit()
+                self.timings.pop(row_id, None)
+                continue
 
-    camera_url = get_camera_url()
-    log(f"📹 Cámara: rtsp://{RTSP_USER}:***@{CAMERA_IP}:{RTSP_PORT}{RTSP_PATH}")
+            # Upload snapshot (una sola vez: la URL queda guardada para reintentos del POST)
+            if snapshot is not None and not snapshot_url:
+                fall_time = datetime.fromisoformat(timestamp_caida)
+                t0 = time.perf_counter()
+                snapshot_url = save_snapshot_to_gcs(bytes(snapshot), fall_time, hardware_id=hardware_id)
+                timings["upload_ms"] = (time.perf_counter() - t0) * 1000
+                if snapshot_url:
+                    db.execute("UPDATE outbox SET snapshot = NULL, snapshot_url = ? WHERE id = ?", (snapshot_url, row_id))
+                    db.commit()
+                elif upload_attempts + 1 >= OUTBOX_SNAPSHOT_MAX_ATTEMPTS:
+                    log(f"⚠️  Snapshot de alerta {row_id} no subió tras {upload_attempts + 1} intentos, notificando sin imagen")
+                    db.execute("UPDATE outbox SET snapshot = NULL WHERE id = ?", (row_id,))
+                    db.commit()
+                else:
+                    db.execute("UPDATE outbox SET upload_attempts = upload_attempts + 1 WHERE id = ?", (row_id,))
+                    db.commit()
+                    return False
+
+            # Gobernador de memoria: uploads secundarios en pausa (se notifica sin clip ni variantes)
+            if self.uploads_paused and clip is not None:
+                log(f"⚠️  Uploads secundarios en pausa por memoria, alerta {row_id} sin clip ni variantes")
+                clip = None
+
+            # Upload variantes reducidas del snapshot (mejor esfuerzo, igual que el clip)
+            t0 = time.perf_counter()
+            variant_urls = {} if self.uploads_paused else self._upload_variants(db, row_id, timestamp_caida, hardware_id)
+            timings["variants_ms"] = (time.perf_counter() - t0) * 1000
+
+            # Upload clip pre-evento (mejor esfuerzo: un fallo no retrasa la alerta)
+            if clip is not None and not clip_url:
+                t0 = time.perf_counter()
+                clip_url = save_snapshot_to_gcs(bytes(clip), datetime.fromisoformat(timestamp_caida), folder="clips",
+                                                hardware_id=hardware_id)
+                timings["clip_ms"] = (time.perf_counter() - t0) * 1000
+                if clip_url:
+                    db.execute("UPDATE outbox SET clip = NULL, clip_url = ? WHERE id = ?", (clip_url, row_id))
+                else:
+                    log(f"⚠️  Clip de alerta {row_id} no subió, notificando sin clip")
+                    db.execute("UPDATE outbox SET clip = NULL WHERE id = ?", (row_id,))
+                db.commit()
 
-    # Obtener device ID
-    dispositivo_id, adulto_mayor_id = get_or_create_device_id()
-    if not dispositivo_id:
-        log("[WARN] No se pudo obtener device ID, continuando sin backend...")
-    else:
-        log(f"[OK] Device ID: {dispositivo_id}, Adulto Mayor ID: {adulto_mayor_id}")
-        # Resetear cooldown extendido al iniciar (util para pruebas con stakeholders)
-        log("[INFO] Reseteando cooldown extendido para pruebas...")
-        reset_cooldown_extendido(dispositivo_id, adulto_mayor_id)
+            # Notify backend
+            dispositivo_id, adulto_mayor_id = self._resolve_device(dispositivo_id, adulto_mayor_id, hardware_id)
+            if not dispositivo_id:
+                return False
+            t0 = time.perf_counter()
+            result = notify_backend(dispositivo_id, adulto_mayor_id, snapshot_url, timestamp_caida, clip_url,
+                                    variant_urls, idempotency_key)
+            timings["notify_ms"] = (time.perf_counter() - t0) * 1000
+            if result is False:
+                return False
+            if result is None:
+                log(f"🗑️  Alerta {row_id} ({timestamp_caida}) descartada por rechazo del backend")
+
+            db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            db.commit()
+            self._publish_timings(row_id)
+            memory.checkpoint("outbox")
+        return True
 
-    # Conectar a camara RTSP (ULTRA-OPTIMIZADO para RAM limitada)
-    log("🔌 Conectando a stream RTSP (substream, ultra-ligero)...")
+    def _upload_variants(self, db, row_id, timestamp_caida, hardware_id):
+        """Sube las variantes pendientes de la alerta. Retorna {nombre: gs://...} de las disponibles"""
+        urls = {}
+        for name, _, _ in SNAPSHOT_VARIANTS:
+            jpeg, url = db.execute(f"SELECT {name}, {name}_url FROM outbox WHERE id = ?", (row_id,)).fetchone()
+            if jpeg is not None and not url:
+                url = save_snapshot_to_gcs(bytes(jpeg), datetime.fromisoformat(timestamp_caida),
+                                           hardware_id=hardware_id, variant=name)
+                if not url:
+                    log(f"⚠️  Variante {name} de alerta {row_id} no subió, notificando sin ella")
+                db.execute(f"UPDATE outbox SET {name} = NULL, {name}_url = ? WHERE id = ?", (url, row_id))
+                db.commit()
+            if url:
+                urls[name] = url
+        return urls
+
+    def _publish_timings(self, row_id):
+        """Loguea cuánto tomó cada etapa entre la detección y la notificación"""
+        timings = self.timings.pop(row_id, {})
+        if "detected_at" in timings:
+            timings["total_ms"] = (time.perf_counter() - timings.pop("detected_at")) * 1000
+        self.last_timings = timings
+        stages = " | ".join(f"{k[:-3]} {v:.0f}ms" for k, v in timings.items() if k.endswith("_ms"))
+        log(f"⏱️  Alerta {row_id}: {stages} | snapshot {timings.get('bytes', 0) // 1024}KB | "
+            f"variantes {timings.get('variant_bytes', 0) // 1024}KB | clip {timings.get('clip_bytes', 0) // 1024}KB")
+
+    def run(self):
+        db = self._open_db()
+        self.backlog = db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        if self.backlog:
+            log(f"📬 Outbox: {self.backlog} alertas pendientes de una ejecución anterior")
+
+        while self.running:
+            try:
+                if self._persist_pending(db):
+                    self.next_attempt = 0.0  # Evento nuevo: reintentar de inmediato (el uplink pudo volver)
+                if time.time() >= self.next_attempt:
+                    if self._drain(db):
+                        self.failures = 0
+                        self.next_attempt = float("inf")  # Nada pendiente: esperar evento nuevo
+                    else:
+                        self.failures += 1
+                        delay = min(OUTBOX_BACKOFF_MAX_SEC, OUTBOX_BACKOFF_BASE_SEC * 2 ** (self.failures - 1))
+                        delay *= random.uniform(0.8, 1.2)  # Jitter
+                        self.next_attempt = time.time() + delay
+                        pending = db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+                        log(f"📬 Outbox: {pending} alertas pendientes, reintento en {delay:.0f}s")
+                self.backlog = db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            except Exception as e:
+                log(f"❌ Error en outbox: {e}")
+                self.next_attempt = time.time() + OUTBOX_BACKOFF_BASE_SEC
+
+            self.wakeup.wait(timeout=max(0.0, min(60.0, self.next_attempt - time.time())))
+            self.wakeup.clear()
+
+        db.close()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+# ===========================
+# CAPTURA RTSP (thread dedicado)
+# ===========================
+
+class FrameRingBuffer:
+    """
+    Ring buffer acotado de frames preasignados entre el thread de captura y la inferencia.
+
+    El lector siempre recibe el frame más reciente; los frames que nunca llegan a
+    analizarse se cuentan como descartados. Los slots se reutilizan (sin allocs por
+    frame) y solo se reasignan si cambia la resolución del stream.
+    """
+
+    def __init__(self, slots=CAPTURE_BUFFER_SLOTS, ready=None):
+        self._slots = [None] * max(2, slots)
+        self._ready = ready    # Event compartido entre cámaras: "hay un frame nuevo en algún ring"
+        self._timestamps = [0.0] * len(self._slots)
+        self._cond = Condition()
+        self._latest = -1      # slot publicado más reciente (aún no leído)
+        self._reading = -1     # slot en uso por el thread de inferencia
+        self._writing = -1     # slot en uso por el thread de captura
+        self._seq = 0          # número de frames publicados
+        self._read_seq = 0     # seq del último frame entregado al lector
+        self.frames_dropped = 0
+
+    def acquire_write_slot(self):
+        """Reserva un slot libre para decodificar; retorna (idx, array o None)"""
+        with self._cond:
+            busy = (self._reading, self._latest)
+            for offset in range(1, len(self._slots) + 1):
+                idx = (self._writing + offset) % len(self._slots)
+                if idx not in busy:
+                    break
+            else:
+                # Sin slots libres: se sobrescribe el último frame no leído
+                idx = self._latest
+                self._latest = -1
+                self.frames_dropped += 1
+            self._writing = idx
+            return idx, self._slots[idx]
+
+    def release_write_slot(self):
+        """
+        Desvincula el slot en escritura de un lector abandonado (bloqueado en cap.read):
+        su array queda huérfano y el slot se reasigna en la próxima escritura
+        """
+        with self._cond:
+            if self._writing != -1:
+                self._slots[self._writing] = None
+                self._writing = -1
+
+    def publish(self, idx, frame, timestamp):
+        """Publica el frame decodificado en el slot reservado"""
+        with self._cond:
+            self._slots[idx] = frame  # Mismo array salvo cambio de resolución
+            self._timestamps[idx] = timestamp
+            if self._latest != -1:
+                self.frames_dropped += 1  # El frame anterior nunca se analizó
+            self._latest = idx
+            self._writing = -1
+            self._seq += 1
+            self._cond.notify()
+        if self._ready is not None:
+            self._ready.set()
+
+    def get_latest(self, min_seq=0, timeout=1.0):
+        """
+        Entrega el frame más reciente con seq >= min_seq.
+
+        Retorna (frame, seq, timestamp) o (None, seq, 0.0) si vence el timeout.
+        El frame es válido hasta la siguiente llamada (usar .copy() para retenerlo).
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest != -1 and self._seq >= min_seq, timeout):
+                return None, self._read_seq, 0.0
+            self._reading = self._latest
+            self._latest = -1
+            self._read_seq = self._seq
+            return self._slots[self._reading], self._read_seq, self._timestamps[self._reading]
+
+    def has_frame(self, min_seq=0):
+        """True si get_latest(min_seq) entregaría un frame sin esperar"""
+        with self._cond:
+            return self._latest != -1 and self._seq >= min_seq
+
+    @property
+    def seq(self):
+        return self._seq
+
+
+gst_decoder = None
+gst_checked = False
+
+def detect_gst_decoder():
+    """
+    Primer decoder de GST_DECODERS disponible (OpenCV compilado con GStreamer + elemento
+    instalado según gst-inspect-1.0) o None. Se evalúa una sola vez por proceso
+    """
+    global gst_decoder, gst_checked
+    if gst_checked:
+        return gst_decoder
+    gst_checked = True
+
+    if not any(line.strip().startswith("GStreamer:") and "YES" in line
+               for line in cv2.getBuildInformation().splitlines()):
+        log("🎞️  OpenCV sin soporte GStreamer: decodificación por software (FFmpeg)")
+        return None
+    for decoder in GST_DECODERS:
+        try:
+            found = subprocess.run(["gst-inspect-1.0", "--exists", decoder], timeout=10).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            break  # Sin herramientas de GStreamer
+        if found:
+            gst_decoder = decoder
+            log(f"🎞️  Decodificación H.264 por hardware con GStreamer ({decoder})")
+            return gst_decoder
+    log(f"🎞️  Ningún decoder de GStreamer disponible ({', '.join(GST_DECODERS)}): FFmpeg por software")
+    return None
+
+def gstreamer_pipeline(camera_url, decoder):
+    """
+    Pipeline RTSP -> decoder -> FRAME_WIDTHxFRAME_HEIGHT en RGB. Se escala antes de convertir
+    (NV12 chico, poca CPU) y appsink conserva solo el frame más nuevo
+    """
+    return (
+        f'rtspsrc location="{camera_url}" protocols=tcp latency=0 ! '
+        f"rtph264depay ! h264parse ! {decoder} ! "
+        f"videoscale ! video/x-raw,width={FRAME_WIDTH},height={FRAME_HEIGHT} ! "
+        "videoconvert ! video/x-raw,format=RGB ! "
+        "appsink drop=true max-buffers=1 sync=false"
+    )
+
+def open_capture(camera_url):
+    """
+    Abre el stream RTSP. Retorna (cap, rgb).
+
+    Con GStreamer y un decoder por hardware los frames llegan ya escalados y en RGB (rgb=True,
+    sin cvtColor por frame). Si no hay GStreamer o el pipeline no abre (ej. stream H.265)
+    se usa FFmpeg por software, que entrega BGR como siempre (ULTRA-OPTIMIZADO para RAM limitada)
+    """
+    if CAPTURE_BACKEND != "ffmpeg":
+        decoder = detect_gst_decoder()
+        if decoder:
+            cap = cv2.VideoCapture(gstreamer_pipeline(camera_url, decoder), cv2.CAP_GSTREAMER)
+            if cap.isOpened():
+                return cap, True
+            cap.release()
+            log(f"⚠️  Pipeline GStreamer ({decoder}) no abrió, intentando con FFmpeg")
 
     # Configurar variables de entorno para FFmpeg (mínimo uso de memoria)
     os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = (
@@ -394,183 +2213,930 @@ def main():
 
     cap = cv2.VideoCapture(camera_url, cv2.CAP_FFMPEG)
 
-    if not cap.isOpened():
-        log("❌ No se pudo abrir stream RTSP")
-        sys.exit(1)
-
     # Configurar para mínima memoria
     cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)      # Buffer mínimo absoluto
     cap.set(cv2.CAP_PROP_FPS, 10)            # FPS bajo (10 FPS = menos RAM)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+    return cap, False
+
+
+class RtspReader(Thread):
+    """
+    Lee una conexión RTSP al ring buffer hasta que la lectura falla o el supervisor la abandona.
+    Un lector abandonado puede seguir bloqueado en cap.read() (hasta el stimeout de FFmpeg):
+    libera su captura recién al volver, sin publicar nada ni demorar la reconexión
+    """
+
+    def __init__(self, cap, supervisor):
+        super().__init__(daemon=True, name=f"{supervisor.name}-reader")
+        self.cap = cap
+        self.supervisor = supervisor
+        self.ring = supervisor.ring
+        self.active = True
+        self.failed = False
+        self.frames = 0
+        self.started_at = time.monotonic()
+        self.last_frame_at = self.started_at
+        self.last_pts = 0.0
+        self.pts_changed_at = self.last_frame_at
+
+    def run(self):
+        try:
+            while self.active:
+                idx, buf = self.ring.acquire_write_slot()
+                # cap.read() decodifica directo en el slot preasignado si el tamaño coincide
+                ret, frame = self.cap.read(buf) if buf is not None else self.cap.read()
+                if not self.active:
+                    break
+                if not ret:
+                    self.failed = True
+                    break
+
+                self.ring.publish(idx, frame, time.time())
+                self.frames += 1
+                self.supervisor.frames_captured += 1
+                now = time.monotonic()
+                self.last_frame_at = now
+                pts = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+                if pts != self.last_pts:
+                    self.last_pts = pts
+                    self.pts_changed_at = now
+        finally:
+            self.cap.release()
+
+    def stalled(self, now):
+        """Motivo si la conexión está congelada, o None"""
+        if now - self.last_frame_at > CAPTURE_STALL_SEC:
+            return "sin frames"
+        # Frames repetidos con el mismo timestamp (encoder colgado): solo si el stream reporta PTS
+        if self.last_pts > 0 and now - self.pts_changed_at > CAPTURE_STALL_SEC:
+            return "timestamps detenidos"
+        return None
+
+    def abandon(self):
+        self.active = False
+        self.ring.release_write_slot()
+
+
+class CaptureThread(Thread):
+    """
+    Supervisor de la captura RTSP de una cámara.
+
+    Cada conexión la lee un RtspReader que publica en el ring buffer, así FFmpeg nunca
+    acumula frames viejos aunque el motor de pose tarde: la inferencia siempre toma el
+    frame más fresco. El supervisor revisa la salud cada CAPTURE_WATCHDOG_SEC: si la lectura
+    falla o el stream se congela (sin frames o con timestamps detenidos por CAPTURE_STALL_SEC)
+    abandona la conexión y reconecta en background con backoff exponencial con jitter. El
+    loop de detección no espera ni pierde su estado: solo deja de recibir frames del corte.
+
+    Con rediscover=True (una cámara descubierta por scan_camera.sh) un corte largo con la IP
+    sin responder en el puerto RTSP dispara el scan de red, por si el DHCP le cambió la IP.
+    """
+
+    def __init__(self, cap, camera_ip, ring, name="rtsp-capture", camara="cam1", tag="", rediscover=False, rgb=False):
+        super().__init__(daemon=True, name=name)
+        self.cap = cap
+        self.rgb = rgb  # Frames en RGB (pipeline GStreamer) en vez de BGR (FFmpeg)
+        self.camera_ip = camera_ip
+        self.camera_url = get_camera_url(camera_ip)
+        self.ring = ring
+        self.camara = camara
+        self.tag = tag
+        self.rediscover = rediscover
+        self.running = True
+        self.wakeup = Event()
+        self.reader = None
+        self.frames_captured = 0
+        self.reconnects = 0
+        self.capture_fps = 0.0
+        self.connected = False
+        self.outage_start = None if cap.isOpened() else time.monotonic()
+        self.last_scan = None
+
+    def run(self):
+        cap, self.cap = self.cap, None
+        rgb = self.rgb
+        attempt = 0
+
+        while self.running:
+            if cap.isOpened():
+                self.rgb = rgb
+                reader = RtspReader(cap, self)
+                reason = self._watch(reader)
+                if reason is None:  # stop()
+                    break
+                if reader.frames and time.monotonic() - reader.started_at >= CAPTURE_STALL_SEC:
+                    attempt = 0  # La conexión anduvo: el backoff vuelve a empezar (uno que abre y cae al toque no)
+                self.connected = False
+                self.reconnects += 1
+                self.outage_start = time.monotonic()
+                log(f"⚠️  {self.tag}Stream RTSP {reason}, reconectando en background...")
+            else:
+                cap.release()
+
+            # Backoff exponencial con jitter (mitad fija + mitad aleatoria): varias cámaras o
+            # NanoPis caídos juntos no reintentan todos en el mismo instante
+            delay = min(CAPTURE_BACKOFF_MAX_SEC, CAPTURE_BACKOFF_BASE_SEC * 2 ** attempt)
+            delay = delay / 2 + random.uniform(0, delay / 2)
+            attempt += 1
+            self.wakeup.wait(delay)
+            if not self.running:
+                break
+
+            self._maybe_rediscover()
+            t0 = time.monotonic()
+            cap, rgb = open_capture(self.camera_url)
+            metrics.observe("vigilia_rtsp_reconnect_seconds", time.monotonic() - t0, camara=self.camara)
+            if not cap.isOpened():
+                log(f"⚠️  {self.tag}Reconexión RTSP fallida (intento {attempt}, "
+                    f"corte de {time.monotonic() - self.outage_start:.0f}s)")
+
+    def _watch(self, reader):
+        """Supervisa una conexión hasta que falla o se congela. Retorna el motivo (None si se detuvo)"""
+        self.reader = reader
+        reader.start()
+        fps_start = time.monotonic()
+        fps_frames = self.frames_captured
+
+        while self.running:
+            self.wakeup.wait(CAPTURE_WATCHDOG_SEC)
+            now = time.monotonic()
+
+            if reader.frames and not self.connected:
+                self.connected = True
+                if self.outage_start is not None:
+                    outage = now - self.outage_start
+                    metrics.observe("vigilia_rtsp_outage_seconds", outage, camara=self.camara)
+                    log(f"✅ {self.tag}Stream RTSP recuperado tras {outage:.1f}s sin video")
+                    self.outage_start = None
+
+            if now - fps_start >= 5.0:
+                self.capture_fps = (self.frames_captured - fps_frames) / (now - fps_start)
+                fps_start, fps_frames = now, self.frames_captured
+
+            if reader.failed:
+                return "sin lectura"
+            reason = reader.stalled(now)
+            if reason:
+                metrics.inc("vigilia_rtsp_stalls_total", camara=self.camara)
+                reader.abandon()
+                return f"congelado ({reason})"
+
+        reader.abandon()
+        reader.join(timeout=2)
+        return None
+
+    def _maybe_rediscover(self):
+        """
+        Busca otra IP solo si hay indicios de que cambió: corte de más de CAPTURE_REDISCOVER_SEC
+        y la IP actual ya no acepta conexiones en el puerto RTSP (una cámara que responde pero
+        no entrega video sigue en la misma IP y el scan no ayudaría)
+        """
+        if not self.rediscover or not SCAN_CAMERA_CMD or self.outage_start is None:
+            return
+        now = time.monotonic()
+        if now - self.outage_start < CAPTURE_REDISCOVER_SEC:
+            return
+        if self.last_scan is not None and now - self.last_scan < CAPTURE_RESCAN_INTERVAL_SEC:
+            return
+
+        # Un scan manual (o de otro proceso) ya pudo haber actualizado el archivo
+        ip = read_camera_ip_file()
+        if ip and ip != self.camera_ip:
+            self._set_camera_ip(ip)
+            return
+        if rtsp_port_open(self.camera_ip):
+            return
+
+        self.last_scan = now
+        log(f"🔍 {self.tag}Cámara sin respuesta en {self.camera_ip}:{RTSP_PORT}, buscando nueva IP...")
+        try:
+            subprocess.run([SCAN_CAMERA_CMD], timeout=CAPTURE_SCAN_TIMEOUT_SEC,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except (OSError, subprocess.SubprocessError) as e:
+            log(f"⚠️  {self.tag}No se pudo ejecutar {SCAN_CAMERA_CMD}: {e}")
+            return
+        metrics.inc("vigilia_camera_rescans_total", camara=self.camara)
+
+        ip = read_camera_ip_file()
+        if ip and ip != self.camera_ip:
+            self._set_camera_ip(ip)
+        else:
+            log(f"🔍 {self.tag}Scan sin cambios: la cámara sigue en {self.camera_ip} (o no se encontró)")
+
+    def _set_camera_ip(self, camera_ip):
+        log(f"📹 {self.tag}Nueva IP de cámara: {self.camera_ip} -> {camera_ip}")
+        self.camera_ip = camera_ip
+        self.camera_url = get_camera_url(camera_ip)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+# ===========================
+# MULTI-CÁMARA (un proceso, un motor de pose)
+# ===========================
+
+class CameraStream:
+    """
+    Todo lo que es propio de una cámara: captura, detección y reporte al backend.
+
+    Las cámaras comparten el motor de pose, el outbox y el control adaptativo; cada una tiene su
+    thread de captura y ring buffer, su máquina de estados de caída (FallDetector), compuerta de
+    movimiento, buffer pre-evento, cooldowns y su propio dispositivo en el backend: la
+    primera usa el HARDWARE_ID del NanoPi (compatible con instalaciones de una cámara) y
+    las siguientes "{HARDWARE_ID}-cam2", "-cam3"...
+    """
+
+    def __init__(self, index, camera_ip, ready, multi=False):
+        self.index = index
+        self.name = f"cam{index + 1}"
+        self.tag = f"[{self.name}] " if multi else ""  # Prefijo de log solo con varias cámaras
+        self.multi = multi
+        self.hardware_id = HARDWARE_ID if index == 0 else f"{HARDWARE_ID}-{self.name}"
+        self.camera_ip = camera_ip
+        self.camera_url = get_camera_url(camera_ip)
+        self.ring = FrameRingBuffer(CAPTURE_BUFFER_SLOTS, ready)
+        self.capture = None
+        self.detector = FallDetector()
+        self.motion_gate = MotionGate() if MOTION_GATE_ENABLED else None
+        self.pre_event = PreEventBuffer() if CLIP_ENABLED else None
+        self.dispositivo_id = None
+        self.adulto_mayor_id = None
+        self.cooldown_cache = None
+        self.telemetry = None
+        self.last_seq = 0
+        self.last_analyzed = 0.0
+
+    def register(self):
+        """Obtiene el device ID de esta cámara y arranca su copia local del cooldown extendido"""
+        self.dispositivo_id, self.adulto_mayor_id = get_or_create_device_id(self.hardware_id)
+        if not self.dispositivo_id:
+            log(f"[WARN] {self.tag}No se pudo obtener device ID, continuando sin backend...")
+            return
+        log(f"[OK] {self.tag}Device ID: {self.dispositivo_id}, Adulto Mayor ID: {self.adulto_mayor_id}")
+        # Resetear cooldown extendido al iniciar (util para pruebas con stakeholders)
+        log(f"[INFO] {self.tag}Reseteando cooldown extendido para pruebas...")
+        reset_cooldown_extendido(self.dispositivo_id, self.adulto_mayor_id)
+        # Copia local del cooldown extendido (el loop de detección no hace HTTP)
+        if self.adulto_mayor_id:
+            self.cooldown_cache = CooldownCache(self.dispositivo_id, self.adulto_mayor_id)
+            self.cooldown_cache.start()
+
+    def start_capture(self):
+        """Abre el RTSP y arranca el thread de captura; False si el stream no abrió"""
+        cap, rgb = open_capture(self.camera_url)
+        opened = cap.isOpened()
+        # Aunque no abra, el thread reintenta la conexión (las demás cámaras siguen).
+        # Redescubrimiento de IP solo para la cámara única que encontró scan_camera.sh
+        rediscover = not self.multi and self.camera_ip == read_camera_ip_file()
+        self.capture = CaptureThread(cap, self.camera_ip, self.ring, name=f"rtsp-capture-{self.name}",
+                                     camara=self.name, tag=self.tag, rediscover=rediscover, rgb=rgb)
+        self.capture.start()
+        return opened
+
+    def start_telemetry(self, outbox):
+        self.telemetry = TelemetryReporter(self.dispositivo_id, self.capture, outbox, self.hardware_id)
+        self.telemetry.start()
+
+    def register_metrics(self):
+        """Valores de esta cámara leídos en cada scrape de /metrics"""
+        camara = self.name
+        metrics.collect("vigilia_capture_fps", lambda: round(self.capture.capture_fps, 2), camara=camara)
+        metrics.collect("vigilia_frames_captured_total", lambda: self.capture.frames_captured, camara=camara)
+        metrics.collect("vigilia_rtsp_reconnects_total", lambda: self.capture.reconnects, camara=camara)
+        metrics.collect("vigilia_rtsp_connected", lambda: int(self.capture.connected), camara=camara)
+        metrics.collect("vigilia_frames_dropped_total", lambda: self.ring.frames_dropped, camara=camara)
+        metrics.collect("vigilia_frames_gated_total",
+                        lambda: self.motion_gate.frames_gated if self.motion_gate else 0, camara=camara)
+        metrics.collect("vigilia_fall_counter", lambda: self.detector.fall_counter, camara=camara)
+        metrics.collect("vigilia_alert_active", lambda: int(self.detector.alert_active), camara=camara)
+
+    def stop(self):
+        if self.capture:
+            self.capture.stop()
+            self.capture.join(timeout=5)
+        if self.telemetry:
+            self.telemetry.stop()
+        if self.cooldown_cache:
+            self.cooldown_cache.stop()
+
+def next_stream(streams, ready, skip, timeout=1.0):
+    """
+    Elige la próxima cámara a analizar con el motor de pose compartido.
+
+    Entre las cámaras con un frame nuevo (respetando el paso mínimo) se elige la que lleva
+    más tiempo sin análisis: round-robin cuando todas tienen frames, y ninguna se queda sin
+    turno si otra entrega frames más rápido. Retorna (stream, frame, captured_at) o
+    (None, None, 0.0) si no llegó ningún frame en `timeout` segundos.
+    """
+    ready.clear()  # Antes de revisar: un publish durante la revisión no se pierde
+    candidates = [stream for stream in streams if stream.ring.has_frame(stream.last_seq + skip + 1)]
+    if not candidates:
+        ready.wait(timeout)
+        return None, None, 0.0
+    stream = min(candidates, key=lambda candidate: candidate.last_analyzed)
+    frame, stream.last_seq, captured_at = stream.ring.get_latest(min_seq=stream.last_seq + skip + 1, timeout=0)
+    if frame is None:
+        return None, None, 0.0
+    stream.last_analyzed = time.time()
+    return stream, frame, captured_at
+
+# ===========================
+# MAIN LOOP
+# ===========================
+
+def main():
+    log("="*50)
+    log(f"🚀 DETECCIÓN DE CAÍDAS EN EDGE - {POSE_ENGINE}")
+    log(f"🔧 Hardware ID: {HARDWARE_ID}")
+    log(f"📦 Bucket: gs://{BUCKET_NAME}/{HARDWARE_ID}/")
+    log(f"🎯 Backend: {BACKEND_API_URL}")
+    log("="*50)
+    startup = StartupTimer()
+    startup.mark("imports")
+    if MEMORY_TRACEMALLOC:
+        memory.start_tracing()
 
-    log(f"✅ Stream RTSP conectado ({FRAME_WIDTH}x{FRAME_HEIGHT}, SKIP_FRAMES={SKIP_FRAMES})")
+    # Endpoint local de métricas (antes que todo, para observar también el arranque)
+    start_metrics_server()
 
-    # Estado de detección
-    fall_counter = 0
-    alert_active = False
-    alert_start_time = 0  # Momento en que empezó la alerta actual
-    last_alert_time = 0
+    # Cargar IP(s) de cámara
+    camera_ips = load_camera_ips()
+    if not camera_ips:
+        log("❌ No se pudo cargar IP de cámara. Ejecuta scan_camera.sh primero.")
+        sys.exit(1)
+
+    ready = Event()  # Señal compartida: llegó un frame nuevo en alguna cámara
+    multi = len(camera_ips) > 1
+    streams = [CameraStream(i, ip, ready, multi) for i, ip in enumerate(camera_ips)]
+    for stream in streams:
+        log(f"📹 {stream.tag}Cámara: rtsp://{RTSP_USER}:***@{stream.camera_ip}:{RTSP_PORT}{RTSP_PATH}")
+
+    # Motor de pose compartido (con varias cámaras, sin tracking entre frames). Se carga en
+    # background: RTSP y registro en el backend avanzan en paralelo con el modelo
+    log(f"🤖 Cargando motor de pose '{POSE_ENGINE}' en background...")
+    loader = PoseEngineLoader(POSE_ENGINE, multi)
+    loader.start()
+    if multi:
+        log(f"🎥 Modo multi-cámara: {len(streams)} streams, un solo motor de pose")
+
+    # Precalentar conexión keep-alive con el backend (handshake fuera del camino de la alerta)
+    start_backend_keepalive()
+
+    # Conectar a camara(s) RTSP (ULTRA-OPTIMIZADO para RAM limitada)
+    # Captura en thread dedicado -> ring buffer (la inferencia toma siempre el frame más fresco)
+    log("🔌 Conectando a stream RTSP (substream, ultra-ligero)...")
+    opened = [stream.start_capture() for stream in streams]
+    if not any(opened):
+        log("❌ No se pudo abrir stream RTSP")
+        for stream in streams:
+            stream.stop()
+        sys.exit(1)
+    for stream, ok in zip(streams, opened):
+        if ok:
+            log(f"✅ {stream.tag}Stream RTSP conectado ({FRAME_WIDTH}x{FRAME_HEIGHT}, SKIP_FRAMES={SKIP_FRAMES})")
+        else:
+            log(f"⚠️  {stream.tag}Stream RTSP no disponible, el thread de captura seguirá reintentando")
+    log(f"🧵 Thread de captura iniciado (ring buffer de {CAPTURE_BUFFER_SLOTS} slots por cámara)")
+    startup.mark("rtsp")
+
+    # Obtener device ID (uno por cámara) + cooldown extendido local, en background: con el
+    # backend caído o lento la detección arranca igual (outbox y telemetría resuelven el ID solos)
+    def _register():
+        for stream in streams:
+            stream.register()
+        log(f"⏱️  Registro en backend completo (t+{time.monotonic() - STARTUP_T0:.2f}s)")
+
+    Thread(target=_register, daemon=True, name="backend-register").start()
+
+    # Outbox persistente: las alertas se guardan en disco y se envían en background
+    outbox = AlertOutbox(OUTBOX_PATH, streams)
+    outbox.start()
+    log(f"📬 Outbox de alertas: {OUTBOX_PATH}")
+
+    # Heartbeat + telemetría en lote al backend (por cámara) y métricas
+    for stream in streams:
+        stream.start_telemetry(outbox)
+        stream.register_metrics()
+
+    # Recién aquí se necesita el modelo (normalmente ya terminó de cargar)
+    try:
+        engine = loader.result()
+    except Exception as e:
+        log(f"❌ No se pudo inicializar el motor de pose: {e}")
+        for stream in streams:
+            stream.stop()
+        outbox.stop()
+        sys.exit(1)
+    log(f"✅ Motor de pose: {engine.describe()} (cargado en {loader.load_s:.2f}s)")
+    startup.mark("motor de pose")
+    memory.checkpoint("motor de pose")
+
+    # Control adaptativo compartido: la CPU (y el motor de pose) es una sola para todas las cámaras
+    controller = AdaptiveController(SKIP_FRAMES) if ADAPTIVE_ENABLED else None
+    if controller:
+        log(f"🎛️  Control adaptativo: objetivo {ADAPTIVE_TARGET_MS:.0f}ms, skip {ADAPTIVE_SKIP_MIN}-{ADAPTIVE_SKIP_MAX}, "
+            f"resoluciones {' / '.join(f'{w}x{h}' for w, h in ADAPTIVE_RESOLUTIONS)}")
     frame_count = 0
 
-    # Buffers de suavizado con running sums (OPTIMIZADO)
-    tilt_hist = deque(maxlen=SMOOTH_WINDOW)
-    hip_hist = deque(maxlen=SMOOTH_WINDOW)
-    ar_hist = deque(maxlen=SMOOTH_WINDOW)
+    # Gobernador de memoria: recorta buffers pre-evento, resolución y uploads secundarios por escalones
+    memory.attach([s.pre_event for s in streams if s.pre_event], controller, outbox)
+    if memory.budget:
+        log(f"🧠 Presupuesto de memoria: {MEMORY_BUDGET_MB}MB (escalones al "
+            f"{' / '.join(f'{step:.0%}' for step in MEMORY_SHED_STEPS)})")
 
-    # Running sums para evitar recalcular sum() cada frame
-    tilt_sum = 0.0
-    hip_sum = 0.0
-    ar_sum = 0.0
+    metrics.collect("vigilia_outbox_pending", lambda: outbox.backlog)
+    metrics.collect("vigilia_operating_point_width", lambda: controller.size[0] if controller else FRAME_WIDTH)
+    metrics.collect("vigilia_operating_point_skip", lambda: controller.skip if controller else SKIP_FRAMES)
 
     log("🎬 Iniciando procesamiento de video...")
 
     # Variables para FPS
     fps_start_time = time.time()
     fps_frame_count = 0
+    frame_age_sum = 0.0
 
     try:
         while True:
-            ret, frame = cap.read()
-            if not ret:
-                log("⚠️  Error al leer frame, reconectando...")
-                cap.release()
-                time.sleep(2)
-                cap = cv2.VideoCapture(camera_url, cv2.CAP_FFMPEG)
+            # Frame más reciente de la próxima cámara, respetando un paso mínimo entre análisis
+            # (SKIP_FRAMES o el del control adaptativo). Si la inferencia va más lenta que la
+            # cámara, se toma el último sin esperar.
+            skip = controller.skip if controller else SKIP_FRAMES
+            stream, frame, captured_at = next_stream(streams, ready, skip)
+            memory.observe(time.time())  # También con escena estática o sin video
+            if frame is None:
                 continue
 
             frame_count += 1
+            detector = stream.detector
+            rgb_input = stream.capture.rgb  # GStreamer ya entrega RGB
+
+            # Buffer pre-evento (también en escena estática: el clip debe cubrir los segundos previos)
+            if stream.pre_event:
+                stream.pre_event.push(frame, captured_at, rgb_input)
 
-            # Skip frames para optimizar (opcional)
-            if SKIP_FRAMES > 0 and frame_count % (SKIP_FRAMES + 1) != 0:
+            # Escena estática: saltar MediaPipe (salvo keep-alive o persona ya acostada)
+            if stream.motion_gate and not stream.motion_gate.should_run_pose(frame, time.time(), detector):
                 continue
 
-            # Procesar con MediaPipe
-            H, W = frame.shape[:2]
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame_age_sum += time.time() - captured_at
 
+            # Procesar con el motor de pose (a la resolución del punto de operación; el snapshot usa el frame original)
+            infer_start = time.time()
+            small = controller.prepare(frame) if controller else frame
+            rgb = small if rgb_input else cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+            # Pose + métricas (el motor solo entrega landmarks, las señales son las mismas)
             try:
-                results = pose.process(rgb)
+                pose_metrics = engine.estimate(small, rgb)
             except Exception as e:
-                log(f"⚠️  Error en MediaPipe: {e}")
-                results = None
-
-            # Extraer métricas
-            mid_shoulder, mid_hip, torso_angle, hip_y_ratio, bbox = extract_pose_metrics(frame, results)
-
-            # Detectar señales de caída (OPTIMIZADO con running sums)
-            pose_signals = []
-
-            if torso_angle is not None:
-                # Si el deque está lleno, restar el valor que se va a eliminar
-                if len(tilt_hist) >= SMOOTH_WINDOW:
-                    tilt_sum -= tilt_hist[0]
-                tilt_hist.append(torso_angle)
-                tilt_sum += torso_angle
-                tilt_smooth = tilt_sum / len(tilt_hist)
-                if tilt_smooth > TORSO_TILT_DEG:
-                    pose_signals.append("tilt")
-
-            if hip_y_ratio is not None:
-                if len(hip_hist) >= SMOOTH_WINDOW:
-                    hip_sum -= hip_hist[0]
-                hip_hist.append(hip_y_ratio)
-                hip_sum += hip_y_ratio
-                hip_smooth = hip_sum / len(hip_hist)
-                if hip_smooth > HIP_Y_RATIO:
-                    pose_signals.append("hip")
-
-            if bbox is not None:
-                x1, y1, x2, y2 = bbox
-                w = x2 - x1
-                h = y2 - y1
-                if h > 0:
-                    ar = w / float(h)
-                    if len(ar_hist) >= SMOOTH_WINDOW:
-                        ar_sum -= ar_hist[0]
-                    ar_hist.append(ar)
-                    ar_sum += ar
-                    ar_smooth = ar_sum / len(ar_hist)
-                    if ar_smooth > ASPECT_THRESHOLD:
-                        pose_signals.append("aspect")
-
-            # ¿Señal de caída?
-            frame_has_fall_signal = len(pose_signals) >= 2  # Al menos 2 señales
-
-            # Histeresis (reset rápido)
-            prev_alert = alert_active
-            if frame_has_fall_signal:
-                fall_counter += 1
-            else:
-                fall_counter -= 2  # Resetea 2x más rápido cuando no hay señal
-            fall_counter = max(0, min(fall_counter, FRAMES_CONFIRM * 2))  # Limitar máximo
-            alert_active = fall_counter >= FRAMES_CONFIRM
-
-            # Timeout automático: si está en alerta por más de ALERT_TIMEOUT_SEC, forzar reset
-            if alert_active and alert_start_time > 0:
-                time_in_alert = time.time() - alert_start_time
-                if time_in_alert > ALERT_TIMEOUT_SEC:
-                    log(f"⏰ Timeout de alerta alcanzado ({time_in_alert:.1f}s), reseteando estado")
-                    fall_counter = 0
-                    alert_active = False
-                    alert_start_time = 0
-                    prev_alert = False  # Asegurar transición limpia
+                log(f"⚠️  {stream.tag}Error en motor de pose: {e}")
+                pose_metrics = None
+
+            # Suavizado + histéresis + cooldown (estado propio de esta cámara)
+            now = time.time()
+            decision = detector.update(pose_metrics, now)
+            memory.checkpoint("pose")
+            metrics.inc("vigilia_frames_analyzed_total", camara=stream.name)
+            metrics.observe("vigilia_inference_seconds", now - infer_start)
+            metrics.observe("vigilia_detection_latency_seconds", now - captured_at, camara=stream.name)
+            stream.telemetry.record_latency(now - captured_at)
+            if controller:
+                controller.observe(now - captured_at, now - infer_start, now)
+
+            if not startup.done:
+                startup.finish()
+                memory.checkpoint("arranque")
+                # Cliente GCS (import incluido) precalentado fuera del arranque, antes de la primera alerta
+                Thread(target=init_gcs_bucket, daemon=True, name="gcs-init").start()
 
             # Caída confirmada (transición a alerta)
-            if alert_active and not prev_alert:
-                # Si estamos en alerta pero sin timestamp, establecerlo
-                if alert_start_time == 0:
-                    alert_start_time = time.time()
-
-                current_time = time.time()
-
+            if decision.new_fall:
                 # Verificar cooldown
-                if current_time - last_alert_time < ALERT_COOLDOWN_SEC:
-                    log(f"⏸️  Caída detectada pero en cooldown ({int(current_time - last_alert_time)}s)")
+                if not decision.alert:
+                    log(f"⏸️  {stream.tag}Caída detectada pero en cooldown "
+                        f"({int(ALERT_COOLDOWN_SEC - decision.cooldown_remaining)}s)")
+                    metrics.inc("vigilia_falls_total", resultado="cooldown", camara=stream.name)
                     continue
 
-                alert_start_time = time.time()  # Marcar inicio de esta alerta
-                log(f"🚨 ¡CAÍDA DETECTADA! Señales: {pose_signals}")
+                log(f"🚨 {stream.tag}¡CAÍDA DETECTADA! Señales: {list(decision.reasons)}")
 
-                # Verificar si hay cooldown extendido (cuidador confirmó "Ya voy")
-                if dispositivo_id and adulto_mayor_id and check_cooldown_extendido(dispositivo_id, adulto_mayor_id):
-                    log("⏭️  Caída detectada pero cooldown extendido activo - no se crea alerta")
-                    # No crear alerta pero actualizar last_alert_time para respetar cooldown normal
-                    last_alert_time = current_time
+                # Verificar si hay cooldown extendido (cuidador confirmó "Ya voy"): lectura en memoria
+                cooldown_cache = stream.cooldown_cache
+                if cooldown_cache and cooldown_cache.is_active():
+                    log(f"⏭️  {stream.tag}Caída detectada pero cooldown extendido activo ({cooldown_cache.remaining()}s) - no se crea alerta")
+                    # No crear alerta pero contarla para respetar el cooldown normal
+                    detector.suppress(now)
+                    metrics.inc("vigilia_falls_total", resultado="cooldown_extendido", camara=stream.name)
                     continue
 
-                # Guardar snapshot y notificar en background (NO BLOQUEA)
-                frame_copy = frame.copy()  # Copiar frame para thread seguro
-                save_snapshot_async(frame_copy, dispositivo_id, adulto_mayor_id)
-                last_alert_time = current_time
-                log("✅ Alerta enviada a procesamiento asíncrono")
-
-            # Si no hay alerta, resetear timestamp
-            if not alert_active:
-                alert_start_time = 0
+                # Encolar snapshot + notificación en el outbox persistente (NO BLOQUEA)
+                # Copiar frame para thread seguro (en BGR, como espera el JPEG del snapshot)
+                frame_copy = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR) if rgb_input else frame.copy()
+                clip_frames = stream.pre_event.snapshot() if stream.pre_event else None
+                outbox.enqueue(frame_copy, stream.dispositivo_id, stream.adulto_mayor_id, clip_frames, stream.hardware_id)
+                memory.checkpoint("alerta")
+                metrics.inc("vigilia_falls_total", resultado="alerta", camara=stream.name)
+                log(f"✅ {stream.tag}Alerta encolada en outbox")
 
-            # Calcular FPS real
+            # Calcular FPS real (inferencia vs captura)
             fps_frame_count += 1
             if fps_frame_count >= 100:
                 elapsed = time.time() - fps_start_time
                 current_fps = fps_frame_count / elapsed
-                log(f"📊 FPS: {current_fps:.1f} | Frames: {frame_count} | Estado: {'🚨 ALERTA' if alert_active else '✅ Normal'}")
+                metrics.set("vigilia_inference_fps", round(current_fps, 2))
+                avg_age_ms = frame_age_sum / fps_frame_count * 1000
+                capture_fps = " / ".join(f"{s.capture.capture_fps:.1f}" for s in streams)
+                dropped = sum(s.ring.frames_dropped for s in streams)
+                gated = sum(s.motion_gate.frames_gated for s in streams if s.motion_gate)
+                alerts = [s.name for s in streams if s.detector.alert_active]
+                status = ("🚨 ALERTA" + (f" ({', '.join(alerts)})" if multi else "")) if alerts else "✅ Normal"
+                op_point = controller.describe() if controller else f"{small.shape[1]}x{small.shape[0]} skip={SKIP_FRAMES}"
+                log(f"📊 FPS inferencia: {current_fps:.1f} | FPS captura: {capture_fps} | "
+                    f"Descartados: {dropped} | Sin pose (estático): {gated} | Edad frame: {avg_age_ms:.0f}ms | "
+                    f"Punto op: {op_point} | {memory.describe()} | Frames: {frame_count} | Estado: {status}")
                 fps_start_time = time.time()
                 fps_frame_count = 0
-
-            # Limpieza de memoria cada 1000 frames (reducido para mejor rendimiento)
-            if frame_count % 1000 == 0:
-                gc.collect()  # Forzar recolección de basura
-                log(f"🧹 Limpieza de memoria ejecutada (frame {frame_count})")
+                frame_age_sum = 0.0
 
     except KeyboardInterrupt:
         log("👋 Deteniendo por interrupción de usuario...")
     except Exception as e:
         log(f"❌ Error fatal: {e}")
     finally:
-        cap.release()
-        pose.close()
+        for stream in streams:
+            stream.stop()
+        outbox.stop()
+        outbox.join(timeout=5)
+        for stream in streams:
+            stream.telemetry.join(timeout=12)  # Último lote de muestras antes de salir
+        engine.close()
         log("🛑 Recursos liberados")
 
+# ===========================
+# MODO REPLAY / BENCHMARK (sin cámara)
+# ===========================
+
+REPLAY_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+REPLAY_DEFAULT_FPS = 10.0       # FPS asumido para directorios de frames
+REPLAY_MATCH_WINDOW_SEC = 10.0  # Ventana para emparejar una detección con una caída etiquetada
+REPLAY_STAGES = ("decode", "resize", "motion", "color", "pose", "metrics", "decision")
+
+def iter_replay_frames(source, fps_override=None):
+    """Genera (frame, t_video, fps, decode_s) desde un video o un directorio de imágenes"""
+    if os.path.isdir(source):
+        fps = fps_override or REPLAY_DEFAULT_FPS
+        names = sorted(n for n in os.listdir(source) if n.lower().endswith(REPLAY_IMAGE_EXTS))
+        for i, name in enumerate(names):
+            t0 = time.perf_counter()
+            frame = cv2.imread(os.path.join(source, name))
+            decode_s = time.perf_counter() - t0
+            if frame is None:
+                log(f"⚠️  No se pudo leer {name}, se omite")
+                continue
+            yield frame, i / fps, fps, decode_s
+        return
+
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        log(f"❌ No se pudo abrir {source}")
+        return
+    fps = fps_override or cap.get(cv2.CAP_PROP_FPS) or REPLAY_DEFAULT_FPS
+    i = 0
+    try:
+        while True:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            decode_s = time.perf_counter() - t0
+            if not ret:
+                break
+            yield frame, i / fps, fps, decode_s
+            i += 1
+    finally:
+        cap.release()
+
+def load_replay_labels(path):
+    """
+    Carga timestamps de caídas etiquetadas (segundos desde el inicio del video).
+
+    Formatos JSON aceptados: lista [12.5, 40.2] (aplica a todas las fuentes)
+    o diccionario {"caida1.mp4": [12.5], "frames_sala/": [3.0]} por nombre de fuente.
+    """
+    if not path:
+        return {}
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {"*": [float(t) for t in data]}
+    return {os.path.basename(os.path.normpath(k)): [float(t) for t in v] for k, v in data.items()}
+
+def summarize_stage(samples):
+    """Retorna (media, p50, p95, max) en ms"""
+    if not samples:
+        return 0.0, 0.0, 0.0, 0.0
+    arr = np.asarray(samples) * 1000.0
+    return arr.mean(), np.percentile(arr, 50), np.percentile(arr, 95), arr.max()
+
+def match_detections(detections, labels):
+    """Empareja detecciones con caídas etiquetadas. Retorna (latencias, perdidas, falsas_alarmas)"""
+    latencies = []
+    missed = []
+    used = set()
+    for label_t in sorted(labels):
+        match = next((d for d in detections if d not in used and label_t <= d <= label_t + REPLAY_MATCH_WINDOW_SEC), None)
+        if match is None:
+            missed.append(label_t)
+        else:
+            used.add(match)
+            latencies.append(match - label_t)
+    false_alarms = [d for d in detections if d not in used]
+    return latencies, missed, false_alarms
+
+def replay_source(source, args, engine, timings):
+    """
+    Reproduce una fuente con el mismo pipeline que main().
+    Retorna (leidos, analizados, con_persona, detecciones, wall_s)
+    """
+    detector = FallDetector()
+    motion_gate = MotionGate() if args.motion_gate else None
+    controller = AdaptiveController(args.skip) if args.adaptive else None
+    detections = []
+    frames_read = 0
+    frames_analyzed = 0
+    frames_person = 0
+    last_index = -(args.skip + 1)
+    wall_start = time.perf_counter()
+
+    for index, (frame, t_video, fps, decode_s) in enumerate(iter_replay_frames(source, args.fps)):
+        frames_read += 1
+
+        if args.realtime:
+            # A ritmo real: esperar al frame o descartarlo si la inferencia va atrasada
+            # (emula el ring buffer de captura, que entrega siempre el frame más fresco)
+            lag = (time.perf_counter() - wall_start) - t_video
+            if lag < 0:
+                time.sleep(-lag)
+            elif lag > 1.0 / fps:
+                continue
+        skip = controller.skip if controller else args.skip
+        if index - last_index < skip + 1:
+            continue
+        last_index = index
+        timings["decode"].append(decode_s)
+
+        if controller:
+            t0 = time.perf_counter()
+            frame = controller.prepare(frame)
+            timings["resize"].append(time.perf_counter() - t0)
+        elif args.width and args.height:
+            t0 = time.perf_counter()
+            frame = cv2.resize(frame, (args.width, args.height), interpolation=cv2.INTER_AREA)
+            timings["resize"].append(time.perf_counter() - t0)
+
+        if motion_gate:
+            t0 = time.perf_counter()
+            run_pose = motion_gate.should_run_pose(frame, t_video, detector)
+            timings["motion"].append(time.perf_counter() - t0)
+            if not run_pose:
+                continue
+
+        frames_analyzed += 1
+        t0 = time.perf_counter()
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        t1 = time.perf_counter()
+        try:
+            found = engine.detect(rgb)
+        except Exception as e:
+            log(f"⚠️  Error en motor de pose: {e}")
+            found = False
+        t2 = time.perf_counter()
+        pose_metrics = None
+        if found:
+            frames_person += 1
+            pose_metrics = landmark_metrics(frame, engine.vmin)
+        t3 = time.perf_counter()
+        decision = detector.update(pose_metrics, t_video)
+        if decision.alert:
+            detections.append(t_video)
+            log(f"🚨 [{os.path.basename(source)}] Caída detectada en t={t_video:.2f}s Señales: {list(decision.reasons)}")
+        t4 = time.perf_counter()
+        memory.checkpoint("pose")
+
+        timings["color"].append(t1 - t0)
+        timings["pose"].append(t2 - t1)
+        timings["metrics"].append(t3 - t2)
+        timings["decision"].append(t4 - t3)
+
+        if controller:
+            # A ritmo real la latencia es el atraso respecto al video; a máxima velocidad, el procesamiento
+            latency = (t4 - wall_start) - t_video if args.realtime else t4 - t0
+            controller.observe(latency, t4 - t0, t_video)
+
+    if controller:
+        log(f"🎛️  [{os.path.basename(source)}] Punto de operación final: {controller.describe()} "
+            f"({controller.changes} cambios)")
+    return frames_read, frames_analyzed, frames_person, detections, time.perf_counter() - wall_start
+
+def replay_engine(name, args, labels):
+    """Corre todas las fuentes con un motor de pose, imprime sus tiempos por etapa y retorna el resumen"""
+    # CPU de proceso (incluye los threads del motor) y RAM que agrega el motor sobre la base
+    rss_base = read_rss_bytes() or 0
+    cpu_start = time.process_time()
+    try:
+        engine = create_pose_engine(name)
+    except Exception as e:
+        log(f"❌ No se pudo inicializar el motor '{name}': {e}")
+        return None
+    log(f"🤖 Motor de pose: {engine.describe()}")
+
+    timings = {stage: [] for stage in REPLAY_STAGES}
+    all_latencies, all_missed, all_false = [], [], []
+    total_analyzed = 0
+    total_person = 0
+    total_wall = 0.0
+    rss_peak = rss_base
+
+    try:
+        for source in args.replay:
+            read, analyzed, person, detections, wall_s = replay_source(source, args, engine, timings)
+            rss_peak = max(rss_peak, read_rss_bytes() or 0)
+            total_analyzed += analyzed
+            total_person += person
+            total_wall += wall_s
+            log(f"📼 {source}: {read} frames leídos, {analyzed} analizados en {wall_s:.1f}s "
+                f"({analyzed / wall_s if wall_s > 0 else 0:.1f} FPS) | Detecciones: {[round(d, 2) for d in detections]}")
+
+            source_labels = labels.get(os.path.basename(os.path.normpath(source)), labels.get("*"))
+            if source_labels is not None:
+                latencies, missed, false_alarms = match_detections(detections, source_labels)
+                all_latencies += latencies
+                all_missed += missed
+                all_false += false_alarms
+    finally:
+        engine.close()
+    cpu_s = time.process_time() - cpu_start
+
+    print(f"\n📊 TIEMPOS POR ETAPA (ms) - {name}")
+    print(f"{'etapa':<10}{'n':>8}{'media':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for stage in REPLAY_STAGES:
+        if timings[stage]:
+            mean, p50, p95, mx = summarize_stage(timings[stage])
+            print(f"{stage:<10}{len(timings[stage]):>8}{mean:>10.2f}{p50:>10.2f}{p95:>10.2f}{mx:>10.2f}")
+    print(f"FPS analizados: {total_analyzed / total_wall if total_wall > 0 else 0:.2f}")
+
+    if labels:
+        print(f"\n⏱️  LATENCIA DE DETECCIÓN vs ETIQUETAS - {name}")
+        if all_latencies:
+            mean, p50, p95, mx = summarize_stage(all_latencies)
+            print(f"Detectadas: {len(all_latencies)} | media {mean:.0f}ms | p50 {p50:.0f}ms | p95 {p95:.0f}ms | max {mx:.0f}ms")
+        print(f"Perdidas: {len(all_missed)} {all_missed} | Falsas alarmas: {len(all_false)} {[round(d, 2) for d in all_false]}")
+
+    return {
+        "engine": name,
+        "analyzed": total_analyzed,
+        "fps": total_analyzed / total_wall if total_wall > 0 else 0.0,
+        "pose_ms": summarize_stage(timings["pose"])[0],
+        "cpu_ms": cpu_s * 1000.0 / total_analyzed if total_analyzed else 0.0,
+        "ram_mb": (rss_peak - rss_base) / 1e6,
+        "person": total_person / total_analyzed if total_analyzed else 0.0,
+        "detected": len(all_latencies),
+        "missed": len(all_missed),
+        "false": len(all_false),
+    }
+
+def replay_main(args):
+    """
+    Modo replay: reproduce videos/directorios de frames y reporta tiempos por etapa y latencia.
+    Con varios --engine corre las mismas fuentes con cada motor y compara CPU, RAM y aciertos
+    """
+    log("="*50)
+    log(f"🎞️  MODO REPLAY ({'tiempo real' if args.realtime else 'máxima velocidad'}) - SKIP_FRAMES={args.skip}")
+    log("="*50)
+
+    labels = load_replay_labels(args.labels)
+    summaries = [summary for summary in (replay_engine(name, args, labels) for name in args.engine) if summary]
+    if len(summaries) < 2:
+        return
+
+    # RAM: el RSS no siempre baja al cerrar un motor; para una cifra exacta correr un --engine por proceso
+    print("\n🏁 COMPARACIÓN DE MOTORES")
+    print(f"{'motor':<12}{'FPS':>8}{'pose ms':>10}{'CPU ms/fr':>11}{'RAM MB':>9}{'persona':>9}"
+          + (f"{'detect.':>9}{'perdidas':>10}{'falsas':>8}" if labels else ""))
+    for summary in summaries:
+        print(f"{summary['engine']:<12}{summary['fps']:>8.2f}{summary['pose_ms']:>10.2f}{summary['cpu_ms']:>11.2f}"
+              f"{summary['ram_mb']:>9.1f}{summary['person']:>9.0%}"
+              + (f"{summary['detected']:>9}{summary['missed']:>10}{summary['false']:>8}" if labels else ""))
+
+def memory_growth_mb_per_hour(samples):
+    """Pendiente de mínimos cuadrados de [(segundos, rss_bytes)] en MB/h (None con menos de 2 muestras)"""
+    if len(samples) < 2:
+        return None
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_r = sum(r for _, r in samples) / n
+    var_t = sum((t - mean_t) ** 2 for t, _ in samples)
+    if var_t == 0:
+        return None
+    slope = sum((t - mean_t) * (r - mean_r) for t, r in samples) / var_t  # bytes/s
+    return slope * 3600 / 1e6
+
+def soak_main(args):
+    """
+    Modo soak: repite las fuentes de --replay durante --soak horas con el primer --engine y
+    reporta el crecimiento de memoria por hora. La primera pasada (carga del modelo, buffers)
+    es el calentamiento: las muestras de RSS y el trazado de tracemalloc empiezan después
+    """
+    name = args.engine[0]
+    log("="*50)
+    log(f"🧪 MODO SOAK ({args.soak:g}h, {'tiempo real' if args.realtime else 'máxima velocidad'}) - {name}")
+    log("="*50)
+    try:
+        engine = create_pose_engine(name)
+    except Exception as e:
+        log(f"❌ No se pudo inicializar el motor '{name}': {e}")
+        return
+
+    timings = {stage: [] for stage in REPLAY_STAGES}
+    duration = args.soak * 3600
+    samples = []  # (segundos desde el inicio, RSS en bytes) tras el calentamiento
+    passes = 0
+    frames = 0
+    start = time.monotonic()
+    try:
+        while True:
+            for source in args.replay:
+                frames += replay_source(source, args, engine, timings)[1]
+            passes += 1
+            for stage_samples in timings.values():
+                stage_samples.clear()  # No acumular tiempos: el soak mide solo la memoria del pipeline
+            elapsed = time.monotonic() - start
+            rss = memory.checkpoint("soak")
+            if rss is None:
+                log("❌ Sin /proc/self/statm: el modo soak necesita Linux")
+                return
+            if passes == 1:
+                if args.tracemalloc:
+                    memory.start_tracing()
+                samples.append((elapsed, rss))
+            elif elapsed - samples[-1][0] >= MEMORY_SOAK_SAMPLE_SEC or elapsed >= duration:
+                samples.append((elapsed, rss))
+                growth = memory_growth_mb_per_hour(samples)
+                log(f"🧪 Soak {elapsed / 3600:.2f}h de {args.soak:g}h | pasadas {passes} | RSS {rss / 1e6:.1f}MB | "
+                    f"crecimiento {growth:+.2f}MB/h")
+            if elapsed >= duration:
+                break
+    except KeyboardInterrupt:
+        log("👋 Soak interrumpido, reportando lo medido...")
+    finally:
+        engine.close()
+
+    if not samples:
+        return
+    growth = memory_growth_mb_per_hour(samples)
+    print(f"\n🧪 SOAK - MEMORIA ({name})")
+    print(f"Duración: {(time.monotonic() - start) / 3600:.2f}h | Pasadas: {passes} | Frames analizados: {frames}")
+    print(f"RSS tras calentamiento: {samples[0][1] / 1e6:.1f}MB | final: {samples[-1][1] / 1e6:.1f}MB | "
+          f"pico: {max(r for _, r in samples) / 1e6:.1f}MB")
+    print(f"Crecimiento: {f'{growth:+.2f} MB/h' if growth is not None else 'sin datos (soak muy corto)'} "
+          f"({len(samples)} muestras)")
+    print("RSS máximo por etapa (MB): " + ", ".join(
+        f"{stage} {peak / 1e6:.1f}" for stage, peak in sorted(memory.stage_peaks.items())))
+    if tracemalloc.is_tracing():
+        print(f"\n🔬 Top {MEMORY_TOP_N} líneas por crecimiento desde el calentamiento (tracemalloc):")
+        for stat in memory.top_allocators():
+            print(f"  {stat}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="VigilIA - Detección de caídas en edge")
+    parser.add_argument("--replay", nargs="+", metavar="FUENTE",
+                        help="Videos o directorios de frames a reproducir en lugar del stream RTSP")
+    parser.add_argument("--labels", metavar="JSON",
+                        help="Timestamps (s) de caídas etiquetadas para medir latencia de detección")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Reproducir a ritmo real (por defecto: máxima velocidad)")
+    parser.add_argument("--fps", type=float, help="FPS de la fuente (default: del video, o 10 para directorios)")
+    parser.add_argument("--skip", type=int, default=SKIP_FRAMES, help="Paso mínimo entre frames analizados")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="Aplicar la compuerta de movimiento (pose a tasa keep-alive en escenas estáticas)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Aplicar el control adaptativo de resolución/paso (usar con --realtime)")
+    parser.add_argument("--engine", nargs="+", choices=sorted(POSE_ENGINES), default=[POSE_ENGINE],
+                        help="Motor(es) de pose; con varios se comparan CPU, RAM y aciertos (default: POSE_ENGINE)")
+    parser.add_argument("--width", type=int, help="Redimensionar frames a este ancho (ej. FRAME_WIDTH)")
+    parser.add_argument("--height", type=int, help="Redimensionar frames a este alto (ej. FRAME_HEIGHT)")
+    parser.add_argument("--soak", type=float, metavar="HORAS",
+                        help="Repetir las fuentes de --replay durante HORAS y reportar crecimiento de memoria por hora")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Con --soak: trazar allocs tras el calentamiento y mostrar las líneas que más crecieron")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.replay and args.soak:
+        soak_main(args)
+    elif args.replay:
+        replay_main(args)
+    else:
+        main()
\ No newline at end of file